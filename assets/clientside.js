@@ -0,0 +1,169 @@
+// Bar plots of the client-side mode (DASHBOARD_CLIENTSIDE_PLOTS=1)
+//
+// The server sends the data cube of the dataset (sums and counts of every metric per group_name x
+// parameter cell) once per dataset version into the cube-store. Filtering, the roll-up to
+// (group_name, X axis) and the figures run here, like DataCube.rollup and create_bar_plot.
+(function() {
+
+    function key(value) {
+        return String(value);
+    }
+
+    // Legend text of a value, booleans are written like on the server side
+    function display(value) {
+        if (typeof value === 'boolean') {
+            return value ? 'True' : 'False';
+        }
+        return String(value);
+    }
+
+    // Ascending order of numbers, booleans and strings, like the sorting of pandas
+    function compare(a, b) {
+        if (typeof a === 'number' && typeof b === 'number') {
+            return a - b;
+        }
+        if (typeof a === 'boolean' && typeof b === 'boolean') {
+            return a === b ? 0 : (a ? 1 : -1);
+        }
+        return key(a) < key(b) ? -1 : (key(a) > key(b) ? 1 : 0);
+    }
+
+    // Cells matching every selected filter, except the one of the X axis
+    function selectedCells(cube, xAxis, filterValues) {
+        var cells = cube.cells;
+        var size = cells.group_name.length;
+        var conditions = [];
+
+        cube.filters.forEach(function(column, position) {
+            var values = filterValues[position];
+            if (column !== xAxis && values && values.length !== 0) {
+                conditions.push({column: cells[column], values: new Set(values.map(key))});
+            }
+        });
+
+        var selected = [];
+        for (var cell = 0; cell < size; cell++) {
+            var matches = true;
+            for (var condition = 0; condition < conditions.length && matches; condition++) {
+                var value = conditions[condition].column[cell];
+                matches = value !== null && conditions[condition].values.has(key(value));
+            }
+            if (matches) {
+                selected.push(cell);
+            }
+        }
+        return selected;
+    }
+
+    // Average of the metric per (group_name, X axis value) from the summed sums and counts
+    function rollup(cube, cells, xAxis, metric) {
+        var totals = new Map();
+        var groups = cube.cells.group_name;
+        var xValues = cube.cells[xAxis];
+        var sums = cube.sums[metric];
+        var counts = cube.counts[metric];
+
+        cells.forEach(function(cell) {
+            if (groups[cell] === null || xValues[cell] === null || counts[cell] === 0) {
+                return;
+            }
+            var total = key(groups[cell]) + '\u0000' + key(xValues[cell]);
+            var entry = totals.get(total);
+            if (entry === undefined) {
+                entry = {group: groups[cell], x: xValues[cell], sum: 0, count: 0};
+                totals.set(total, entry);
+            }
+            entry.sum += sums[cell];
+            entry.count += counts[cell];
+        });
+
+        return Array.from(totals.values()).map(function(entry) {
+            return {group: entry.group, x: entry.x, mean: entry.sum / entry.count};
+        });
+    }
+
+    function label(cube, column) {
+        return cube.labels[column] || column;
+    }
+
+    function messageFigure(text) {
+        return {
+            data: [],
+            layout: {
+                height: 500, width: 1850,
+                annotations: [{x: 3.5, y: 2.5, text: text, showarrow: false, yshift: 10,
+                               font: {family: 'sans serif', size: 25, color: 'crimson'}}]
+            }
+        };
+    }
+
+    // Grouped bars: application groups on the X axis, one trace per X axis value
+    function barFigure(cube, rows, xAxis, yAxis) {
+        if (rows.length === 0) {
+            return messageFigure('No Data to Display');
+        }
+
+        var xValues = Array.from(new Map(rows.map(function(row) { return [key(row.x), row.x]; })).values()).sort(compare);
+        var traces = xValues.map(function(xValue, position) {
+            var bars = rows.filter(function(row) { return key(row.x) === key(xValue); })
+                           .sort(function(a, b) { return compare(a.group, b.group); });
+            return {
+                type: 'bar',
+                name: display(xValue),
+                legendgroup: display(xValue),
+                offsetgroup: display(xValue),
+                x: bars.map(function(row) { return row.group; }),
+                y: bars.map(function(row) { return row.mean; }),
+                hovertext: bars.map(function() { return display(xValue); }),
+                marker: {color: cube.colors[position % cube.colors.length]},
+                hovertemplate: '<b>%{hovertext}</b><br><br>' + label(cube, 'group_name') + '=%{x}<br>' + label(cube, yAxis) + '=%{y}<extra></extra>'
+            };
+        });
+
+        return {
+            data: traces,
+            layout: {
+                template: cube.template,
+                barmode: 'group',
+                height: 500, width: 1850,
+                font: {size: 14},
+                legend: {font: {size: 14}, title: {text: label(cube, xAxis)}, tracegroupgap: 0},
+                xaxis: {title: {text: label(cube, 'group_name'), font: {size: 16}}, type: 'category', categoryorder: 'category ascending',
+                        linewidth: 2, linecolor: 'black'},
+                yaxis: {title: {text: label(cube, yAxis), font: {size: 16}}, linewidth: 2, linecolor: 'black', showgrid: true}
+            }
+        };
+    }
+
+    function figures(cube, xAxis, yAxes, filterValues) {
+        var cells = selectedCells(cube, xAxis, filterValues);
+        return yAxes.map(function(yAxis) {
+            return barFigure(cube, rollup(cube, cells, xAxis, yAxis), xAxis, yAxis);
+        });
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        dashboard: {
+            // CPU, Disk and Memory tabs: (x axis, filters..., cube)
+            barPlots: function() {
+                var args = Array.prototype.slice.call(arguments);
+                var xAxis = args[0];
+                var cube = args[args.length - 1];
+                if (!cube) {
+                    return window.dash_clientside.no_update;
+                }
+                return figures(cube, xAxis, cube.y_axes, args.slice(1, args.length - 1));
+            },
+
+            // Network tab: (x axis, y axis, filters..., cube)
+            networkPlot: function() {
+                var args = Array.prototype.slice.call(arguments);
+                var cube = args[args.length - 1];
+                if (!cube) {
+                    return window.dash_clientside.no_update;
+                }
+                return figures(cube, args[0], [args[1]], args.slice(2, args.length - 1))[0];
+            }
+        }
+    });
+})();
@@ -0,0 +1,163 @@
+# Concurrent fan-out of the aggregate query over asyncpg
+#
+# The sums and counts are split into one query per application group (and optionally per time
+# slice of the metrics), which run concurrently on their own connections, at most
+# async_concurrency at once. Sums, counts and maxima of the partial results are merged with
+# snapshot.merge_aggregates, so the averages equal those of the single query. The asyncpg pool
+# lives on one event loop in a background thread, created on first use and kept by the process.
+import asyncio
+import atexit
+import logging
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+import settings
+from columns import GROUP_NAMES
+from schema import KEY_DTYPES, cast_frame
+from snapshot import AGGREGATE_COLUMNS, aggregate_query, merge_aggregates, naive_marks
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = re.compile(r'%\((\w+)\)s')
+
+# Event loop thread and pool of the process, recreated in a forked child
+_loop = None
+_pool = None
+_pid = None
+_lock = threading.Lock()
+
+
+# psycopg2 style %(name)s parameters to asyncpg $n placeholders and a list of arguments
+def numbered_query(query, params):
+    names = []
+
+    def placeholder(match):
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return '${}'.format(names.index(match.group(1)) + 1)
+
+    return PLACEHOLDER.sub(placeholder, query), [params[name] for name in names]
+
+
+def _frame(records):
+    if len(records) == 0:
+        return None
+
+    # Naive UTC marks like the psycopg2 path, both may update the same snapshot, and the key columns
+    # typed like its chunks
+    frame = pd.DataFrame.from_records([tuple(record) for record in records], columns=list(records[0].keys()))
+    return naive_marks(cast_frame(frame, KEY_DTYPES))
+
+
+# The naive UTC mark as the timestamp column expects it, asyncpg does not convert between the two
+async def _mark_argument(pool, since):
+    if since is None:
+        return None
+
+    with_time_zone = await pool.fetchval("SELECT data_type = 'timestamp with time zone' FROM information_schema.columns WHERE table_name = 'metrics' AND column_name = 'timestamp'")
+    since = pd.Timestamp(since)
+    if since.tzinfo is not None:
+        since = since.tz_convert(None)
+
+    return (since.tz_localize('UTC') if with_time_zone else since).to_pydatetime()
+
+
+# Boundaries of `slices` equal time ranges covering the metrics newer than since
+async def _time_slices(pool, since, slices):
+    if slices <= 1:
+        return [None]
+
+    query, args = numbered_query('SELECT MIN(metrics.timestamp) AS first, MAX(metrics.timestamp) AS last FROM metrics' +
+                                 (' WHERE metrics.timestamp > %(since)s' if since is not None else ''), {'since': since})
+    row = await pool.fetchrow(query, *args)
+    if row['first'] is None:
+        return [None]
+
+    first, last = row['first'], row['last']
+    step = (last - first) / slices
+    bounds = [first + step * position for position in range(slices)] + [last]
+
+    # The last range includes the newest row
+    return [(bounds[position], bounds[position + 1], position == slices - 1) for position in range(slices)]
+
+
+# One partial query: an application group and optionally a time range
+def partial_query(group_name, since, time_slice):
+    conditions = ['metrics.group_name = %(group_name)s']
+    params = {'group_name': group_name, 'since': since}
+
+    if time_slice is not None:
+        start, end, last = time_slice
+        conditions.append('metrics.timestamp >= %(slice_start)s')
+        conditions.append('metrics.timestamp {} %(slice_end)s'.format('<=' if last else '<'))
+        params.update(slice_start=start, slice_end=end)
+
+    return numbered_query(aggregate_query(incremental=since is not None, conditions=conditions), params)
+
+
+async def _create_pool():
+    import asyncpg
+
+    return await asyncpg.create_pool(host=settings.host_name, port=settings.port, database=settings.database_name, user=settings.username, password=settings.pw,
+                                     min_size=1, max_size=settings.async_concurrency)
+
+
+def _get_pool():
+    global _loop, _pool, _pid
+
+    with _lock:
+        if _pool is None or _pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='async-db', daemon=True).start()
+            _pool = asyncio.run_coroutine_threadsafe(_create_pool(), _loop).result()
+            _pid = os.getpid()
+
+    return _loop, _pool
+
+
+def close_pool():
+    global _loop, _pool
+
+    with _lock:
+        if _pool is not None and _pid == os.getpid():
+            asyncio.run_coroutine_threadsafe(_pool.close(), _loop).result()
+            _loop.call_soon_threadsafe(_loop.stop)
+        _loop, _pool = None, None
+
+
+atexit.register(close_pool)
+
+
+async def _fanout(pool, since, concurrency, slices):
+    limit = asyncio.Semaphore(concurrency)
+    since = await _mark_argument(pool, since)
+
+    async def run(query, args):
+        async with limit:
+            return _frame(await pool.fetch(query, *args))
+
+    pieces = [partial_query(group_name, since, time_slice) for group_name in GROUP_NAMES for time_slice in await _time_slices(pool, since, slices)]
+    frames = await asyncio.gather(*[run(query, args) for query, args in pieces])
+
+    return frames, len(pieces)
+
+
+# Aggregates of all rows, or of the rows newer than since, same result as snapshot.fetch_aggregates
+def fanout_aggregates(since=None, concurrency=None, slices=None):
+    started = time.perf_counter()
+
+    loop, pool = _get_pool()
+    frames, pieces = asyncio.run_coroutine_threadsafe(_fanout(pool, since, concurrency or settings.async_concurrency, slices or settings.async_time_slices), loop).result()
+    aggregates = merge_aggregates(frames)
+
+    logger.info('Fan-out: %d partial queries merged in %.2f s', pieces, time.perf_counter() - started)
+
+    if aggregates is None:
+        # Same columns as an empty result of the single query
+        return pd.DataFrame(columns=AGGREGATE_COLUMNS)
+
+    return aggregates
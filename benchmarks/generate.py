@@ -0,0 +1,118 @@
+# Synthetic metrics and parameters tables in an SQLite file, with the column schema of the database
+#
+# Every benchmark configuration runs for a number of consecutive timestamps: one parameters row and
+# one metrics row per application group at each timestamp, so the metrics table has `rows` rows.
+# The metric values depend on the configuration, so the plots and the averages are not flat.
+#
+#   python benchmarks/generate.py --rows 1000000 --output benchmarks/data/1m.sqlite
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columns import GROUP_NAMES, METRIC_COLUMNS
+
+PARAMETERS_SCHEMA = '''CREATE TABLE parameters (
+    timestamp TEXT PRIMARY KEY,
+    application_instances_value INTEGER,
+    application_case_value TEXT,
+    application_metric_count_value INTEGER,
+    application_labels_value REAL,
+    cortex_number_of_nginx_value INTEGER,
+    cortex_number_of_distributor_value INTEGER,
+    cortex_number_of_ingester_value INTEGER,
+    cortex_blocks_storage_tsdb_block_ranges_period_value INTEGER,
+    cortex_blocks_storage_tsdb_retention_period_value INTEGER,
+    cortex_blocks_storage_tsdb_wal_compression_value BOOLEAN,
+    cortex_compactor_blocks_ranges_value INTEGER,
+    prometheus_remote_write_max_samples_per_send_value INTEGER
+)'''
+
+METRICS_SCHEMA = 'CREATE TABLE metrics (timestamp TEXT, group_name TEXT, {})'.format(', '.join(column + ' REAL' for column in METRIC_COLUMNS))
+
+# Values of the benchmark parameters the configurations are drawn from
+PARAMETER_VALUES = {
+    'application_instances_value': [1, 2, 4],
+    'application_case_value': ['quasi_real', 'random'],
+    'application_metric_count_value': [10000, 30000, 100000, 300000, 1000000],
+    'application_labels_value': [10.0, 20.0, 40.0],
+    'cortex_number_of_nginx_value': [1, 2],
+    'cortex_number_of_distributor_value': [1, 2, 3],
+    'cortex_number_of_ingester_value': [1, 2, 3, 4],
+    'cortex_blocks_storage_tsdb_block_ranges_period_value': [3600, 7200],
+    'cortex_blocks_storage_tsdb_retention_period_value': [21600, 43200, 86400],
+    'cortex_blocks_storage_tsdb_wal_compression_value': [0, 1],
+    'cortex_compactor_blocks_ranges_value': [7200, 14400],
+    'prometheus_remote_write_max_samples_per_send_value': [None, 100, 500]
+}
+
+# Metric scale of every application group
+GROUP_SCALES = np.linspace(0.5, 2.0, len(GROUP_NAMES))
+
+
+def generate(path, rows, samples_per_run=60, chunk_size=200000, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = max(rows // len(GROUP_NAMES), 1)
+    runs = max(timestamps // samples_per_run, 1)
+
+    if os.path.exists(path):
+        os.remove(path)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    connect = sqlite3.connect(path)
+    connect.execute('PRAGMA journal_mode = OFF')
+    connect.execute('PRAGMA synchronous = OFF')
+    connect.execute(PARAMETERS_SCHEMA)
+    connect.execute(METRICS_SCHEMA)
+
+    # Configuration of every run, as positions into PARAMETER_VALUES
+    choices = {column: rng.integers(0, len(values), runs) for column, values in PARAMETER_VALUES.items()}
+    load = (np.array(PARAMETER_VALUES['application_metric_count_value'])[choices['application_metric_count_value']] / 10000.0 *
+            np.array(PARAMETER_VALUES['application_labels_value'])[choices['application_labels_value']] / 20.0)
+
+    start = np.datetime64('2021-01-01T00:00:00')
+    metric_insert = 'INSERT INTO metrics VALUES ({})'.format(', '.join('?' * (2 + len(METRIC_COLUMNS))))
+    parameter_insert = 'INSERT INTO parameters VALUES ({})'.format(', '.join('?' * (1 + len(PARAMETER_VALUES))))
+
+    step = max(chunk_size // len(GROUP_NAMES), 1)
+    for first in range(0, timestamps, step):
+        positions = np.arange(first, min(first + step, timestamps))
+        run = np.minimum(positions // samples_per_run, runs - 1)
+        stamps = np.datetime_as_string(start + positions * np.timedelta64(10, 's')) + '+00:00'
+
+        parameter_rows = zip(stamps.tolist(), *[np.array(values, dtype=object)[choices[column][run]].tolist() for column, values in PARAMETER_VALUES.items()])
+        connect.executemany(parameter_insert, parameter_rows)
+
+        for position, group_name in enumerate(GROUP_NAMES):
+            base = load[run] * GROUP_SCALES[position]
+            values = [base * (index + 1) * rng.lognormal(0.0, 0.1, len(run)) for index in range(len(METRIC_COLUMNS))]
+            connect.executemany(metric_insert, zip(stamps.tolist(), [group_name] * len(run), *[column.tolist() for column in values]))
+
+        connect.commit()
+
+    connect.execute('CREATE INDEX metrics_timestamp ON metrics (timestamp)')
+    connect.commit()
+    connect.close()
+
+    return timestamps * len(GROUP_NAMES), timestamps, runs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic metrics and parameters tables in SQLite')
+    parser.add_argument('--rows', type=int, default=100000, help='rows of the metrics table')
+    parser.add_argument('--samples-per-run', type=int, default=60, help='timestamps of one configuration run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'data', 'metrics.sqlite'))
+    arguments = parser.parse_args()
+
+    started = time.perf_counter()
+    metric_rows, parameter_rows, runs = generate(arguments.output, arguments.rows, arguments.samples_per_run, seed=arguments.seed)
+    print('{}: {} metrics rows, {} parameters rows, {} configuration runs in {:.1f} s'.format(
+        arguments.output, metric_rows, parameter_rows, runs, time.perf_counter() - started))
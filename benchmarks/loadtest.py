@@ -0,0 +1,463 @@
+# Load test of the Dash callback endpoints with concurrent simulated users
+#
+# The dashboard is started by benchmarks/serve.py (threads or processes model) with a synthetic
+# dataset. Every simulated user loads the page like a browser: the layout (its own session id),
+# the callback dependencies and the initial callbacks. It then changes filter dropdowns, radio
+# items and regression inputs with a think time in between, sometimes a few of them in a quick
+# burst, and sends the same _dash-update-component POSTs as the browser, including the callbacks
+# chained to the changed outputs and the polling of the dataset interval. Every step of the user
+# sweep reports the throughput, the latency percentiles of every callback, the error rate and
+# the memory of the server processes.
+#
+#   python benchmarks/generate.py --rows 1000000 --output benchmarks/data/1m.sqlite
+#   python benchmarks/loadtest.py --database benchmarks/data/1m.sqlite --users 1,5,10,25 --model threads
+#   python benchmarks/loadtest.py --database benchmarks/data/1m.sqlite --users 1,5,10,25 --model processes --workers 4
+import argparse
+import gzip
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Share of the user actions by kind of component
+ACTIONS = {'dropdown': 0.6, 'radio': 0.2, 'input': 0.2}
+COMPONENT_ACTIONS = {'Dropdown': 'dropdown', 'RadioItems': 'radio', 'Checklist': 'radio', 'Input': 'input'}
+
+# Chained callbacks followed after a response, e.g. the plots after a new dataset version
+MAX_CHAIN = 3
+
+
+# Output ids and properties of a dependency, "..a.figure...b.figure.." for several outputs
+def parse_outputs(output):
+    if output.startswith('..'):
+        outputs = [item.rsplit('.', 1) for item in output[2:-2].split('...')]
+        return [{'id': id, 'property': property} for id, property in outputs], True
+
+    id, property = output.rsplit('.', 1)
+    return [{'id': id, 'property': property}], False
+
+
+class Callback:
+
+    def __init__(self, dependency, names):
+        self.output = dependency['output']
+        self.outputs, self.multi = parse_outputs(self.output)
+        self.inputs = dependency['inputs']
+        self.state = dependency['state']
+        self.prevent_initial_call = dependency.get('prevent_initial_call', False)
+        self.name = names.get(self.output, self.outputs[0]['id'])
+
+    def payload(self, props, changed):
+        def values(dependencies):
+            return [{'id': item['id'], 'property': item['property'], 'value': props.get(item['id'], {}).get(item['property'])} for item in dependencies]
+
+        return {
+            'output': self.output,
+            'outputs': self.outputs if self.multi else self.outputs[0],
+            'inputs': values(self.inputs),
+            'state': values(self.state),
+            'changedPropIds': ['{}.{}'.format(*prop) for prop in changed]
+        }
+
+
+# Props of every component with an id in a layout
+def walk_layout(node, props, types):
+    if isinstance(node, list):
+        for child in node:
+            walk_layout(child, props, types)
+        return
+    if not isinstance(node, dict) or 'props' not in node:
+        return
+
+    if 'id' in node['props'] and isinstance(node['props']['id'], str):
+        props[node['props']['id']] = dict(node['props'])
+        types[node['props']['id']] = node.get('type')
+
+    walk_layout(node['props'].get('children'), props, types)
+
+
+def option_values(options):
+    return [option['value'] if isinstance(option, dict) else option for option in options or []]
+
+
+# Latencies and outcomes of the requests of one sweep step, shared by the users
+class Recorder:
+
+    def __init__(self):
+        self.latencies = {}
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, latency, outcome):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(latency)
+            counts = self.outcomes.setdefault(name, {'ok': 0, 'prevented': 0, 'error': 0})
+            counts[outcome] += 1
+
+
+class User(threading.Thread):
+
+    def __init__(self, host, port, names, skipped, recorder, stop, think_time, burst, timeout, seed):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.names = names
+        self.skipped = skipped
+        self.recorder = recorder
+        self.stop = stop
+        self.think_time = think_time
+        self.burst = burst
+        self.timeout = timeout
+        self.random = random.Random(seed)
+
+        self.connection = None
+        self.props = {}
+        self.types = {}
+        self.callbacks = []
+        self.polled = time.monotonic()
+
+    def request(self, name, method, path, body=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+            if response.getheader('Content-Encoding') == 'gzip':
+                content = gzip.decompress(content)
+        except (OSError, http.client.HTTPException):
+            # A new connection for the next request
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+            self.recorder.record(name, time.perf_counter() - started, 'error')
+            return None
+
+        latency = time.perf_counter() - started
+        if response.status == 204:
+            self.recorder.record(name, latency, 'prevented')
+            return None
+        if response.status != 200:
+            self.recorder.record(name, latency, 'error')
+            return None
+
+        self.recorder.record(name, latency, 'ok')
+        return json.loads(content) if content else None
+
+    def load_page(self):
+        layout = self.request('_dash-layout', 'GET', '/_dash-layout')
+        dependencies = self.request('_dash-dependencies', 'GET', '/_dash-dependencies')
+        if layout is None or dependencies is None:
+            return False
+
+        self.props, self.types = {}, {}
+        walk_layout(layout, self.props, self.types)
+        # Clientside callbacks run in the browser, the skipped ones cannot run against the test server
+        self.callbacks = [Callback(dependency, self.names) for dependency in dependencies if not dependency.get('clientside_function')]
+        self.callbacks = [callback for callback in self.callbacks if callback.name not in self.skipped]
+
+        # Initial calls: first the callbacks without inputs from other callbacks, then the chained ones
+        produced = {(output['id'], output['property']) for callback in self.callbacks for output in callback.outputs}
+        initial = [callback for callback in self.callbacks if not callback.prevent_initial_call]
+        first = [callback for callback in initial if not any((item['id'], item['property']) in produced for item in callback.inputs)]
+        called = set(self.fire(first, []))
+        self.fire([callback for callback in initial if callback not in called], [])
+
+        return True
+
+    # Sends the callbacks and then the ones triggered by their outputs, returns the callbacks called
+    def fire(self, callbacks, changed, depth=0):
+        called = list(callbacks)
+        updated = []
+
+        for callback in callbacks:
+            if self.stop.is_set():
+                break
+            result = self.request(callback.name, 'POST', '/_dash-update-component', callback.payload(self.props, changed))
+            if result is None:
+                continue
+            for id, properties in result.get('response', {}).items():
+                self.props.setdefault(id, {}).update(properties)
+                updated += [(id, property) for property in properties]
+
+        if updated and depth < MAX_CHAIN:
+            called += self.fire(self.triggered(updated), updated, depth + 1)
+
+        return called
+
+    def triggered(self, changed):
+        changed = set(changed)
+        return [callback for callback in self.callbacks if any((item['id'], item['property']) in changed for item in callback.inputs)]
+
+    # Components with a value the user can change, by kind of action
+    def controls(self):
+        inputs = {item['id'] for callback in self.callbacks for item in callback.inputs if item['property'] == 'value'}
+        controls = {}
+        for id in inputs:
+            action = COMPONENT_ACTIONS.get(self.types.get(id))
+            if action == 'input' and self.props[id].get('type') != 'number':
+                continue
+            if action in ('dropdown', 'radio') and not option_values(self.props[id].get('options')):
+                continue
+            if action is not None:
+                controls.setdefault(action, []).append(id)
+
+        return controls
+
+    # New value of a component: one option toggled or picked, or a number within the bounds of the input
+    def change(self, id):
+        props = self.props[id]
+        value = props.get('value')
+
+        if self.types[id] == 'Input':
+            low = props.get('min', 0)
+            high = props.get('max', max(2 * (value or 1), low + 1))
+            return self.random.randint(int(low), int(high))
+
+        options = option_values(props.get('options'))
+        option = self.random.choice(options)
+        if isinstance(value, list) or props.get('multi'):
+            value = list(value or [])
+            return [item for item in value if item != option] if option in value else value + [option]
+
+        return option
+
+    def act(self, controls):
+        actions = [action for action in ACTIONS if action in controls]
+        action = self.random.choices(actions, [ACTIONS[action] for action in actions])[0]
+        id = self.random.choice(controls[action])
+
+        self.props[id]['value'] = self.change(id)
+        changed = [(id, 'value')]
+        self.fire(self.triggered(changed), changed)
+
+    # The dataset-refresh-interval ticks of the browser
+    def poll(self):
+        interval = self.props.get('dataset-refresh-interval', {}).get('interval')
+        if interval is None or time.monotonic() - self.polled < interval / 1000:
+            return
+
+        self.polled = time.monotonic()
+        props = self.props['dataset-refresh-interval']
+        props['n_intervals'] = (props.get('n_intervals') or 0) + 1
+        changed = [('dataset-refresh-interval', 'n_intervals')]
+        self.fire(self.triggered(changed), changed)
+
+    def run(self):
+        if not self.load_page():
+            return
+        controls = self.controls()
+        if not controls:
+            return
+
+        while not self.stop.is_set():
+            # A few changes in a row, e.g. going through the filters, or a single one
+            for _ in range(self.random.randint(2, 4) if self.random.random() < self.burst else 1):
+                self.act(controls)
+                if self.stop.wait(self.random.uniform(0.1, 0.3)):
+                    break
+
+            self.poll()
+            self.stop.wait(self.random.expovariate(1 / self.think_time) if self.think_time else 0)
+
+        if self.connection is not None:
+            self.connection.close()
+
+
+# Resident and proportional set size of a process and its children, in bytes
+def process_memory(pid):
+    rss = pss = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open('/proc/{}/status'.format(current)) as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1]) * 1024
+            with open('/proc/{}/smaps_rollup'.format(current)) as rollup:
+                for line in rollup:
+                    if line.startswith('Pss:'):
+                        pss += int(line.split()[1]) * 1024
+            with open('/proc/{0}/task/{0}/children'.format(current)) as children:
+                pids += [int(child) for child in children.read().split()]
+        except (OSError, ValueError):
+            continue
+
+    return rss, pss
+
+
+# Peak and last memory of the server while a step runs
+class MemorySampler(threading.Thread):
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.stop = threading.Event()
+        self.peak_rss = self.peak_pss = self.rss = self.pss = 0
+
+    def run(self):
+        while True:
+            self.rss, self.pss = process_memory(self.pid)
+            self.peak_rss = max(self.peak_rss, self.rss)
+            self.peak_pss = max(self.peak_pss, self.pss)
+            if self.stop.wait(self.interval):
+                break
+
+
+def start_server(database, model, workers):
+    command = [sys.executable, os.path.join(ROOT, 'benchmarks', 'serve.py'), '--database', database, '--model', model, '--workers', str(workers)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+
+    for line in server.stdout:
+        if line.startswith('{'):
+            info = json.loads(line)
+            break
+    else:
+        raise RuntimeError('The server exited with {}'.format(server.wait()))
+
+    # Anything printed later must not fill the pipe
+    threading.Thread(target=server.stdout.read, daemon=True).start()
+
+    return server, info
+
+
+def summarize(recorder, duration):
+    callbacks = {}
+    total = errors = 0
+
+    for name, latencies in sorted(recorder.latencies.items()):
+        latencies = np.array(latencies)
+        outcomes = recorder.outcomes[name]
+        callbacks[name] = {
+            'requests': len(latencies),
+            'prevented': outcomes['prevented'],
+            'errors': outcomes['error'],
+            'mean_ms': latencies.mean() * 1000,
+            'p50_ms': np.percentile(latencies, 50) * 1000,
+            'p95_ms': np.percentile(latencies, 95) * 1000,
+            'p99_ms': np.percentile(latencies, 99) * 1000,
+            'max_ms': latencies.max() * 1000,
+            'throughput_per_s': len(latencies) / duration
+        }
+        total += len(latencies)
+        errors += outcomes['error']
+
+    return {
+        'requests': total,
+        'errors': errors,
+        'error_rate': errors / total if total else 0.0,
+        'throughput_per_s': total / duration,
+        'callbacks': callbacks
+    }
+
+
+def run_step(info, users, duration, ramp_up, think_time, burst, timeout, seed):
+    recorder = Recorder()
+    stop = threading.Event()
+    sampler = MemorySampler(info['pid'])
+    sampler.start()
+
+    threads = []
+    started = time.perf_counter()
+    for number in range(users):
+        user = User('127.0.0.1', info['port'], info['callbacks'], info['skipped'], recorder, stop, think_time, burst, timeout, seed * 100003 + number)
+        user.start()
+        threads.append(user)
+        stop.wait(ramp_up / users)
+
+    stop.wait(max(duration - (time.perf_counter() - started), 0))
+    stop.set()
+    for user in threads:
+        user.join(timeout)
+    elapsed = time.perf_counter() - started
+
+    sampler.stop.set()
+    sampler.join()
+
+    result = summarize(recorder, elapsed)
+    result.update({
+        'users': users,
+        'duration_s': elapsed,
+        'server_rss_bytes': sampler.rss,
+        'server_peak_rss_bytes': sampler.peak_rss,
+        'server_pss_bytes': sampler.pss,
+        'server_peak_pss_bytes': sampler.peak_pss
+    })
+
+    return result
+
+
+def run(database, users, model, workers, duration, ramp_up, think_time, burst, timeout, seed):
+    server, info = start_server(database, model, workers)
+    try:
+        idle_rss, idle_pss = process_memory(info['pid'])
+        steps = [run_step(info, count, duration, ramp_up, think_time, burst, timeout, seed) for count in users]
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        'database': os.path.abspath(database),
+        'dataset_rows': info['dataset_rows'],
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'server': {'model': model, 'workers': workers if model == 'processes' else 1, 'idle_rss_bytes': idle_rss, 'idle_pss_bytes': idle_pss},
+        'skipped_callbacks': info['skipped'],
+        'load': {'duration_s': duration, 'ramp_up_s': ramp_up, 'think_time_s': think_time, 'burst': burst},
+        'steps': steps
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the dashboard callbacks with concurrent users')
+    parser.add_argument('--database', default=os.path.join('benchmarks', 'data', 'metrics.sqlite'), help='SQLite file of benchmarks/generate.py')
+    parser.add_argument('--users', default='1,5,10,25', help='comma separated user counts, one step each')
+    parser.add_argument('--model', choices=['threads', 'processes'], default='threads', help='server model of benchmarks/serve.py')
+    parser.add_argument('--workers', type=int, default=4, help='worker processes of the processes model')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds of every step')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='seconds over which the users of a step start')
+    parser.add_argument('--think-time', type=float, default=3.0, help='mean seconds between two interactions of a user')
+    parser.add_argument('--burst', type=float, default=0.3, help='share of the interactions changing several components in a row')
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds before a request counts as an error')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='loadtest_results.json')
+    arguments = parser.parse_args()
+
+    current = run(arguments.database, [int(count) for count in arguments.users.split(',')], arguments.model, arguments.workers, arguments.duration,
+                  arguments.ramp_up, arguments.think_time, arguments.burst, arguments.timeout, arguments.seed)
+
+    with open(arguments.output, 'w') as output:
+        json.dump(current, output, indent=2)
+
+    print('{} server, idle RSS {:.1f} MB'.format(arguments.model, current['server']['idle_rss_bytes'] / 2 ** 20))
+    if current['skipped_callbacks']:
+        print('Skipped (need PostgreSQL):', ', '.join(current['skipped_callbacks']))
+    for step in current['steps']:
+        print('{:>4} users  {:>8.1f} requests/s  errors {:>6.2%}  RSS {:>8.1f} MB (peak {:.1f} MB, PSS {:.1f} MB)'.format(
+            step['users'], step['throughput_per_s'], step['error_rate'], step['server_rss_bytes'] / 2 ** 20, step['server_peak_rss_bytes'] / 2 ** 20,
+            step['server_pss_bytes'] / 2 ** 20))
+        for name, result in step['callbacks'].items():
+            print('      {:<32} {:>6} requests  p50 {:>9.3f} ms  p95 {:>9.3f} ms  p99 {:>9.3f} ms  errors {}'.format(
+                name, result['requests'], result['p50_ms'], result['p95_ms'], result['p99_ms'], result['errors']))
+    print('Results written to', arguments.output)
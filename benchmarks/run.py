@@ -0,0 +1,239 @@
+# Benchmarks of the hot paths of the dashboard against a synthetic SQLite database
+#
+# Every benchmark is timed over a number of iterations (latency percentiles and throughput), then
+# run once more under tracemalloc for its peak memory. The results are written to a JSON file,
+# --compare prints the change against an earlier result file and fails on regressions.
+#
+#   python benchmarks/generate.py --rows 1000000 --output benchmarks/data/1m.sqlite
+#   python benchmarks/run.py --database benchmarks/data/1m.sqlite --output results.json
+#   python benchmarks/run.py --database benchmarks/data/1m.sqlite --compare results.json
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The dashboard must not connect to PostgreSQL on import, the dataset is published below
+os.environ['DASHBOARD_AUTOSTART'] = '0'
+os.environ.setdefault('DASHBOARD_MODEL_WATCH_INTERVAL', '0')
+
+import pandas as pd
+
+import index
+import serialization
+from db import sql_queries
+from snapshot import fetch_aggregates
+from prediction import MODEL_TARGETS
+
+# Filters of the benchmarked filter state, as keyword arguments of filtering()
+X_AXIS = 'cortex_number_of_ingester_value'
+FILTER_COLUMNS = {
+    'application_labels': 'application_labels_value',
+    'metric_count_series': 'application_metric_count_value',
+    'application_case_series': 'application_case_value',
+    'nginx': 'cortex_number_of_nginx_value',
+    'distributor': 'cortex_number_of_distributor_value',
+    'ingester': 'cortex_number_of_ingester_value',
+    'tsdb_compactor_blocks_ranges': 'cortex_compactor_blocks_ranges_value',
+    'tsdb_retention_period': 'cortex_blocks_storage_tsdb_retention_period_value',
+    'tsdb_wal_compression': 'cortex_blocks_storage_tsdb_wal_compression_value',
+    'tsdb_block_ranges_period': 'cortex_blocks_storage_tsdb_block_ranges_period_value'
+}
+
+REGRESSION_INPUTS = dict(prometheus_wal_compression=0, application_metric_count=300000, application_labels=20, number_of_nginx=1,
+                         number_of_distributor=1, number_of_ingester=2, tsdb_wal_compression=0, tsdb_retention_period=21600,
+                         tsdb_block_ranges_period=7200)
+
+
+# Linear model with the attributes the prediction engine reads, stands in for the pickled ones
+class SyntheticModel:
+
+    def __init__(self, coef, intercept):
+        self.coef_ = coef
+        self.intercept_ = intercept
+
+    def predict(self, X):
+        return np.asarray(X) @ self.coef_ + self.intercept_
+
+
+def install_models(seed=0):
+    rng = np.random.default_rng(seed)
+    for metric, component in MODEL_TARGETS:
+        index.model_registry.publish(metric, component, SyntheticModel(rng.random(len(index.FEATURES)), rng.random() * 100), 'synthetic')
+
+
+# Sums and counts per configuration, the query the dashboard loads its dataset with
+def query_aggregates(con):
+    return fetch_aggregates(lambda query, params=None, dtypes=None: sql_queries(query, params=params, con=con, dtypes=dtypes))
+
+
+# Publishing the queried frame as the dataset of the dashboard
+def install_dataset(data):
+    index.refresher.loader = lambda: data
+    index.refresher.refresh()
+
+    return index.refresher.current
+
+
+# Filter state: the two most common values of every filter, no filter on the compactor
+def filter_state(data):
+    state = {}
+    for argument, column in FILTER_COLUMNS.items():
+        common = data[column].value_counts().index[:2].tolist() if argument != 'tsdb_compactor_blocks_ranges' else []
+        state[argument] = [value.item() if hasattr(value, 'item') else value for value in common]
+
+    return state
+
+
+def clear_caches():
+    index.figure_cache.clear()
+    index.plot_data_cache.clear()
+
+
+def measure(function, iterations, warmup=1, setup=None, items=1):
+    for _ in range(warmup):
+        if setup:
+            setup()
+        function()
+
+    latencies = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - started)
+
+    # Peak memory of one more call, tracemalloc slows the timed calls down
+    if setup:
+        setup()
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies = np.array(latencies)
+    return {
+        'iterations': iterations,
+        'mean_ms': latencies.mean() * 1000,
+        'p50_ms': np.percentile(latencies, 50) * 1000,
+        'p95_ms': np.percentile(latencies, 95) * 1000,
+        'p99_ms': np.percentile(latencies, 99) * 1000,
+        'max_ms': latencies.max() * 1000,
+        'throughput_per_s': items * len(latencies) / latencies.sum(),
+        'peak_memory_bytes': peak
+    }
+
+
+def run(database, iterations, query_iterations):
+    con = sqlite3.connect(database)
+    install_models()
+
+    results = {}
+
+    results['sql_queries'] = measure(lambda: query_aggregates(con), query_iterations, warmup=0)
+    data = query_aggregates(con)
+    results['sql_queries']['rows'] = len(data)
+    results['sql_queries']['rows_per_s'] = len(data) * results['sql_queries']['throughput_per_s']
+    metric_rows = con.execute('SELECT COUNT(*) FROM metrics').fetchone()[0]
+
+    dataset = install_dataset(data)
+    state = filter_state(dataset.data)
+
+    results['filtering_pandas'] = measure(lambda: index.filtering(dataset.data, X_AXIS, **state), iterations)
+    results['filtering_bitmap'] = measure(lambda: index.filtering(dataset.data, X_AXIS, index=dataset.index, **state), iterations)
+
+    filtered = index.filtering(dataset.data, X_AXIS, index=dataset.index, **state)
+    results['create_bar_plot'] = measure(lambda: index.create_bar_plot(filtered, X_AXIS, 'nd_cg_cpu_visibletotal_value'), iterations)
+
+    plot_arguments = dict(state, x_axis=X_AXIS, dataset_version=dataset.version)
+    results['refresh_plots_cold'] = measure(lambda: index.refresh_plots(**plot_arguments), iterations, setup=clear_caches)
+    results['refresh_plots_warm'] = measure(lambda: index.refresh_plots(**plot_arguments), iterations)
+
+    results['linear_regression_calculation'] = measure(lambda: index.linear_regression_calculation(**REGRESSION_INPUTS), iterations)
+
+    # Payload of the bar plots of one refresh_plots call, before and after the compact serialization
+    plot_data = index.aggregated_plot_data(dataset, X_AXIS, index.filter_selections(X_AXIS, **state))
+    figures = [index.create_bar_plot(plot_data, X_AXIS, y_axis, aggregated=True) for y_axis in index.bar_plot_y_axes]
+    payload = serialization.report(figures)
+
+    con.close()
+
+    return {
+        'database': os.path.abspath(database),
+        'metric_rows': metric_rows,
+        'dataset_rows': len(data),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__
+        },
+        'benchmarks': results,
+        'serialization': payload
+    }
+
+
+# Printing the change of every benchmark against an earlier result, returns the regressed ones
+def compare(current, baseline, threshold):
+    regressions = []
+
+    print('{:<32} {:>12} {:>12} {:>9}'.format('benchmark', 'baseline p50', 'p50 ms', 'change'))
+    for name, result in current['benchmarks'].items():
+        before = baseline['benchmarks'].get(name)
+        if before is None:
+            print('{:<32} {:>12} {:>12.3f} {:>9}'.format(name, '-', result['p50_ms'], 'new'))
+            continue
+
+        change = result['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0.0
+        print('{:<32} {:>12.3f} {:>12.3f} {:>+8.1%}'.format(name, before['p50_ms'], result['p50_ms'], change))
+        if change > threshold:
+            regressions.append(name)
+
+    if baseline.get('metric_rows') != current.get('metric_rows'):
+        print('Warning: the baseline was measured on {} metrics rows, this run on {}'.format(baseline.get('metric_rows'), current.get('metric_rows')))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the dashboard hot paths')
+    parser.add_argument('--database', default=os.path.join('benchmarks', 'data', 'metrics.sqlite'), help='SQLite file of benchmarks/generate.py')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--query-iterations', type=int, default=3, help='iterations of the full aggregation query')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier result file to compare with')
+    parser.add_argument('--threshold', type=float, default=0.10, help='p50 slowdown counted as a regression')
+    arguments = parser.parse_args()
+
+    warnings.filterwarnings('ignore', category=UserWarning)
+
+    current = run(arguments.database, arguments.iterations, arguments.query_iterations)
+
+    with open(arguments.output, 'w') as output:
+        json.dump(current, output, indent=2)
+
+    for name, result in current['benchmarks'].items():
+        print('{:<32} p50 {:>9.3f} ms  p95 {:>9.3f} ms  p99 {:>9.3f} ms  {:>10.1f}/s  peak {:>8.1f} kB'.format(
+            name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['throughput_per_s'], result['peak_memory_bytes'] / 1024))
+    for name in ('before', 'after'):
+        payload = current['serialization'][name]
+        print('refresh_plots payload {:<6}  {:>9} bytes  {:>8} gzip bytes  {:>8.3f} ms'.format(name, payload['bytes'], payload['gzip_bytes'], payload['serialize_ms']))
+    print('Results written to', arguments.output)
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            regressions = compare(current, json.load(baseline_file), arguments.threshold)
+        if regressions:
+            print('Regressions over {:.0%}: {}'.format(arguments.threshold, ', '.join(regressions)))
+            sys.exit(1)
@@ -0,0 +1,107 @@
+# The dashboard with a synthetic dataset, served for benchmarks/loadtest.py
+#
+# The dataset of a benchmarks/generate.py database is published before the server starts. The
+# threads model is one process handling every request in its own thread; the processes model
+# forks pre-loaded workers that accept on the same socket and handle one request at a time each,
+# like the sync workers of gunicorn. Once listening, one JSON line is printed with the port and
+# the callback function of every output, the load test waits for it. The callbacks needing
+# PostgreSQL are listed as skipped, the load test does not send them.
+#
+#   python benchmarks/serve.py --database benchmarks/data/metrics.sqlite --model processes --workers 4
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import warnings
+
+from werkzeug.serving import make_server
+
+# The time series tab queries PostgreSQL directly, the SQLite database cannot answer it: the tab
+# is disabled by its setting (it shows its no-database message), set before the dashboard is imported
+os.environ['DASHBOARD_TIMESERIES_ENABLED'] = '0'
+
+from run import index, install_dataset, install_models, query_aggregates  # noqa: E402
+
+# Callbacks querying PostgreSQL directly, the load test does not send them
+SKIPPED_CALLBACKS = ['refresh_timeseries_plot']
+
+
+def load(database):
+    con = sqlite3.connect(database)
+    install_models()
+    dataset = install_dataset(query_aggregates(con))
+    con.close()
+
+    return dataset
+
+
+# Function name of the server-side callback of every output, as in /_dash-dependencies
+def callback_names():
+    return {output: getattr(entry['callback'], '__name__', output) for output, entry in index.app.callback_map.items()}
+
+
+def ready(port, dataset):
+    print(json.dumps({'port': port, 'pid': os.getpid(), 'dataset_rows': len(dataset.data), 'callbacks': callback_names(), 'skipped': SKIPPED_CALLBACKS}), flush=True)
+
+
+def serve_threads(host, port, dataset):
+    server = make_server(host, port, index.app.server, threaded=True)
+    ready(server.port, dataset)
+    server.serve_forever()
+
+
+def serve_processes(host, port, workers, dataset):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(128)
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            make_server(host, port, index.app.server, fd=listener.fileno()).serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    ready(listener.getsockname()[1], dataset)
+    for child in children:
+        os.waitpid(child, 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Dashboard with a synthetic dataset for the load tests')
+    parser.add_argument('--database', default=os.path.join('benchmarks', 'data', 'metrics.sqlite'), help='SQLite file of benchmarks/generate.py')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='0 picks a free port')
+    parser.add_argument('--model', choices=['threads', 'processes'], default='threads')
+    parser.add_argument('--workers', type=int, default=4, help='worker processes of the processes model')
+    arguments = parser.parse_args()
+
+    warnings.filterwarnings('ignore', category=UserWarning)
+    # One log line per request would be slower than some of the callbacks
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    dataset = load(arguments.database)
+
+    if arguments.model == 'threads':
+        serve_threads(arguments.host, arguments.port, dataset)
+    else:
+        serve_processes(arguments.host, arguments.port, arguments.workers, dataset)
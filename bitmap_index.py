@@ -0,0 +1,51 @@
+# Bitmap index over the parameter dimensions of a frame
+#
+# Every (column, value) pair gets a packed bitmask of the rows holding that value. A filter state
+# is answered with an OR of the masks inside a column and an AND across columns on the packed
+# bytes, then a single take of the matching rows, instead of one filtered copy per column.
+import numpy as np
+import pandas as pd
+
+
+class BitmapIndex:
+
+    def __init__(self, frame, columns):
+        self.size = len(frame)
+        self.bitmaps = {}
+
+        for column in columns:
+            # NaN values get the code -1 and are never matched, like isin()
+            codes, values = pd.factorize(frame[column])
+            self.bitmaps[column] = {value: np.packbits(codes == code) for code, value in enumerate(values)}
+
+    # Packed mask of the rows matching every {column: values} selection, None if nothing is selected
+    def packed_mask(self, selections):
+        mask = None
+
+        for column, values in selections.items():
+            bitmaps = self.bitmaps[column]
+            column_mask = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+            for value in values:
+                bitmap = bitmaps.get(value)
+                if bitmap is not None:
+                    column_mask |= bitmap
+
+            mask = column_mask if mask is None else mask & column_mask
+
+        return mask
+
+    # Positions of the matching rows, None if nothing is selected (every row matches)
+    def positions(self, selections):
+        mask = self.packed_mask(selections)
+        if mask is None:
+            return None
+
+        return np.flatnonzero(np.unpackbits(mask, count=self.size))
+
+    def take(self, frame, selections):
+        positions = self.positions(selections)
+        if positions is None:
+            return frame
+
+        return frame.take(positions)
@@ -0,0 +1,147 @@
+# Ad-hoc breakdowns of a metric over any two dimensions of the dataset
+#
+# Every published dataset is copied into an in-process DuckDB database, a columnar table scanned
+# with vectorized execution by several threads. A breakdown is one GROUP BY of the filtered
+# configurations by the two dimensions, averaging them like the bar plots do. Without duckdb
+# installed (or before the copy of the current dataset is loaded), the same aggregation runs as
+# a pandas groupby over the dataset frame.
+import itertools
+import logging
+import threading
+
+from columns import METRIC_COLUMNS, PARAMETER_COLUMNS
+from lru_cache import LRUCache
+from pushdown import normalize_filter_state
+from schema import plain_frame
+
+logger = logging.getLogger(__name__)
+
+# Columns a breakdown can be made by
+DIMENSIONS = ['group_name'] + PARAMETER_COLUMNS
+
+# Dataset copies kept, a query may still run on the previous one
+KEEP_TABLES = 2
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    return duckdb
+
+
+def breakdown_query(table, metric, rows, columns, selections, groups=None):
+    conditions = ['"{}" IS NOT NULL'.format(rows), '"{}" IS NOT NULL'.format(columns)]
+    params = []
+    for column, values in normalize_filter_state(None, selections)[1]:
+        conditions.append('"{}" IN ({})'.format(column, ', '.join('?' * len(values))))
+        params += list(values)
+
+    if groups:
+        conditions.append('group_name IN ({})'.format(', '.join('?' * len(groups))))
+        params += list(groups)
+
+    query = '''SELECT "{rows}" AS row_value, "{columns}" AS column_value, AVG("{metric}") AS value, COUNT("{metric}") AS configurations
+FROM {table}
+WHERE {conditions}
+GROUP BY 1, 2
+HAVING COUNT("{metric}") > 0
+'''.format(rows=rows, columns=columns, metric=metric, table=table, conditions=' AND '.join(conditions))
+
+    return query, params
+
+
+# Same aggregation over the dataset frame
+def pandas_breakdown(dataset, metric, rows, columns, selections, groups=None):
+    data = dataset.index.take(dataset.data, selections)
+    if groups:
+        data = data[data['group_name'].isin(groups)]
+
+    result = data.groupby([rows, columns], observed=True)[metric].agg(['mean', 'count']).reset_index()
+    result.columns = ['row_value', 'column_value', 'value', 'configurations']
+
+    return result[result['configurations'] > 0].reset_index(drop=True)
+
+
+class BreakdownEngine:
+
+    def __init__(self, threads=0, max_entries=64):
+        self.cache = LRUCache(max_entries)
+
+        # (dataset version, table name) of the loaded copies, the newest last
+        self._tables = []
+        self._names = itertools.count(1)
+        self._lock = threading.Lock()
+
+        duckdb = _duckdb()
+        self._connection = None if duckdb is None else duckdb.connect(':memory:')
+        if self._connection is not None and threads:
+            self._connection.execute('SET threads TO {}'.format(int(threads)))
+
+    @property
+    def engine(self):
+        return 'pandas' if self._connection is None else 'duckdb'
+
+    # Copy of a newly published dataset, a listener of the refresher
+    def load(self, dataset):
+        if self._connection is None:
+            return
+
+        name = 'dataset_{}'.format(next(self._names))
+        # Categorical values are compared with the filter values in SQL
+        frame = plain_frame(dataset.data)
+
+        with self._lock:
+            connection = self._connection.cursor()
+            try:
+                connection.register('published', frame)
+                connection.execute('CREATE TABLE {} AS SELECT * FROM published'.format(name))
+                connection.unregister('published')
+
+                self._tables.append((dataset.version, name))
+                while len(self._tables) > KEEP_TABLES:
+                    connection.execute('DROP TABLE {}'.format(self._tables.pop(0)[1]))
+            finally:
+                connection.close()
+
+        logger.info('Dataset version %s copied to %s for the breakdowns', dataset.version, name)
+
+    def _table(self, version):
+        with self._lock:
+            for table_version, name in self._tables:
+                if table_version == version:
+                    return name
+        return None
+
+    # (row value, column value, average of the metric, configurations) of every cell with data
+    def breakdown(self, dataset, metric, rows, columns, selections, groups=None):
+        if metric not in METRIC_COLUMNS:
+            raise ValueError('Unknown metric column: {}'.format(metric))
+        for column in (rows, columns):
+            if column not in DIMENSIONS:
+                raise ValueError('Unknown breakdown dimension: {}'.format(column))
+
+        # The filters of the two dimensions are not applied, like the one of the X axis of the bar plots
+        selections = {column: values for column, values in selections.items() if column not in (rows, columns)}
+        groups = None if 'group_name' in (rows, columns) or not groups else sorted(groups)
+
+        key = (dataset.version, metric, rows, columns, normalize_filter_state(None, selections), tuple(groups or ()))
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        table = None if self._connection is None else self._table(dataset.version)
+        if table is None:
+            result = pandas_breakdown(dataset, metric, rows, columns, selections, groups)
+        else:
+            query, params = breakdown_query(table, metric, rows, columns, selections, groups)
+            connection = self._connection.cursor()
+            try:
+                result = connection.execute(query, params).df()
+            finally:
+                connection.close()
+
+        self.cache.put(key, result)
+
+        return result
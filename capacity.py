@@ -0,0 +1,195 @@
+# Capacity planning sweep over the regression models
+#
+# The configuration grid (within the bounds of the regression tab inputs) is scored in chunks
+# across a process pool. Each chunk keeps the configurations within the CPU, memory and network
+# budget that are Pareto-optimal for (instances, CPU, memory, network), the fronts of the chunks
+# are merged into the final one. The pool is started on the first sweep and kept for the later
+# ones. Its workers are forked from a fork server, a fresh single-threaded process with numpy
+# and capacity_worker imported, not from the threaded web server. capacity_worker is also their
+# main module, so they do not import the dashboard again. Grids up to inprocess_max
+# configurations are evaluated in the calling process, starting workers would take longer.
+import atexit
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from prediction import FEATURES, TARGETS
+
+# Budgeted resources and the metric of the models summed over the components
+RESOURCE_METRICS = {
+    'cpu': 'nd_cg_cpu_visibletotal_value',
+    'memory': 'nd_cg_mem_usage_visibletotal_value',
+    'network': 'nd_cg_net_eth0_visibletotal_value'
+}
+RESOURCES = list(RESOURCE_METRICS)
+
+# Features counted as instances of the cluster, the cost to minimize
+INSTANCE_FEATURES = ['number_of_nginx', 'number_of_distributor', 'number_of_ingester']
+
+# (targets x resources) matrix summing the predicted components of a resource
+RESOURCE_SUMS = np.array([[1.0 if metric == RESOURCE_METRICS[resource] else 0.0 for resource in RESOURCES] for metric, component in TARGETS])
+
+# Worker pool of the sweeps and its number of workers
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+# Values of a continuous input: the measured ones within the bounds and a geometric progression
+def continuous_values(low, high, measured, steps):
+    values = {value for value in measured if low <= value <= high}
+    values.update(np.round(np.geomspace(max(low, 1), high, steps)).tolist())
+
+    return sorted(values)
+
+
+# Every combination of {feature: values} as an (N x features) array in FEATURES order
+def configuration_grid(feature_values):
+    axes = np.meshgrid(*[np.asarray(feature_values[feature], dtype=np.float64) for feature in FEATURES], indexing='ij')
+
+    return np.stack([axis.ravel() for axis in axes], axis=1)
+
+
+# Positions of the non-dominated rows, every objective is minimized
+def pareto_front(objectives):
+    # In lexicographic order the first remaining row is never dominated by a later one
+    remaining = np.lexsort(objectives.T[::-1])
+
+    front = []
+    while len(remaining) != 0:
+        best = remaining[0]
+        front.append(best)
+
+        # Dropping the row and everything it dominates
+        rows = objectives[remaining[1:]]
+        dominated = np.all(objectives[best] <= rows, axis=1) & np.any(objectives[best] < rows, axis=1)
+        remaining = remaining[1:][~dominated]
+
+    return np.array(front, dtype=np.int64)
+
+
+def evaluate(engine, configurations, budgets):
+    totals = engine.predict(configurations) @ RESOURCE_SUMS
+
+    feasible = np.all(totals <= budgets, axis=1)
+    configurations, totals = configurations[feasible], totals[feasible]
+
+    instances = configurations[:, [FEATURES.index(feature) for feature in INSTANCE_FEATURES]].sum(axis=1)
+    objectives = np.column_stack([instances, totals])
+
+    front = pareto_front(objectives)
+
+    return configurations[front], objectives[front]
+
+
+# Held while a worker is launched with capacity_worker as main module
+_launch_lock = threading.Lock()
+
+
+# The main module is read from sys.modules when the preparation data of the child is written
+def _launch_worker(process_class, process_obj):
+    with _launch_lock:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = sys.modules['capacity_worker']
+        try:
+            return process_class._Popen(process_obj)
+        finally:
+            sys.modules['__main__'] = main
+
+
+class _SpawnWorkerProcess(multiprocessing.context.SpawnProcess):
+
+    @staticmethod
+    def _Popen(process_obj):
+        return _launch_worker(multiprocessing.context.SpawnProcess, process_obj)
+
+
+class _SpawnWorkerContext(multiprocessing.context.SpawnContext):
+    Process = _SpawnWorkerProcess
+
+
+if 'forkserver' in multiprocessing.get_all_start_methods():
+
+    class _ForkServerWorkerProcess(multiprocessing.context.ForkServerProcess):
+
+        @staticmethod
+        def _Popen(process_obj):
+            return _launch_worker(multiprocessing.context.ForkServerProcess, process_obj)
+
+    class _ForkServerWorkerContext(multiprocessing.context.ForkServerContext):
+        Process = _ForkServerWorkerProcess
+
+
+# Contexts of their own, other process pools keep the default processes
+def _pool_context():
+    import capacity_worker  # noqa: F401
+
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        multiprocessing.get_context('forkserver').set_forkserver_preload(['capacity_worker'])
+        return _ForkServerWorkerContext()
+    return _SpawnWorkerContext()
+
+
+def get_pool(workers):
+    global _pool, _pool_workers
+
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context())
+            _pool_workers = workers
+
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+# Pareto-optimal configurations within the budgets ({resource: limit or None}), cheapest first
+def sweep(engine, feature_values, budgets, workers=1, chunk_size=10000, inprocess_max=0):
+    grid = configuration_grid(feature_values)
+    limits = np.array([np.inf if budgets.get(resource) is None else budgets[resource] for resource in RESOURCES])
+
+    # The engine goes with every chunk, the models may have changed since the pool started
+    chunks = [(engine, grid[start:start + chunk_size], limits) for start in range(0, len(grid), chunk_size)]
+
+    if workers > 1 and len(chunks) > 1 and len(grid) > inprocess_max:
+        from capacity_worker import evaluate_chunk
+
+        try:
+            results = list(get_pool(workers).map(evaluate_chunk, chunks))
+        except BrokenProcessPool:
+            # A worker died, the next sweep starts a new pool
+            shutdown_pool()
+            raise
+    else:
+        results = [evaluate(*chunk) for chunk in chunks]
+
+    configurations = np.concatenate([result[0] for result in results])
+    objectives = np.concatenate([result[1] for result in results])
+
+    front = pareto_front(objectives)
+    configurations, objectives = configurations[front], objectives[front]
+
+    rows = []
+    for configuration, objective in zip(configurations, objectives):
+        row = dict(zip(FEATURES, configuration.tolist()))
+        row['instances'] = float(objective[0])
+        row.update(zip(RESOURCES, objective[1:].tolist()))
+        rows.append(row)
+
+    return rows, len(grid)
@@ -0,0 +1,10 @@
+# Entry module of the capacity sweep workers
+#
+# The workers are started with this module as their main module instead of the one of the
+# dashboard, so a worker never imports index.py as __mp_main__: it only has numpy, the
+# prediction engine and the sweep evaluation, no Dash app, layout or database settings.
+from capacity import evaluate
+
+
+def evaluate_chunk(arguments):
+    return evaluate(*arguments)
@@ -0,0 +1,107 @@
+# Coalescing of bursts of callback requests and sharing of identical concurrent computations
+#
+# Every browser tab gets a session id (a dcc.Store filled when the layout is served). A callback
+# request of a session takes a ticket; a newer request of the same session and callback supersedes
+# it. Before the expensive part a request waits a short window for the rest of a burst (e.g. a
+# user going through several dropdowns) and stops with PreventUpdate once superseded, a superseded
+# request that already computed its figures drops the response (the figures stay in the cache).
+# Identical computations running at the same time, also of different sessions, are done once
+# by SingleFlight and their result is shared. Both work per process.
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from dash.exceptions import PreventUpdate
+
+import instrumentation
+
+REQUESTS_COALESCED = instrumentation.Counter('dashboard_coalesced_requests_total', 'Callback requests dropped as superseded or served by an identical concurrent one.', ['callback', 'reason'])
+
+
+class Coalescer:
+
+    def __init__(self, window, max_sessions=10000):
+        self.window = window
+        self.max_sessions = max_sessions
+
+        # Latest ticket number by (session, callback), the oldest sessions are forgotten first
+        self._latest = OrderedDict()
+        self._numbers = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # Ticket of a new request, None without a session (e.g. called outside of Dash)
+    def begin(self, session, callback):
+        if session is None:
+            return None
+
+        key = (session, callback)
+        number = next(self._numbers)
+        with self._lock:
+            self._latest[key] = number
+            self._latest.move_to_end(key)
+            while len(self._latest) > self.max_sessions:
+                self._latest.popitem(last=False)
+
+        return key, number
+
+    def superseded(self, ticket):
+        if ticket is None:
+            return False
+
+        key, number = ticket
+        with self._lock:
+            return self._latest.get(key, number) != number
+
+    # PreventUpdate when a newer request of the session arrived
+    def check(self, ticket):
+        if self.superseded(ticket):
+            REQUESTS_COALESCED.inc(callback=ticket[0][1], reason='superseded')
+            raise PreventUpdate
+
+    # Waiting for the rest of a burst before the expensive part, then checking
+    def settle(self, ticket):
+        if ticket is not None and self.window:
+            time.sleep(self.window)
+        self.check(ticket)
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    # Result of function(), computed once for the callers arriving while it runs, and whether it was shared
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
@@ -0,0 +1,38 @@
+# Column names of the metrics and parameters tables used by the dashboard
+
+# Measured values, averaged per configuration
+METRIC_COLUMNS = [
+    'du_disk_usage_value',
+    'nd_cg_cpu_visibletotal_value',
+    'nd_cg_mem_visibletotal_value',
+    'nd_cg_net_eth0_received_value',
+    'nd_cg_net_eth0_sent_value',
+    'nd_cg_net_eth0_visibletotal_value'
+]
+
+# Benchmark parameters, one combination of them is a configuration
+PARAMETER_COLUMNS = [
+    'application_instances_value',
+    'application_case_value',
+    'application_metric_count_value',
+    'application_labels_value',
+    'cortex_number_of_nginx_value',
+    'cortex_number_of_distributor_value',
+    'cortex_number_of_ingester_value',
+    'cortex_blocks_storage_tsdb_block_ranges_period_value',
+    'cortex_blocks_storage_tsdb_retention_period_value',
+    'cortex_blocks_storage_tsdb_wal_compression_value',
+    'cortex_compactor_blocks_ranges_value'
+]
+
+# Parameters with a filter on the dashboard
+FILTER_COLUMNS = PARAMETER_COLUMNS[1:]
+
+# Columns of one aggregated row
+KEY_COLUMNS = ['group_name'] + PARAMETER_COLUMNS
+
+# Applications shown on the dashboard
+GROUP_NAMES = ['cortex compactor', 'cortex distributor', 'cortex ingester', 'cortex nginx', 'minio', 'prometheus server']
+
+# Rows taken into account by every query
+BASE_CONDITION = "(parameters.prometheus_remote_write_max_samples_per_send_value IS NULL OR parameters.prometheus_remote_write_max_samples_per_send_value = 100) AND metrics.group_name IN ('cortex compactor', 'cortex distributor', 'cortex ingester', 'cortex nginx', 'minio', 'prometheus server')"
@@ -0,0 +1,88 @@
+# Pre-aggregated data cube of the bar plots
+#
+# The cube keeps SUM and COUNT of every metric per cell (group_name x every parameter dimension),
+# built once per dataset from the sums and counts of the snapshot aggregates. A filter state is
+# a slice of the cells (through a bitmap index), the X axis choice a roll-up of the slice to
+# (group_name, X axis). The averages are divided out of the rolled up sums and counts only then,
+# so they equal the AVG over the filtered measurements (not an average of the configuration
+# averages), and one roll-up serves every metric, i.e. all the figures of a callback.
+import numpy as np
+import pandas as pd
+
+from bitmap_index import BitmapIndex
+
+
+class DataCube:
+
+    def __init__(self, frame, dimensions, metrics):
+        # frame: the snapshot aggregates (<metric>_sum and <metric>_count per configuration), whose
+        # sums and counts are added up exactly, or rows without them, every value of which counts once
+        self.dimensions = dimensions
+        self.metrics = metrics
+
+        sum_columns = [metric + '_sum' for metric in metrics]
+        count_columns = [metric + '_count' for metric in metrics]
+
+        if set(sum_columns + count_columns).issubset(frame.columns):
+            # Sums are accumulated in float64 whatever the storage dtype is
+            grouped = frame.astype({column: np.float64 for column in sum_columns}).groupby(['group_name'] + dimensions, dropna=False, observed=True, sort=False)
+            sums = grouped[sum_columns].sum()
+            counts = grouped[count_columns].sum()
+        else:
+            grouped = frame.astype({metric: np.float64 for metric in metrics}).groupby(['group_name'] + dimensions, dropna=False, observed=True, sort=False)[metrics]
+            sums = grouped.sum()
+            counts = grouped.count()
+
+        self.cells = sums.index.to_frame(index=False)
+        self.sums = sums.to_numpy(dtype=np.float64)
+        self.counts = counts.to_numpy(dtype=np.int64)
+
+        self.index = BitmapIndex(self.cells, dimensions)
+
+    # (cells, sums, counts) of the cells matching the {column: values} selections
+    def slice(self, selections):
+        positions = self.index.positions(selections)
+
+        if positions is None:
+            return self.cells, self.sums, self.counts
+
+        return self.cells.take(positions), self.sums[positions], self.counts[positions]
+
+    # Averages per (group_name, x_axis) of the cells matching the {column: values} selections
+    def rollup(self, selections, x_axis):
+        return self.rollup_slice(self.slice(selections), x_axis)
+
+    # Averages per (group_name, x_axis) of a slice of the cube
+    def rollup_slice(self, sliced, x_axis):
+        cells, sums, counts = sliced
+
+        group_codes, groups = pd.factorize(cells['group_name'], sort=True)
+        x_codes, x_values = pd.factorize(cells[x_axis], sort=True)
+
+        # Cells with a missing group or X value are not plotted
+        valid = (group_codes >= 0) & (x_codes >= 0)
+        keys = group_codes[valid] * len(x_values) + x_codes[valid]
+        size = len(groups) * len(x_values)
+
+        present = np.flatnonzero(np.bincount(keys, minlength=size))
+        rolled = pd.DataFrame({
+            'group_name': np.asarray(groups)[present // len(x_values)],
+            x_axis: np.asarray(x_values)[present % len(x_values)]
+        })
+
+        for position, metric in enumerate(self.metrics):
+            metric_sums = np.bincount(keys, weights=sums[valid, position], minlength=size)[present]
+            metric_counts = np.bincount(keys, weights=counts[valid, position], minlength=size)[present]
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                rolled[metric] = np.where(metric_counts > 0, metric_sums / metric_counts, np.nan)
+
+        return rolled
+
+    # Cells, sums and counts as plain lists by column, e.g. to ship the cube to the browser
+    def to_columns(self):
+        return {
+            'cells': {column: self.cells[column].astype(object).where(self.cells[column].notna(), None).tolist() for column in self.cells.columns},
+            'sums': {metric: self.sums[:, position].tolist() for position, metric in enumerate(self.metrics)},
+            'counts': {metric: self.counts[:, position].tolist() for position, metric in enumerate(self.metrics)}
+        }
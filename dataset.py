@@ -0,0 +1,139 @@
+# In-memory dataset of the dashboard and its background refresh
+#
+# A Dataset is built completely before it is published and never modified afterwards, the
+# refresher swaps the published reference in one assignment. Callbacks read `refresher.current`
+# once and keep working with that object, so they never see a half-built frame and never wait.
+import logging
+import threading
+import time
+
+from bitmap_index import BitmapIndex
+from columns import METRIC_COLUMNS, PARAMETER_COLUMNS, FILTER_COLUMNS
+from cube import DataCube
+from schema import apply_schema
+from snapshot import SUM_COLUMNS, COUNT_COLUMNS, aggregate_means
+
+logger = logging.getLogger(__name__)
+
+# Columns with a filter dropdown, their sorted values are the dropdown options
+OPTION_COLUMNS = [
+    'application_labels_value',
+    'application_metric_count_value',
+    'application_case_value',
+    'cortex_number_of_nginx_value',
+    'cortex_number_of_distributor_value',
+    'cortex_number_of_ingester_value',
+    'cortex_blocks_storage_tsdb_block_ranges_period_value',
+    'cortex_blocks_storage_tsdb_retention_period_value',
+    'cortex_compactor_blocks_ranges_value'
+]
+
+
+class Dataset:
+
+    def __init__(self, data, options, index, cube, version, memory_bytes=None):
+        self.data = data
+        self.memory_bytes = memory_bytes
+        self.options = options
+        self.index = index
+        self.cube = cube
+        self.version = version
+        self.loaded_at = time.time()
+
+
+# Compact dtypes and sorting of a freshly queried frame, returns (data, memory in bytes)
+def prepare_data(data):
+
+    # Compact dtype of every column
+    data, memory_before, memory_after = apply_schema(data)
+
+    # Sorting data by application name, a shared frame arrives sorted and is not copied
+    if not data['group_name'].is_monotonic_increasing:
+        data = data.sort_values(by=['group_name'])
+
+    return data, memory_after
+
+
+# Typing, option lists, sorting, indexing and the cube of a freshly loaded frame: the snapshot
+# aggregates (sums and counts per configuration, the dataset holds their means) or averaged rows
+def build_dataset(frame, version):
+    if set(SUM_COLUMNS + COUNT_COLUMNS).issubset(frame.columns):
+        # Typed once, the means and the cells of the cube share the categories
+        aggregates = apply_schema(frame)[0]
+        data, memory_bytes = prepare_data(aggregate_means(aggregates))
+    else:
+        aggregates = None
+        data, memory_bytes = prepare_data(frame)
+
+    options = {column: sorted(set(data[column].dropna().drop_duplicates())) for column in OPTION_COLUMNS}
+
+    # Bitmasks of the filter values, positions follow the sorted frame
+    index = BitmapIndex(data, FILTER_COLUMNS)
+
+    # Sums and counts of the metrics for every filter state and X axis, exact from the aggregates
+    cube = DataCube(aggregates if aggregates is not None else data, PARAMETER_COLUMNS, METRIC_COLUMNS)
+
+    return Dataset(data, options, index, cube, version, memory_bytes=memory_bytes)
+
+
+class DatasetRefresher:
+
+    def __init__(self, loader, interval):
+        # loader() returns the aggregates (or an averaged frame) or None if there is nothing new, interval is in seconds (0 - only on demand)
+        self.loader = loader
+        self.interval = interval
+        self.current = None
+
+        # Called with every newly published dataset
+        self.listeners = []
+
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    # Building a new dataset and publishing it, returns False if a refresh is already running or nothing changed
+    def refresh(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+
+        try:
+            started = time.perf_counter()
+            data = self.loader()
+            if data is None:
+                return False
+
+            version = 1 if self.current is None else self.current.version + 1
+            dataset = build_dataset(data, version)
+
+            # Atomic swap, readers hold either the old or the new dataset
+            self.current = dataset
+            logger.info('Dataset version %d published (%d rows, %.2f s)', version, len(dataset.data), time.perf_counter() - started)
+        finally:
+            self._refresh_lock.release()
+
+        for listener in self.listeners:
+            try:
+                listener(dataset)
+            except Exception:
+                logger.exception('Dataset listener %s failed', listener)
+
+        return True
+
+    # Asking the background thread for a refresh without waiting for it
+    def request_refresh(self):
+        self._wakeup.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='dataset-refresher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval or None)
+            self._wakeup.clear()
+
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Dataset refresh failed, keeping version %s', self.current.version if self.current else None)
@@ -0,0 +1,229 @@
+# PostgreSQL access: pooled connections and streaming reads
+#
+# Connections are kept in a thread-safe pool, so repeated queries skip the connect/auth
+# round-trip. A connection that was idle for longer than the health check interval is
+# tested with `SELECT 1` before it is handed out and replaced if it is broken.
+# Large results can be read through server-side (named) cursors in fixed-size chunks.
+# psycopg2 is imported on first use, so the dashboard can start before it is needed.
+import logging
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import settings
+from instrumentation import DB_QUERY_SECONDS, DB_QUERY_ROWS
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# psycopg2 pools raise instead of waiting when they are exhausted, borrowers wait here
+_available = None
+
+# Last time a pooled connection was used or checked, a closed and collected connection drops out
+_last_checked = weakref.WeakKeyDictionary()
+
+
+def get_pool():
+    return _pool_and_slots()[0]
+
+
+# The pool with its semaphore, read together so a pool recreated meanwhile is not paired with an old one
+def _pool_and_slots():
+    global _pool, _available
+
+    from psycopg2 import pool
+
+    with _pool_lock:
+        if _pool is None:
+            _available = threading.BoundedSemaphore(settings.db_pool_max_size)
+            _pool = pool.ThreadedConnectionPool(settings.db_pool_min_size, settings.db_pool_max_size,
+                                                host=settings.host_name, port=settings.port, database=settings.database_name, user=settings.username, password=settings.pw)
+        return _pool, _available
+
+
+def close_pool():
+    global _pool, _available
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            # The next pool gets its own semaphore, with the size of the settings then
+            _available = None
+            _last_checked.clear()
+
+
+def _healthy(connect):
+    import psycopg2
+
+    if connect.closed:
+        return False
+
+    # Recently used connections are trusted without a round-trip
+    if time.monotonic() - _last_checked.get(connect, 0) < settings.db_health_check_interval:
+        return True
+
+    try:
+        with connect.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connect.rollback()
+    except psycopg2.Error:
+        return False
+
+    return True
+
+
+# Borrowing a healthy connection from the pool, it is rolled back and returned afterwards
+@contextmanager
+def connection():
+    import psycopg2
+
+    connection_pool, available = _pool_and_slots()
+    available.acquire()
+
+    try:
+        connect = connection_pool.getconn()
+        if not _healthy(connect):
+            logger.warning('Replacing a broken pooled database connection')
+            _last_checked.pop(connect, None)
+            connection_pool.putconn(connect, close=True)
+            connect = connection_pool.getconn()
+    except Exception:
+        available.release()
+        raise
+
+    broken = False
+    try:
+        yield connect
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        if not broken and not connect.closed:
+            try:
+                connect.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        if broken or connect.closed:
+            _last_checked.pop(connect, None)
+            connection_pool.putconn(connect, close=True)
+        else:
+            _last_checked[connect] = time.monotonic()
+            connection_pool.putconn(connect)
+
+        available.release()
+
+
+# SQL query - parameters, metrics table, on a pooled connection unless one is given (e.g. SQLite)
+# With dtypes (e.g. schema.KEY_DTYPES) the result is read in chunks, each typed before the next one
+# is read, so the whole result is never held as the boxed values of the driver
+def sql_queries(query, params=None, con=None, dtypes=None):
+    with DB_QUERY_SECONDS.time():
+        if dtypes is not None:
+            result = _typed_result(query, params, con, dtypes)
+        elif con is not None:
+            result = pd.read_sql_query(query, con=con, params=params)
+        else:
+            with connection() as connect:
+                result = pd.read_sql_query(query, con=connect, params=params)
+
+    DB_QUERY_ROWS.inc(len(result))
+
+    return result
+
+
+def _typed_result(query, params, con, dtypes):
+    from schema import cast_frame, concat_frames, memory_usage
+
+    if con is not None:
+        chunks = pd.read_sql_query(query, con=con, params=params, chunksize=settings.db_stream_chunk_size)
+    else:
+        chunks = iter_query_frames(query, params)
+
+    frames = []
+    memory_read = 0
+    for chunk in chunks:
+        memory_read += memory_usage(chunk)
+        frames.append(cast_frame(chunk, dtypes))
+
+    result = concat_frames(frames)
+    logger.info('Read %d rows: %.1f kB as read, %.1f kB typed', len(result), memory_read / 1024, memory_usage(result) / 1024)
+
+    return result
+
+
+# Streaming a query through a server-side cursor, yields (column names, list of row tuples) chunks
+def stream_rows(query, params=None, chunk_size=None):
+    chunk_size = chunk_size or settings.db_stream_chunk_size
+
+    with connection() as connect:
+        with connect.cursor(name='dashboard_' + uuid.uuid4().hex) as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(query, params)
+
+            columns = None
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+
+                if columns is None:
+                    columns = [description[0] for description in cursor.description]
+
+                yield columns, rows
+
+
+# Typed column buffers of one chunk, columns without a dtype stay object arrays
+def _chunk_columns(columns, rows, dtypes):
+    values = list(zip(*rows))
+
+    # NULLs become NaN in float buffers
+    return {column: np.array(values[position], dtype=dtypes.get(column, object)) for position, column in enumerate(columns)}
+
+
+# Streaming a query as DataFrames of at most chunk_size rows, memory is bounded by one chunk
+def iter_query_frames(query, params=None, dtypes=None, chunk_size=None):
+    dtypes = dtypes or {}
+
+    for columns, rows in stream_rows(query, params, chunk_size):
+        yield pd.DataFrame(_chunk_columns(columns, rows, dtypes), columns=columns)
+
+
+# Reading a whole query chunk by chunk straight into typed, growing column buffers
+def read_columns(query, params=None, dtypes=None, chunk_size=None):
+    dtypes = dtypes or {}
+    buffers = None
+    size = 0
+    columns = []
+
+    for columns, rows in stream_rows(query, params, chunk_size):
+        chunk = _chunk_columns(columns, rows, dtypes)
+
+        if buffers is None:
+            buffers = {column: np.empty(len(rows), dtype=chunk[column].dtype) for column in columns}
+
+        # Doubling the capacity when the next chunk does not fit
+        capacity = len(next(iter(buffers.values())))
+        if size + len(rows) > capacity:
+            capacity = max(capacity * 2, size + len(rows))
+            for column in columns:
+                grown = np.empty(capacity, dtype=buffers[column].dtype)
+                grown[:size] = buffers[column][:size]
+                buffers[column] = grown
+
+        for column in columns:
+            buffers[column][size:size + len(rows)] = chunk[column]
+        size += len(rows)
+
+    if buffers is None:
+        return pd.DataFrame(columns=columns)
+
+    return pd.DataFrame({column: buffers[column][:size] for column in columns}, columns=columns)
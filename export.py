@@ -0,0 +1,164 @@
+# Streaming exports of the data behind the charts as CSV, Parquet or Arrow
+#
+# Frames are encoded chunk by chunk and every encoded chunk is handed to the WSGI server right
+# away, so an export holds one chunk in memory: slices of the in-memory dataset, or the chunks of
+# a server-side cursor for the raw metrics. Chunks are produced only as fast as the client reads
+# them, and the number of exports running at once is limited, further ones get a 429.
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from columns import METRIC_COLUMNS, PARAMETER_COLUMNS
+from schema import plain_frame
+
+# Mimetype and file extension of every format
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows')
+}
+
+# Filtered configurations of the dataset, their averages per (group_name, X axis), or the raw metrics rows
+KINDS = ['configurations', 'aggregates', 'raw']
+
+RAW_COLUMNS = ['metrics.timestamp', 'metrics.group_name'] + ['metrics.' + column for column in METRIC_COLUMNS] + ['parameters.' + column for column in PARAMETER_COLUMNS]
+RAW_DTYPES = {column: np.float64 for column in METRIC_COLUMNS}
+
+EXPORTS = instrumentation.Counter('dashboard_exports_total', 'Export requests by kind, format and outcome (streamed or rejected).', ['kind', 'format', 'outcome'])
+
+
+# Raw metrics and parameters rows within the WHERE conditions, for db.iter_query_frames
+def raw_query(conditions):
+    return 'SELECT {}\nFROM metrics INNER JOIN parameters ON metrics.timestamp=parameters.timestamp\nWHERE {}\nORDER BY metrics.timestamp, metrics.group_name\n'.format(
+        ', '.join(RAW_COLUMNS), ' AND '.join(conditions))
+
+
+# Filter values of the query string in the dtype of the column (e.g. 7200 as 7200.0 in a nullable
+# column), None if one of them is not a value of that dtype
+def filter_values(series, strings):
+    dtype = series.dtype.categories.dtype if isinstance(series.dtype, pd.CategoricalDtype) else series.dtype
+
+    if dtype.kind == 'b':
+        booleans = {'true': True, '1': True, 'false': False, '0': False}
+        if any(string.lower() not in booleans for string in strings):
+            return None
+        return [booleans[string.lower()] for string in strings]
+
+    try:
+        return pd.Series(strings, dtype=object).astype(dtype).tolist()
+    except (TypeError, ValueError):
+        return None
+
+
+# Slices of an in-memory frame, an empty frame still gives the columns
+def frame_chunks(frame, chunk_size):
+    for start in range(0, max(len(frame), 1), chunk_size):
+        yield frame.iloc[start:start + chunk_size]
+
+
+# Arrow type of a column, categorical and object columns by their values, strings when there are none
+def _arrow_type(series):
+    import pyarrow as pa
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        values = series.cat.categories
+    elif series.dtype == object:
+        values = series.dropna()
+    else:
+        return pa.Array.from_pandas(series.iloc[:0]).type
+
+    kind = pa.Array.from_pandas(values).type
+    if isinstance(values, pd.Index) and values.dtype.kind == 'b':
+        kind = pa.bool_()
+
+    return pa.string() if pa.types.is_null(kind) else kind
+
+
+# Schema of the whole frame, not of its first chunk, so every chunk is written with the same types
+def frame_schema(frame):
+    import pyarrow as pa
+
+    return pa.schema([pa.field(column, _arrow_type(frame[column])) for column in frame.columns])
+
+
+# Schema of the raw rows, the parameters typed like the columns of the dataset
+def raw_schema(data):
+    import pyarrow as pa
+
+    fields = [pa.field('timestamp', pa.timestamp('us', tz='UTC')), pa.field('group_name', pa.string())]
+    fields += [pa.field(column, pa.float64()) for column in METRIC_COLUMNS]
+    fields += [pa.field(column, _arrow_type(data[column]) if column in data else pa.string()) for column in PARAMETER_COLUMNS]
+
+    return pa.schema(fields)
+
+
+class _Buffer:
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    # Bytes written since the last call
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _csv_chunks(frames, schema):
+    header = True
+    for frame in frames:
+        yield frame.to_csv(index=False, header=header).encode()
+        header = False
+
+    # No rows: the header alone
+    if header:
+        yield pd.DataFrame(columns=schema.names).to_csv(index=False).encode()
+
+
+# Chunk converted to the schema, e.g. the floats of the database for integer parameters
+def _table(frame, schema):
+    import pyarrow as pa
+
+    arrays = [pa.Array.from_pandas(frame[field.name]).cast(field.type) for field in schema]
+
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _arrow_chunks(frames, format, schema):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    buffer = _Buffer()
+    sink = pa.PythonFile(buffer, mode='w')
+    # Opened before the first chunk, an export without rows is still a valid file
+    writer = pa.ipc.new_stream(sink, schema) if format == 'arrow' else pq.ParquetWriter(sink, schema)
+
+    for frame in frames:
+        # One record batch (Arrow) or row group (Parquet) per chunk
+        writer.write_table(_table(frame, schema))
+        yield buffer.take()
+
+    writer.close()
+    yield buffer.take()
+
+
+# Encoded chunks of a stream of frames with the given Arrow schema (frame_schema or raw_schema),
+# categorical columns are written with their plain values
+def encode(frames, format, schema):
+    frames = (plain_frame(frame) for frame in frames)
+
+    if format == 'csv':
+        return _csv_chunks(frames, schema)
+
+    return _arrow_chunks(frames, format, schema)
@@ -1,31 +1,47 @@
-# Standard libaries for DataFrame, Dtypes & I/O
-import numpy as np
-import pandas as pd
-
-# Datetime
-from datetime import datetime
-from datetime import date
-
-# Plotting
-import plotly.express as px
-import plotly.graph_objects as go
-
-# PostgreSQL
-import psycopg2
-
-# Pickle
-import pickle
-
-# Sklearn - for polinomial transformation
-from sklearn.preprocessing import PolynomialFeatures
+# Startup phase timings, imported first
+import startup
+
+# Standard library
+import copy
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
 
 # Dash
 import dash
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
+import flask
 import dash_core_components as dcc
 import dash_html_components as html
 
-from my_config import host_name, port, database_name, username, pw
+import settings
+from db import sql_queries, read_columns, iter_query_frames
+from loader import DatasetLoader, create_loader, create_sketches
+from dataset import DatasetRefresher
+from shared_dataset import SharedDatasetReader
+from pushdown import PushdownAggregator, normalize_filter_state, filter_conditions
+from lru_cache import LRUCache
+from coalesce import Coalescer, SingleFlight, REQUESTS_COALESCED
+from prediction import RegistryEngine, FEATURES
+from model_registry import ModelRegistry
+from training import ModelTrainer
+import capacity
+import serialization
+import instrumentation
+from columns import GROUP_NAMES, METRIC_COLUMNS
+from timeseries import TimeSeriesLoader
+from breakdown import BreakdownEngine, DIMENSIONS
+from sketch import STATISTICS
+import export
+
+startup.mark('imports')
+
+logger = logging.getLogger(__name__)
 
 # Query for the whole database
 query = '''SELECT group_name, AVG(metrics.du_disk_usage_value) AS du_disk_usage_value, AVG(metrics.nd_cg_cpu_visibletotal_value) AS nd_cg_cpu_visibletotal_value, AVG(metrics.nd_cg_mem_visibletotal_value) AS nd_cg_mem_visibletotal_value, AVG(metrics.nd_cg_net_eth0_received_value) AS nd_cg_net_eth0_received_value, AVG(metrics.nd_cg_net_eth0_sent_value) AS nd_cg_net_eth0_sent_value, AVG(metrics.nd_cg_net_eth0_visibletotal_value) AS nd_cg_net_eth0_visibletotal_value, parameters.application_instances_value, parameters.application_case_value, parameters.application_metric_count_value, parameters.application_labels_value, parameters.cortex_number_of_nginx_value, parameters.cortex_number_of_distributor_value, parameters.cortex_number_of_ingester_value, parameters.cortex_blocks_storage_tsdb_block_ranges_period_value, parameters.cortex_blocks_storage_tsdb_retention_period_value, parameters.cortex_blocks_storage_tsdb_wal_compression_value, parameters.cortex_compactor_blocks_ranges_value
@@ -56,25 +72,25 @@ axis_dictionary = {
     "cortex_compactor_blocks_ranges_value": "TSDB Compactor Block"
 }
 
-# SQL query - parameters, metrics table
-def sql_queries(query):
+# Figure with a message instead of a plot
+def message_plot(text):
+    import plotly.graph_objects as go
 
-    # Connecting to the PostgreSQL server
-    connect = psycopg2.connect(host=host_name, port=port, database=database_name, user=username, password=pw)
+    fig = go.Figure().add_annotation(x=3.5, y=2.5, text=text, font=dict(family="sans serif", size=25, color="crimson"), showarrow=False, yshift=10)
+    fig.update_layout(height=500, width=1850)
 
-    read_data = pd.read_sql_query(query, con=connect)
-    
-    # Closing connection
-    connect.close()
-    
-    return read_data
+    return fig
 
 # Bar plot creation:
-def create_bar_plot(plot_data, color, y_axis):
+def create_bar_plot(plot_data, color, y_axis, aggregated=False, statistic='mean'):
+    # Plotting libraries are imported on the first plot
+    import plotly.express as px
+
     try:
-        # Mean calculation
-        plot_data = plot_data.groupby(['group_name', color]).mean()
-        plot_data = plot_data.reset_index()
+        # Mean calculation, unless the data is already averaged per group and color
+        if not aggregated:
+            plot_data = plot_data.groupby(['group_name', color], observed=True).mean(numeric_only=True)
+            plot_data = plot_data.reset_index()
 
         # Delete N/A values
         plot_data = plot_data[plot_data[color].notna()]
@@ -87,24 +103,28 @@ def create_bar_plot(plot_data, color, y_axis):
 
         # Creating plotting area
         fig = px.bar(plot_data, y=y_axis, x='group_name', color=color, barmode="group", hover_name=color,
-                labels={color: axis_dictionary[color], y_axis: axis_dictionary[y_axis], 'group_name': axis_dictionary['group_name']}, 
-                template="simple_white",
+                labels={color: axis_dictionary[color], y_axis: axis_dictionary[y_axis] + ('' if statistic == 'mean' else ' - ' + statistic), 'group_name': axis_dictionary['group_name']}, 
+                # Shared template with the fonts and axis lines, built once
+                template=serialization.bar_template(),
                 color_discrete_sequence=px.colors.qualitative.G10
         )
-        fig.update_layout(legend_font={"size": 14}, font_size=14)
-        fig.update_yaxes(linewidth=2, linecolor='black', title_font = {"size": 16}, showgrid=True)
-        fig.update_xaxes(linewidth=2, linecolor='black', title_font = {"size": 16}, type='category', categoryorder='category ascending')
+        fig.update_xaxes(type='category', categoryorder='category ascending')
+
+        fig.update_layout(height=500, width=1850)
 
     except:
         # If there is no data to display replace plot with the text 'No Data to Display'
-        fig = go.Figure().add_annotation(x=3.5, y=2.5, text="No Data to Display", font=dict(family="sans serif", size=25, color="crimson"), showarrow=False, yshift=10)
-    
-    fig.update_layout(height=500, width=1850)
+        fig = message_plot("No Data to Display")
 
     return fig
 
 # Filtering plot data, using the filter fields, blocking X axis
-def filtering(data, x_axis, application_labels, metric_count_series, application_case_series, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_retention_period, tsdb_wal_compression, tsdb_block_ranges_period):
+def filtering(data, x_axis, application_labels, metric_count_series, application_case_series, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_retention_period, tsdb_wal_compression, tsdb_block_ranges_period, index=None):
+
+    # With the bitmap index of the data, all filters are combined first and the rows taken once
+    if index is not None:
+        selections = filter_selections(x_axis, application_labels, metric_count_series, application_case_series, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_retention_period, tsdb_wal_compression, tsdb_block_ranges_period)
+        return index.take(data, selections)
 
     # Create plot dataframe from the original one
     plot_data = data
@@ -140,47 +160,101 @@ def filtering(data, x_axis, application_labels, metric_count_series, application
         plot_data = plot_data[plot_data.cortex_blocks_storage_tsdb_block_ranges_period_value.isin(tsdb_block_ranges_period)] 
 
     return plot_data
+
+# Active filters as {column: selected values}, the filter of the X axis column is not applied
+def filter_selections(x_axis, application_labels, metric_count_series, application_case_series, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_retention_period, tsdb_wal_compression, tsdb_block_ranges_period):
+    selections = {
+        'application_labels_value': application_labels,
+        'application_metric_count_value': metric_count_series,
+        'application_case_value': application_case_series,
+        'cortex_number_of_nginx_value': nginx,
+        'cortex_number_of_distributor_value': distributor,
+        'cortex_number_of_ingester_value': ingester,
+        'cortex_compactor_blocks_ranges_value': tsdb_compactor_blocks_ranges,
+        'cortex_blocks_storage_tsdb_retention_period_value': tsdb_retention_period,
+        'cortex_blocks_storage_tsdb_wal_compression_value': tsdb_wal_compression,
+        'cortex_blocks_storage_tsdb_block_ranges_period_value': tsdb_block_ranges_period
+    }
+
+    return {column: values for column, values in selections.items() if len(values) != 0 and column != x_axis}
     
 # INIT
-# Pulling data
-data = sql_queries(query)
-
-# Filters sorting and value creating
-# Categorical data casting
-data['application_metric_count_value'] = data['application_metric_count_value'].astype("category")
-data['application_labels_value'] = data['application_labels_value'].astype(int)
-data['application_labels_value'] = data['application_labels_value'].astype("category")
-
-application_labels = sorted(set(data['application_labels_value']))
-metric_count = sorted(set(data['application_metric_count_value']))
-application_case = sorted(set(data['application_case_value']))
-number_of_nginx = sorted(set(data['cortex_number_of_nginx_value'].drop_duplicates()))
-number_of_distributor = sorted(set(data['cortex_number_of_distributor_value'].drop_duplicates()))
-number_of_ingester = sorted(set(data['cortex_number_of_ingester_value'].drop_duplicates()))
-tsdb_block_ranges_period = sorted(set(data['cortex_blocks_storage_tsdb_block_ranges_period_value'].drop_duplicates()))
-tsdb_retention_period = sorted(set(data['cortex_blocks_storage_tsdb_retention_period_value'].drop_duplicates()))
-compactor_blocks_ranges = sorted(set(data['cortex_compactor_blocks_ranges_value'].drop_duplicates()))
-
-# Sorting data by application name
-data = data.sort_values(by=['group_name'])
-
-# Importing models
-linear_regression_nd_cg_cpu_visibletotal_value_cortex_distributor_model = pickle.load(open('linear_regression_nd_cg_cpu_visibletotal_value_cortex_distributor', 'rb'))
-linear_regression_nd_cg_cpu_visibletotal_value_cortex_ingester_model = pickle.load(open('linear_regression_nd_cg_cpu_visibletotal_value_cortex_ingester', 'rb'))
-linear_regression_nd_cg_cpu_visibletotal_value_prometheus_server_model = pickle.load(open('linear_regression_nd_cg_cpu_visibletotal_value_prometheus_server', 'rb'))
-
-linear_regression_nd_cg_mem_usage_visibletotal_value_cortex_ingester_model = pickle.load(open('linear_regression_nd_cg_mem_usage_visibletotal_value_cortex_ingester', 'rb'))
-linear_regression_nd_cg_mem_usage_visibletotal_value_prometheus_server_model = pickle.load(open('linear_regression_nd_cg_mem_usage_visibletotal_value_prometheus_server', 'rb'))
-
-linear_regression_nd_cg_net_eth0_visibletotal_value_cortex_distributor_model = pickle.load(open('linear_regression_nd_cg_net_eth0_visibletotal_value_cortex_distributor', 'rb'))
-linear_regression_nd_cg_net_eth0_visibletotal_value_cortex_ingester_model = pickle.load(open('linear_regression_nd_cg_net_eth0_visibletotal_value_cortex_ingester', 'rb'))
-linear_regression_nd_cg_net_eth0_visibletotal_value_prometheus_server_model = pickle.load(open('linear_regression_nd_cg_net_eth0_visibletotal_value_prometheus_server', 'rb'))
+# Quantile sketches per configuration for the percentile statistics, refreshed with the dataset
+sketches = create_sketches()
+
+# Optional SQL pushdown of the filters and the aggregation
+pushdown = PushdownAggregator(sql_queries, settings.pushdown_cache_size, settings.pushdown_cache_ttl) if settings.pushdown_enabled else None
+
+# Loading the first dataset, then refreshing it in the background
+if settings.shared_dataset:
+    # Attaching to the aggregates of the publisher process, checking for new generations and for the sketches it persisted
+    loader = DatasetLoader(SharedDatasetReader(settings.shared_dataset_dir).load, sketches.reload if sketches is not None else None)
+    refresher = DatasetRefresher(loader.load, settings.shared_dataset_poll_interval)
+else:
+    # From the snapshot and the rows newer than it if it is enabled, with the async fan-out per application group
+    refresher = DatasetRefresher(create_loader(sketches).load, settings.refresh_interval)
+refresher.listeners.append(lambda dataset: startup.mark('data_ready'))
+
+# Columnar copy of every published dataset for the breakdown tab
+breakdowns = BreakdownEngine(settings.breakdown_threads, settings.breakdown_cache_size)
+refresher.listeners.append(breakdowns.load)
+
+if settings.autostart:
+    if settings.fast_start:
+        # The layout is served right away, the first dataset is loaded by the background thread
+        refresher.request_refresh()
+    else:
+        refresher.refresh()
+    refresher.start()
+
+# Version of the published dataset, None while the first one is loading
+def dataset_version():
+    return None if refresher.current is None else refresher.current.version
+
+# Dropdown component ids and the column of their options
+dropdown_columns = {
+    'metric_count_series-dropdown': 'application_metric_count_value',
+    'application_labels-dropdown': 'application_labels_value',
+    'type_of_metrics-dropdown': 'application_case_value',
+    'nginx-dropdown': 'cortex_number_of_nginx_value',
+    'distributor-dropdown': 'cortex_number_of_distributor_value',
+    'ingester-dropdown': 'cortex_number_of_ingester_value',
+    'tsdb_compactor_blocks_ranges-dropdown': 'cortex_compactor_blocks_ranges_value',
+    'tsdb_retention_period-dropdown': 'cortex_blocks_storage_tsdb_retention_period_value',
+    'tsdb_block_ranges_period-dropdown': 'cortex_blocks_storage_tsdb_block_ranges_period_value'
+}
+
+# Dropdown options of a dataset, empty while the first one is loading
+def dropdown_options(dataset, column):
+    if dataset is None:
+        return []
+
+    return [{'value': x, 'label': x} for x in dataset.options[column]]
+
+# Regression models, loaded on first use and reloaded when their file changes
+model_registry = ModelRegistry(settings.model_dir, settings.model_watch_interval)
+model_registry.start_watching()
+
+# Refitted models from the loaded dataset, published to the registry (the first dataset may already be published)
+if settings.retrain_models:
+    trainer = ModelTrainer(model_registry, settings.retrain_degree)
+    refresher.listeners.append(trainer.update)
+    if refresher.current is not None:
+        trainer.update(refresher.current)
+
+# All models and the disk formulas in one weight matrix, rebuilt when a model changes
+prediction_engine = RegistryEngine(model_registry)
 
 # Create Dash app
-app = dash.Dash()
+# The assets (client-side callbacks) are next to this file, also when it is imported by a WSGI server
+app = dash.Dash(assets_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets'))
+startup.mark('app_created')
+
+# JSON engine of the callback responses
+serialization.configure()
 
 # Create app layout
-app.layout = html.Div(children=[
+layout = html.Div(children=[
 
     #######################################################################################################
     #                                           Title                                                     #
@@ -189,6 +263,12 @@ app.layout = html.Div(children=[
         children="Low Footprint Data Ingestion and Analytics 🖥️",
         style={'textAlign': 'center','font-size': '36px'}),
 
+    # Version of the displayed dataset, checked periodically for background refreshes
+    dcc.Store(id='dataset-version', data=dataset_version()),
+    # Data cube of the client-side mode, sent once per dataset version
+    dcc.Store(id='cube-store'),
+    dcc.Interval(id='dataset-refresh-interval', interval=(settings.options_poll_interval if refresher.current else settings.warmup_poll_interval) * 1000),
+
     #######################################################################################################
     #                                           Filter(s)                                                 #
     #######################################################################################################
@@ -201,9 +281,7 @@ app.layout = html.Div(children=[
     html.Div(
         children=[
             html.Div(children="Number of time series"),
-            dcc.Dropdown(id='metric_count_series-dropdown', options=[
-                {'value': x, 'label': x} for x in metric_count
-            ], multi=True, value=[30000]),
+            dcc.Dropdown(id='metric_count_series-dropdown', options=dropdown_options(refresher.current, dropdown_columns['metric_count_series-dropdown']), multi=True, value=[30000]),
         ],
         style={'width': '33%',
                'display': 'inline-block',
@@ -213,9 +291,7 @@ app.layout = html.Div(children=[
     html.Div(
         children=[
             html.Div(children="Number of labels"),
-            dcc.Dropdown(id='application_labels-dropdown', options=[
-                {'value': x, 'label': x} for x in application_labels
-            ], multi=True, value=[20]),
+            dcc.Dropdown(id='application_labels-dropdown', options=dropdown_options(refresher.current, dropdown_columns['application_labels-dropdown']), multi=True, value=[20]),
         ],
         style={'width': '33%',
                'display': 'inline-block',
@@ -225,9 +301,7 @@ app.layout = html.Div(children=[
     html.Div(
         children=[
             html.Div(children="Type of metrics"),
-            dcc.Dropdown(id='type_of_metrics-dropdown', options=[
-                {'value': x, 'label': x} for x in application_case
-            ], multi=True, value=['quasi_real']),
+            dcc.Dropdown(id='type_of_metrics-dropdown', options=dropdown_options(refresher.current, dropdown_columns['type_of_metrics-dropdown']), multi=True, value=['quasi_real']),
         ],
         style={'width': '33%',
                'display': 'inline-block',
@@ -237,9 +311,7 @@ app.layout = html.Div(children=[
     html.Div(
         children=[
             html.Div(children="Number of nginx"),
-            dcc.Dropdown(id='nginx-dropdown', options=[
-                {'value': x, 'label': x} for x in number_of_nginx 
-            ], multi=True, value=[1]),
+            dcc.Dropdown(id='nginx-dropdown', options=dropdown_options(refresher.current, dropdown_columns['nginx-dropdown']), multi=True, value=[1]),
         ],
         style={'width': '33%',
                'display': 'inline-block',
@@ -249,9 +321,7 @@ app.layout = html.Div(children=[
     html.Div(
         children=[
             html.Div(children="Number of distributor"),
-            dcc.Dropdown(id='distributor-dropdown', options=[
-                {'value': x, 'label': x} for x in number_of_distributor
-            ], multi=True, value=[1]),
+            dcc.Dropdown(id='distributor-dropdown', options=dropdown_options(refresher.current, dropdown_columns['distributor-dropdown']), multi=True, value=[1]),
         ],
         style={'width': '33%',
                'display': 'inline-block',
@@ -261,9 +331,7 @@ app.layout = html.Div(children=[
     html.Div(
         children=[
             html.Div(children="Number of ingester"),
-            dcc.Dropdown(id='ingester-dropdown', options=[
-                {'value': x, 'label': x} for x in number_of_ingester
-            ], multi=True, value=[2]),
+            dcc.Dropdown(id='ingester-dropdown', options=dropdown_options(refresher.current, dropdown_columns['ingester-dropdown']), multi=True, value=[2]),
         ],
         style={'width': '33%',
                'display': 'inline-block',
@@ -273,9 +341,7 @@ app.layout = html.Div(children=[
     html.Div(
         children=[
             html.Div(children="Compactor Blocks Ranges"),
-            dcc.Dropdown(id='tsdb_compactor_blocks_ranges-dropdown', options=[
-                {'value': x, 'label': x} for x in compactor_blocks_ranges
-            ], multi=True, value=[]),
+            dcc.Dropdown(id='tsdb_compactor_blocks_ranges-dropdown', options=dropdown_options(refresher.current, dropdown_columns['tsdb_compactor_blocks_ranges-dropdown']), multi=True, value=[]),
         ],
         style={'width': '33%',
                'display': 'inline-block',
@@ -285,9 +351,7 @@ app.layout = html.Div(children=[
     html.Div(
         children=[
             html.Div(children="TSDB Retention Period"),
-            dcc.Dropdown(id='tsdb_retention_period-dropdown', options=[
-                {'value': x, 'label': x} for x in tsdb_retention_period
-            ], multi=True, value=[21600]),
+            dcc.Dropdown(id='tsdb_retention_period-dropdown', options=dropdown_options(refresher.current, dropdown_columns['tsdb_retention_period-dropdown']), multi=True, value=[21600]),
         ],
         style={'width': '33%',
                'display': 'inline-block',
@@ -310,9 +374,7 @@ app.layout = html.Div(children=[
     html.Div(
         children=[
             html.Div(children="TSDB Block Ranges Period"),
-            dcc.Dropdown(id='tsdb_block_ranges_period-dropdown', options=[
-                {'value': x, 'label': x} for x in tsdb_block_ranges_period
-            ], multi=True, value=[7200]),
+            dcc.Dropdown(id='tsdb_block_ranges_period-dropdown', options=dropdown_options(refresher.current, dropdown_columns['tsdb_block_ranges_period-dropdown']), multi=True, value=[7200]),
         ],
         style={'width': '33%',
                'display': 'inline-block',
@@ -343,6 +405,37 @@ app.layout = html.Div(children=[
                 ],
                 value='cortex_blocks_storage_tsdb_wal_compression_value'
             ),
+            # Statistic of the bars, the percentiles and the maximum come from the quantile sketches
+            dcc.RadioItems(
+                id='statistic-radio',
+                options=[{'label': statistic.capitalize() + ' ', 'value': statistic} for statistic in (STATISTICS if sketches is not None and not settings.clientside_plots else ['mean'])],
+                value='mean'
+            ),
+        ],
+        style={'width': '100%',
+            'textAlign': 'center',
+            'fontSize': 17}),
+
+    # Download of the data behind the charts, the link follows the filters and the X axis
+    html.Div(
+        children=[
+            dcc.RadioItems(
+                id='export_kind-radio',
+                options=[
+                    {'label': 'Configurations ', 'value': 'configurations'},
+                    {'label': 'Aggregates ', 'value': 'aggregates'},
+                    {'label': 'Raw measurements ', 'value': 'raw'}
+                ],
+                value='configurations',
+                style={'display': 'inline-block'}
+            ),
+            dcc.RadioItems(
+                id='export_format-radio',
+                options=[{'label': format.upper() + ' ', 'value': format} for format in export.FORMATS],
+                value='csv',
+                style={'display': 'inline-block', 'marginLeft': '30px'}
+            ),
+            html.A('Download', id='export-link', href='/api/export', style={'marginLeft': '30px'}),
         ],
         style={'width': '100%',
             'textAlign': 'center',
@@ -353,18 +446,18 @@ app.layout = html.Div(children=[
 
 
     # Tabs component
-    dcc.Tabs(children=[
+    dcc.Tabs(id='tabs', value='cpu', children=[
 
         #######################################################################################################
         #                                           Tab: 1                                                    #
         #######################################################################################################
-        dcc.Tab(label='CPU', children=[
+        dcc.Tab(label='CPU', value='cpu', children=[
 
             # Placeholder
             html.Br(),
 
-            # Box or violin plot
-            dcc.Graph(id="tab1_plot")
+            # Box or violin plot, with a spinner while it is computed
+            dcc.Loading(dcc.Graph(id="tab1_plot"))
         ]),
 
         #######################################################################################################
@@ -375,8 +468,8 @@ app.layout = html.Div(children=[
             # Placeholder
             html.Br(),
 
-            # Box or violin plot
-            dcc.Graph(id="tab2_plot")
+            # Box or violin plot, with a spinner while it is computed
+            dcc.Loading(dcc.Graph(id="tab2_plot"))
         ]),
 
         #######################################################################################################
@@ -387,8 +480,8 @@ app.layout = html.Div(children=[
             # Placeholder
             html.Br(),
 
-            # Box or violin plot
-            dcc.Graph(id="tab3_plot")
+            # Box or violin plot, with a spinner while it is computed
+            dcc.Loading(dcc.Graph(id="tab3_plot"))
         ]),
 
         #######################################################################################################
@@ -422,8 +515,98 @@ app.layout = html.Div(children=[
             html.Br(),
 
 
-            # Box or violin plot
-            dcc.Graph(id="tab4_plot"),
+            # Box or violin plot, with a spinner while it is computed
+            dcc.Loading(dcc.Graph(id="tab4_plot")),
+
+        ]),
+
+        #######################################################################################################
+        #                                           Tab: Time series                                          #
+        #######################################################################################################
+        dcc.Tab(label='Time series', value='timeseries', children=[
+
+            # Placeholder
+            html.Br(),
+
+            # Application and metric of the drill-down, the configurations are selected by the filters
+            html.Div(
+                children=[
+                    html.H2(children="Application's group"),
+                    dcc.Dropdown(id='timeseries_group-dropdown', options=[{'label': group_name, 'value': group_name} for group_name in GROUP_NAMES], value='cortex ingester', clearable=False),
+                ],
+                style={'width': '33%',
+                    'display': 'inline-block',
+                    'fontSize': 18}),
+
+            html.Div(
+                children=[
+                    html.H2(children="Metric"),
+                    dcc.Dropdown(id='timeseries_metric-dropdown', options=[{'label': axis_dictionary[metric], 'value': metric} for metric in METRIC_COLUMNS], value='nd_cg_mem_visibletotal_value', clearable=False),
+                ],
+                style={'width': '33%',
+                    'display': 'inline-block',
+                    'fontSize': 18}),
+
+            # Placeholder
+            html.Br(),
+            html.Br(),
+
+            # Downsampled series of the visible time range, with a spinner while it is queried
+            dcc.Loading(dcc.Graph(id="timeseries_plot")),
+
+        ]),
+
+        #######################################################################################################
+        #                                           Tab: Breakdown                                            #
+        #######################################################################################################
+        dcc.Tab(label='Breakdown', children=[
+
+            # Placeholder
+            html.Br(),
+
+            # Metric and the two dimensions of the heatmap, the configurations are selected by the filters
+            html.Div(
+                children=[
+                    html.H2(children="Metric"),
+                    dcc.Dropdown(id='breakdown_metric-dropdown', options=[{'label': axis_dictionary[metric], 'value': metric} for metric in METRIC_COLUMNS], value='nd_cg_cpu_visibletotal_value', clearable=False),
+                ],
+                style={'width': '25%',
+                    'display': 'inline-block',
+                    'fontSize': 18}),
+
+            html.Div(
+                children=[
+                    html.H2(children="Rows"),
+                    dcc.Dropdown(id='breakdown_rows-dropdown', options=[{'label': axis_dictionary.get(column, column), 'value': column} for column in DIMENSIONS], value='cortex_number_of_ingester_value', clearable=False),
+                ],
+                style={'width': '25%',
+                    'display': 'inline-block',
+                    'fontSize': 18}),
+
+            html.Div(
+                children=[
+                    html.H2(children="Columns"),
+                    dcc.Dropdown(id='breakdown_columns-dropdown', options=[{'label': axis_dictionary.get(column, column), 'value': column} for column in DIMENSIONS], value='application_metric_count_value', clearable=False),
+                ],
+                style={'width': '25%',
+                    'display': 'inline-block',
+                    'fontSize': 18}),
+
+            html.Div(
+                children=[
+                    html.H2(children="Application's group"),
+                    dcc.Dropdown(id='breakdown_group-dropdown', options=[{'label': group_name, 'value': group_name} for group_name in GROUP_NAMES], value=['cortex ingester'], multi=True, placeholder='All applications'),
+                ],
+                style={'width': '25%',
+                    'display': 'inline-block',
+                    'fontSize': 18}),
+
+            # Placeholder
+            html.Br(),
+            html.Br(),
+
+            # Heatmap of the averages, with a spinner while it is computed
+            dcc.Loading(dcc.Graph(id="breakdown_plot")),
 
         ]),
 
@@ -614,48 +797,485 @@ app.layout = html.Div(children=[
                 html.Br(),
             ],
             style={'width': '100%', 'textAlign': 'center', 'fontSize': 19}), 
+
+            html.Hr(),
+
+            # Capacity planning
+            html.Div(children=[
+                html.H2(children="Capacity planning"),
+                html.H4(children="Cheapest configurations for the number of time series and labels above, within the budgets"),
+
+                html.Div(children=[
+                    html.H3(children="CPU budget (%)"),
+                    dcc.Input(id="cpu_budget-input", type="number", placeholder="No limit", min=0),
+                ],
+                style={'width': '20%', 'display': 'inline-block'}),
+
+                html.Div(children=[
+                    html.H3(children="Memory budget (MiB)"),
+                    dcc.Input(id="memory_budget-input", type="number", placeholder="No limit", min=0),
+                ],
+                style={'width': '20%', 'display': 'inline-block'}),
+
+                html.Div(children=[
+                    html.H3(children="Network budget (kilobit/s)"),
+                    dcc.Input(id="network_budget-input", type="number", placeholder="No limit", min=0),
+                ],
+                style={'width': '20%', 'display': 'inline-block'}),
+
+                html.Br(),
+                html.Br(),
+                html.Button('Find configurations', id='capacity_sweep-button', n_clicks=0),
+
+                # Placeholder
+                html.Br(),
+                html.Br(),
+
+                html.Div(id='capacity_sweep-output'),
+            ],
+            style={'width': '100%', 'textAlign': 'center', 'fontSize': 18}),
         ])
     ])
 ])
 
+# Static tree with the dropdown options, version and poll interval of a dataset, one copy per version
+layout_copies = LRUCache(1)
+
+def dataset_layout(dataset):
+    if dataset is None:
+        return layout
+
+    tree = layout_copies.get(dataset.version)
+    if tree is None:
+        tree = copy.deepcopy(layout)
+        for dropdown_id, column in dropdown_columns.items():
+            tree[dropdown_id].options = dropdown_options(dataset, column)
+        tree['dataset-version'].data = dataset.version
+        tree['dataset-refresh-interval'].interval = settings.options_poll_interval * 1000
+        layout_copies.put(dataset.version, tree)
+
+    return tree
+
+# Layout of a page load: the tree of the current dataset and the id of the browser tab, for coalescing its callback requests
+def serve_layout():
+    return html.Div([dcc.Store(id='session-id', data=uuid.uuid4().hex), dataset_layout(refresher.current)])
+
+app.layout = serve_layout
+startup.mark('layout_ready')
+
 @app.callback(
+    [Output(component_id=dropdown_id, component_property='options') for dropdown_id in dropdown_columns] +
+    [
+        Output(component_id='dataset-version', component_property='data'),
+        Output(component_id='dataset-refresh-interval', component_property='interval')
+    ],
+    [Input(component_id='dataset-refresh-interval', component_property='n_intervals')],
+    [State(component_id='dataset-version', component_property='data')]
+)
+@instrumentation.timed_callback
+def refresh_dropdown_options(n_intervals, version):
+    dataset = refresher.current
+
+    # Nothing to do until a new dataset is published
+    if dataset is None or dataset.version == version:
+        raise PreventUpdate
+
+    # After the warm-up the browser checks for new datasets less often
+    return [dropdown_options(dataset, column) for column in dropdown_columns.values()] + [dataset.version, settings.options_poll_interval * 1000]
+
+# On demand refresh of the dataset, e.g. after a new benchmark run
+@app.server.route('/refresh', methods=['POST'])
+def request_refresh():
+    refresher.request_refresh()
+
+    return flask.jsonify({'version': dataset_version(), 'status': 'refresh requested'}), 202
+
+# Time to first byte
+@app.server.after_request
+def mark_first_response(response):
+    startup.mark('first_response')
+
+    return response
+
+# Compressed responses for clients accepting gzip
+app.server.after_request(serialization.compress_response)
+
+# Startup phase timings
+@app.server.route('/api/startup')
+def startup_report():
+    return flask.jsonify(startup.report())
+
+# Filter dropdowns, inputs of every bar plot callback
+filter_inputs = [
+    Input(component_id='application_labels-dropdown', component_property='value'),
+    Input(component_id='metric_count_series-dropdown', component_property='value'),
+    Input(component_id='type_of_metrics-dropdown', component_property='value'),
+    Input(component_id='tsdb_retention_period-dropdown', component_property='value'),
+    Input(component_id='nginx-dropdown', component_property='value'),
+    Input(component_id='distributor-dropdown', component_property='value'),
+    Input(component_id='ingester-dropdown', component_property='value'),
+    Input(component_id='tsdb_compactor_blocks_ranges-dropdown', component_property='value'),
+    Input(component_id='tsdb_wal_compression-dropdown', component_property='value'),
+    Input(component_id='tsdb_block_ranges_period-dropdown', component_property='value')
+]
+
+# Y axes of the CPU, Disk and Memory tabs
+bar_plot_y_axes = ['nd_cg_cpu_visibletotal_value', 'du_disk_usage_value', 'nd_cg_mem_visibletotal_value']
+
+# Dataset columns of the filter inputs, in the same order
+filter_input_columns = [
+    'application_labels_value',
+    'application_metric_count_value',
+    'application_case_value',
+    'cortex_blocks_storage_tsdb_retention_period_value',
+    'cortex_number_of_nginx_value',
+    'cortex_number_of_distributor_value',
+    'cortex_number_of_ingester_value',
+    'cortex_compactor_blocks_ranges_value',
+    'cortex_blocks_storage_tsdb_wal_compression_value',
+    'cortex_blocks_storage_tsdb_block_ranges_period_value'
+]
+
+# In the client-side mode the browser builds the bar plots, their server callbacks are not registered
+def plot_callback(*args):
+    if settings.clientside_plots:
+        return lambda function: function
+
+    return app.callback(*args)
+
+# Figures keyed by (dataset version, normalized filter state, Y axis), stored as (compact figure dictionary, serialized size)
+figure_cache = LRUCache(settings.figure_cache_size, ttl=settings.pushdown_cache_ttl if pushdown is not None else None, max_bytes=settings.figure_cache_max_bytes, sizeof=lambda entry: entry[1])
+
+# Bursts of filter changes of a browser tab, and identical figure computations running at the same time
+coalescer = Coalescer(settings.coalesce_window)
+figure_flights = SingleFlight()
+
+# Averaged plot data keyed by (dataset version, normalized filter state), shared by the bar plot callbacks
+plot_data_cache = LRUCache(settings.plot_data_cache_size)
+
+# Averaged plot data of a filter state, or the statistic of the sketches of its configurations
+# Stages timed under the callback name: the index lookup of the filter state, then the roll-up
+def aggregated_plot_data(dataset, x_axis, selections, statistic='mean', callback='aggregated_plot_data'):
+    if statistic != 'mean':
+        sketch_set = sketches.current
+        key = (('sketches', sketch_set.version), statistic, normalize_filter_state(x_axis, selections))
+        plot_data = plot_data_cache.get(key)
+
+        if plot_data is None:
+            with instrumentation.stage(callback, 'filter'):
+                sliced = sketch_set.slice(selections)
+            with instrumentation.stage(callback, 'aggregate'):
+                plot_data = sketch_set.rollup_slice(sliced, x_axis, statistic)
+            plot_data_cache.put(key, plot_data)
+
+        return plot_data
+
+    if pushdown is not None:
+        # In the database, only the aggregated rows come back
+        with instrumentation.stage(callback, 'aggregate'):
+            return pushdown.aggregate(x_axis, selections)
+
+    key = (dataset.version, normalize_filter_state(x_axis, selections))
+    plot_data = plot_data_cache.get(key)
+
+    if plot_data is None:
+        # Slicing and rolling up the cube of the dataset
+        with instrumentation.stage(callback, 'filter'):
+            sliced = dataset.cube.slice(selections)
+        with instrumentation.stage(callback, 'aggregate'):
+            plot_data = dataset.cube.rollup_slice(sliced, x_axis)
+        plot_data_cache.put(key, plot_data)
+
+    return plot_data
+
+# Bar plots of the Y axes, built only on a figure cache miss, stages are timed under the callback name
+def cached_bar_plots(x_axis, y_axes, selections, callback='refresh_plots', ticket=None, statistic='mean'):
+
+    # Reading the published dataset once, a background refresh can not change it under us
+    dataset = refresher.current
+
+    # Loading state until the warm-up publishes the first dataset, the figures are refreshed with its version
+    if dataset is None and pushdown is None:
+        return [message_plot("Loading data...") for y_axis in y_axes]
+
+    if statistic != 'mean' and (sketches is None or sketches.current is None):
+        return [message_plot("Percentiles are not available") for y_axis in y_axes]
+
+    version = None if dataset is None else dataset.version
+    if statistic != 'mean':
+        version = (version, sketches.current.version)
+    state = normalize_filter_state(x_axis, selections)
+
+    entries = [figure_cache.get((version, state, statistic, y_axis)) for y_axis in y_axes]
+
+    if None in entries:
+        # Waiting for the rest of a burst of filter changes, only the last request of the tab computes
+        coalescer.settle(ticket)
+
+        def build():
+            figures = []
+            plot_data = None
+            for y_axis in y_axes:
+                # Figures of the Y axes another request cached in the meantime
+                entry = figure_cache.get((version, state, statistic, y_axis))
+
+                if entry is None:
+                    if plot_data is None:
+                        plot_data = aggregated_plot_data(dataset, x_axis, selections, statistic, callback)
+
+                    with instrumentation.stage(callback, 'figure'):
+                        figure = create_bar_plot(plot_data, x_axis, y_axis, aggregated=True, statistic=statistic)
+                    with instrumentation.stage(callback, 'serialize'):
+                        # Typed arrays, and the shared template of the bar plots (message plots keep their own)
+                        figure_payload = serialization.figure_dict(figure, template=serialization.bar_template() if figure.data else None)
+                        entry = (figure_payload, len(serialization.dumps(figure_payload)))
+                    figure_cache.put((version, state, statistic, y_axis), entry)
+
+                figures.append(entry)
+
+            return figures
+
+        # One computation for the identical requests in flight, of any tab
+        entries, shared = figure_flights.do((version, state, statistic, tuple(y_axes)), build)
+        if shared:
+            REQUESTS_COALESCED.inc(callback=callback, reason='shared')
+
+        # The figures are cached, the response of a superseded request is dropped
+        coalescer.check(ticket)
+
+    startup.mark('first_figure')
+
+    return [entry[0] for entry in entries]
+
+# CPU, Disk and Memory tabs, the Network Y axis is not an input of them
+@plot_callback(
     [
         Output(component_id='tab1_plot', component_property='figure'),
         Output(component_id='tab2_plot', component_property='figure'),
-        Output(component_id='tab3_plot', component_property='figure'),
-        Output(component_id='tab4_plot', component_property='figure')
+        Output(component_id='tab3_plot', component_property='figure')
     ],
+    [Input(component_id='x_axis-checklist', component_property='value')] +
+    filter_inputs +
     [
-        Input(component_id='x_axis-checklist', component_property='value'),
-        Input(component_id='y_axis-checklist4', component_property='value'),
-        Input(component_id='application_labels-dropdown', component_property='value'),
-        Input(component_id='metric_count_series-dropdown', component_property='value'),
-        Input(component_id='type_of_metrics-dropdown', component_property='value'),
-        Input(component_id='tsdb_retention_period-dropdown', component_property='value'),
-        Input(component_id='nginx-dropdown', component_property='value'),
-        Input(component_id='distributor-dropdown', component_property='value'),
-        Input(component_id='ingester-dropdown', component_property='value'),
-        Input(component_id='tsdb_compactor_blocks_ranges-dropdown', component_property='value'),
-        Input(component_id='tsdb_wal_compression-dropdown', component_property='value'),
-        Input(component_id='tsdb_block_ranges_period-dropdown', component_property='value')
-    ]
+        Input(component_id='dataset-version', component_property='data'),
+        Input(component_id='statistic-radio', component_property='value')
+    ],
+    [State(component_id='session-id', component_property='data')]
 )
-def refresh_plots(x_axis, y_axis4, application_labels, metric_count_series, application_case_series, tsdb_retention_period, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_wal_compression, tsdb_block_ranges_period):
+@instrumentation.timed_callback
+def refresh_plots(x_axis, application_labels, metric_count_series, application_case_series, tsdb_retention_period, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_wal_compression, tsdb_block_ranges_period, dataset_version=None, statistic='mean', session_id=None):
+    ticket = coalescer.begin(session_id, 'refresh_plots')
 
     #### Filtering ####
-    plot_data = filtering(data, x_axis, application_labels, metric_count_series, application_case_series, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_retention_period, tsdb_wal_compression, tsdb_block_ranges_period)
+    selections = filter_selections(x_axis, application_labels, metric_count_series, application_case_series, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_retention_period, tsdb_wal_compression, tsdb_block_ranges_period)
+
+    ####  Ploting  ####
+    fig1, fig2, fig3 = cached_bar_plots(x_axis, bar_plot_y_axes, selections, ticket=ticket, statistic=statistic)
 
-    y_axis1 = 'nd_cg_cpu_visibletotal_value'
-    y_axis2 = 'du_disk_usage_value'
-    y_axis3 = 'nd_cg_mem_visibletotal_value'
+    return fig1, fig2, fig3
+
+# Network tab, the only one depending on its Y axis radio items
+@plot_callback(
+    Output(component_id='tab4_plot', component_property='figure'),
+    [
+        Input(component_id='x_axis-checklist', component_property='value'),
+        Input(component_id='y_axis-checklist4', component_property='value')
+    ] +
+    filter_inputs +
+    [
+        Input(component_id='dataset-version', component_property='data'),
+        Input(component_id='statistic-radio', component_property='value')
+    ],
+    [State(component_id='session-id', component_property='data')]
+)
+@instrumentation.timed_callback
+def refresh_network_plot(x_axis, y_axis4, application_labels, metric_count_series, application_case_series, tsdb_retention_period, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_wal_compression, tsdb_block_ranges_period, dataset_version=None, statistic='mean', session_id=None):
+    ticket = coalescer.begin(session_id, 'refresh_network_plot')
+
+    #### Filtering ####
+    selections = filter_selections(x_axis, application_labels, metric_count_series, application_case_series, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_retention_period, tsdb_wal_compression, tsdb_block_ranges_period)
 
     ####  Ploting  ####
-    fig1 = create_bar_plot(plot_data, x_axis, y_axis1)
-    fig2 = create_bar_plot(plot_data, x_axis, y_axis2)
-    fig3 = create_bar_plot(plot_data, x_axis, y_axis3)
-    fig4 = create_bar_plot(plot_data, x_axis, y_axis4)
+    fig4, = cached_bar_plots(x_axis, [y_axis4], selections, callback='refresh_network_plot', ticket=ticket, statistic=statistic)
+
+    return fig4
+
+# Cube, labels and plot style for the browser, built once per dataset version
+cube_payloads = LRUCache(2)
+
+def cube_payload(dataset):
+    payload = cube_payloads.get(dataset.version)
 
-    return fig1, fig2, fig3, fig4
+    if payload is None:
+        import plotly.express as px
+
+        payload = dataset.cube.to_columns()
+        payload.update(version=dataset.version, filters=filter_input_columns, y_axes=bar_plot_y_axes, labels=axis_dictionary,
+                       colors=px.colors.qualitative.G10, template=serialization.compact(serialization.bar_template().to_plotly_json()))
+        cube_payloads.put(dataset.version, payload)
+
+    return payload
+
+if settings.clientside_plots:
+    @app.callback(
+        Output(component_id='cube-store', component_property='data'),
+        [Input(component_id='dataset-version', component_property='data')]
+    )
+    @instrumentation.timed_callback
+    def refresh_cube_store(dataset_version):
+        dataset = refresher.current
+
+        # Sent again only when a new dataset is published
+        if dataset is None:
+            raise PreventUpdate
+
+        return cube_payload(dataset)
+
+    # Filtering, roll-up and figures in the browser, see assets/clientside.js
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='barPlots'),
+        [
+            Output(component_id='tab1_plot', component_property='figure'),
+            Output(component_id='tab2_plot', component_property='figure'),
+            Output(component_id='tab3_plot', component_property='figure')
+        ],
+        [Input(component_id='x_axis-checklist', component_property='value')] +
+        filter_inputs +
+        [Input(component_id='cube-store', component_property='data')]
+    )
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='networkPlot'),
+        Output(component_id='tab4_plot', component_property='figure'),
+        [
+            Input(component_id='x_axis-checklist', component_property='value'),
+            Input(component_id='y_axis-checklist4', component_property='value')
+        ] +
+        filter_inputs +
+        [Input(component_id='cube-store', component_property='data')]
+    )
+
+# Heatmap of the averages of a metric by two dimensions, the number of configurations on hover
+def create_breakdown_plot(result, metric, rows, columns):
+    import plotly.graph_objects as go
+
+    if len(result) == 0:
+        return message_plot("No Data to Display")
+
+    values = result.pivot(index='row_value', columns='column_value', values='value').sort_index().sort_index(axis=1)
+    configurations = result.pivot(index='row_value', columns='column_value', values='configurations').reindex_like(values)
+
+    # Categorical axes, numeric parameters are not evenly spaced
+    fig = go.Figure(go.Heatmap(x=[str(value) for value in values.columns], y=[str(value) for value in values.index], z=values.to_numpy(),
+                               customdata=configurations.to_numpy(), colorscale='Viridis', colorbar_title_text=axis_dictionary[metric],
+                               hovertemplate=axis_dictionary.get(rows, rows) + '=%{y}<br>' + axis_dictionary.get(columns, columns) + '=%{x}<br>' +
+                                             axis_dictionary[metric] + '=%{z}<br>Configurations=%{customdata}<extra></extra>'))
+    fig.update_layout(template="simple_white", height=500, width=1850, font_size=14,
+                      xaxis_title=axis_dictionary.get(columns, columns), yaxis_title=axis_dictionary.get(rows, rows))
+    fig.update_xaxes(type='category', title_font={"size": 16})
+    fig.update_yaxes(type='category', title_font={"size": 16})
+
+    return fig
+
+@app.callback(
+    Output(component_id='breakdown_plot', component_property='figure'),
+    [
+        Input(component_id='breakdown_metric-dropdown', component_property='value'),
+        Input(component_id='breakdown_rows-dropdown', component_property='value'),
+        Input(component_id='breakdown_columns-dropdown', component_property='value'),
+        Input(component_id='breakdown_group-dropdown', component_property='value')
+    ] +
+    filter_inputs +
+    [Input(component_id='dataset-version', component_property='data')]
+)
+@instrumentation.timed_callback
+def refresh_breakdown_plot(metric, rows, columns, groups, application_labels, metric_count_series, application_case_series, tsdb_retention_period, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_wal_compression, tsdb_block_ranges_period, dataset_version=None):
+    dataset = refresher.current
+    if dataset is None:
+        return message_plot("Loading data...")
+
+    if rows == columns:
+        return message_plot("Select two different dimensions")
+
+    selections = filter_selections(None, application_labels, metric_count_series, application_case_series, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_retention_period, tsdb_wal_compression, tsdb_block_ranges_period)
+
+    with instrumentation.stage('refresh_breakdown_plot', 'aggregate'):
+        result = breakdowns.breakdown(dataset, metric, rows, columns, selections, groups)
+
+    with instrumentation.stage('refresh_breakdown_plot', 'figure'):
+        return create_breakdown_plot(result, metric, rows, columns)
+
+# Time series of the drill-down tab, the bucket width follows the visible time range
+timeseries = TimeSeriesLoader(read_columns if settings.timeseries_enabled else None, settings.timeseries_buckets, settings.timeseries_points, settings.timeseries_cache_size)
+
+# Visible (start, end) in epoch seconds of a zoomed graph, None for the whole run
+def visible_range(relayout_data):
+    import pandas as pd
+
+    if not relayout_data or 'xaxis.range[0]' not in relayout_data:
+        return None
+
+    # Plotly sends the range as UTC date strings
+    return pd.Timestamp(relayout_data['xaxis.range[0]']).timestamp(), pd.Timestamp(relayout_data['xaxis.range[1]']).timestamp()
+
+def create_timeseries_plot(seconds, values, group_name, metric, window, revision):
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    if len(seconds) == 0:
+        return message_plot("No Data to Display")
+
+    # WebGL trace, the point budget keeps it light for the browser
+    fig = go.Figure(go.Scattergl(x=pd.to_datetime(seconds, unit='s'), y=values, mode='lines', name=group_name))
+    fig.update_layout(template="simple_white", height=500, width=1850, font_size=14,
+                      yaxis_title=axis_dictionary[metric], xaxis_title="Time (UTC)",
+                      # Keeping the zoom of the user while the same series is refined
+                      uirevision=revision)
+    fig.update_yaxes(linewidth=2, linecolor='black', title_font={"size": 16}, showgrid=True)
+    fig.update_xaxes(linewidth=2, linecolor='black', title_font={"size": 16})
+
+    if window is not None:
+        fig.update_xaxes(range=[pd.to_datetime(window[0], unit='s'), pd.to_datetime(window[1], unit='s')])
+
+    return fig
+
+@app.callback(
+    Output(component_id='timeseries_plot', component_property='figure'),
+    [
+        Input(component_id='timeseries_group-dropdown', component_property='value'),
+        Input(component_id='timeseries_metric-dropdown', component_property='value'),
+        Input(component_id='timeseries_plot', component_property='relayoutData'),
+        Input(component_id='tabs', component_property='value')
+    ],
+    # The filters are read when the tab is opened, changing them does not query the database for a hidden tab
+    [State(component_id=item.component_id, component_property=item.component_property) for item in filter_inputs]
+)
+@instrumentation.timed_callback
+def refresh_timeseries_plot(group_name, metric, relayout_data, tab, application_labels, metric_count_series, application_case_series, tsdb_retention_period, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_wal_compression, tsdb_block_ranges_period):
+    if tab != 'timeseries' or group_name is None or metric is None:
+        raise PreventUpdate
+
+    if not timeseries.enabled:
+        return message_plot("The time series need a database connection")
+
+    selections = filter_selections(None, application_labels, metric_count_series, application_case_series, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_retention_period, tsdb_wal_compression, tsdb_block_ranges_period)
+
+    # Zooming re-queries only the visible range, other layout changes (e.g. autosize) need no data
+    window = None
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    if triggered == ['timeseries_plot.relayoutData']:
+        window = visible_range(relayout_data)
+        if window is None and 'xaxis.autorange' not in (relayout_data or {}):
+            raise PreventUpdate
+
+    if window is None:
+        seconds, values = timeseries.series(group_name, metric, selections)
+    else:
+        seconds, values = timeseries.series(group_name, metric, selections, *window)
+
+    revision = json.dumps([group_name, metric, normalize_filter_state(None, selections)], default=str)
+
+    return create_timeseries_plot(seconds, values, group_name, metric, window, revision)
 
 @app.callback(
     [
@@ -683,6 +1303,7 @@ def refresh_plots(x_axis, y_axis4, application_labels, metric_count_series, appl
         Input(component_id='tsdb_block_ranges_period-input', component_property='value')
     ]
 )
+@instrumentation.timed_callback
 def linear_regression_calculation(prometheus_wal_compression, application_metric_count, application_labels, number_of_nginx, number_of_distributor, number_of_ingester, tsdb_wal_compression, tsdb_retention_period, tsdb_block_ranges_period):
 
     if (prometheus_wal_compression == None or  application_metric_count == None or  application_labels == None or  number_of_nginx == None or  number_of_distributor == None or  number_of_ingester == None or tsdb_wal_compression == None or tsdb_retention_period == None or tsdb_block_ranges_period == None):
@@ -691,28 +1312,245 @@ def linear_regression_calculation(prometheus_wal_compression, application_metric
 
     Xnew = [[prometheus_wal_compression, application_metric_count, application_labels, number_of_nginx, number_of_distributor, number_of_ingester, tsdb_block_ranges_period, tsdb_retention_period, tsdb_wal_compression]]
 
-    Xnew_disk = [[application_metric_count]]
+    # Every target with one matrix product
+    with instrumentation.stage('linear_regression_calculation', 'predict'):
+        names, predictions = prediction_engine.predict(Xnew)
+    predictions = dict(zip(names, predictions[0]))
 
     # CPU
-    distributor_cpu = 'Distributor: ' + str(round(linear_regression_nd_cg_cpu_visibletotal_value_cortex_distributor_model.predict(Xnew)[0])) + ' %'
-    ingester_cpu = 'Ingester: ' + str(round(linear_regression_nd_cg_cpu_visibletotal_value_cortex_ingester_model.predict(Xnew)[0])) + ' %'
-    prometheus_cpu = 'Prometheus: ' + str(round(linear_regression_nd_cg_cpu_visibletotal_value_prometheus_server_model.predict(Xnew)[0])) + ' %'
+    distributor_cpu = 'Distributor: ' + str(round(predictions['nd_cg_cpu_visibletotal_value_cortex_distributor'])) + ' %'
+    ingester_cpu = 'Ingester: ' + str(round(predictions['nd_cg_cpu_visibletotal_value_cortex_ingester'])) + ' %'
+    prometheus_cpu = 'Prometheus: ' + str(round(predictions['nd_cg_cpu_visibletotal_value_prometheus_server'])) + ' %'
 
     # Disk
-    ingester_disk = 'Ingester: ' + str(round(0.0032 * application_metric_count + 385.74207)) + ' MB'
-    minio_disk = 'Minio: ' + str(round(0.003528 * application_metric_count + 251.671882)) + ' MB'
-    prometheus_disk = 'Prometheus: ' + str(round(0.00496 * application_metric_count - 220.372656)) + ' MB'
+    ingester_disk = 'Ingester: ' + str(round(predictions['du_disk_usage_value_cortex_ingester'])) + ' MB'
+    minio_disk = 'Minio: ' + str(round(predictions['du_disk_usage_value_minio'])) + ' MB'
+    prometheus_disk = 'Prometheus: ' + str(round(predictions['du_disk_usage_value_prometheus_server'])) + ' MB'
 
     # Memory
-    ingester_memory = 'Ingester: ' + str(round(linear_regression_nd_cg_mem_usage_visibletotal_value_cortex_ingester_model.predict(Xnew)[0])) + ' MiB'
-    prometheus_memory = 'Prometheus: ' + str(round(linear_regression_nd_cg_mem_usage_visibletotal_value_prometheus_server_model.predict(Xnew)[0])) + ' MiB'
+    ingester_memory = 'Ingester: ' + str(round(predictions['nd_cg_mem_usage_visibletotal_value_cortex_ingester'])) + ' MiB'
+    prometheus_memory = 'Prometheus: ' + str(round(predictions['nd_cg_mem_usage_visibletotal_value_prometheus_server'])) + ' MiB'
 
     # Network
-    distributor_network = 'Distributor: ' + str(round(linear_regression_nd_cg_net_eth0_visibletotal_value_cortex_distributor_model.predict(Xnew)[0])) + ' kilobit/s'
-    ingester_network = 'Ingester: ' + str(round(linear_regression_nd_cg_net_eth0_visibletotal_value_cortex_ingester_model.predict(Xnew)[0])) + ' kilobit/s'
-    prometheus_network = 'Prometheus: ' + str(round(linear_regression_nd_cg_net_eth0_visibletotal_value_prometheus_server_model.predict(Xnew)[0])) + ' kilobit/s'
+    distributor_network = 'Distributor: ' + str(round(predictions['nd_cg_net_eth0_visibletotal_value_cortex_distributor'])) + ' kilobit/s'
+    ingester_network = 'Ingester: ' + str(round(predictions['nd_cg_net_eth0_visibletotal_value_cortex_ingester'])) + ' kilobit/s'
+    prometheus_network = 'Prometheus: ' + str(round(predictions['nd_cg_net_eth0_visibletotal_value_prometheus_server'])) + ' kilobit/s'
 
     return distributor_cpu, ingester_cpu, prometheus_cpu, ingester_disk, minio_disk, prometheus_disk, ingester_memory, prometheus_memory, distributor_network, ingester_network, prometheus_network
     
+# Regression tab inputs of the model features
+feature_inputs = {
+    'prometheus_wal_compression': 'prometheus_wal_compression_value-input',
+    'application_metric_count': 'application_metric_count_value-input',
+    'application_labels': 'application_labels_value-input',
+    'number_of_nginx': 'number_of_nginx-input',
+    'number_of_distributor': 'number_of_distributor-input',
+    'number_of_ingester': 'number_of_ingester-input',
+    'tsdb_block_ranges_period': 'tsdb_block_ranges_period-input',
+    'tsdb_retention_period': 'tsdb_retention_period-input',
+    'tsdb_wal_compression': 'tsdb_wal_compression-input'
+}
+
+# Capacity planning table columns and their labels
+capacity_columns = {
+    'number_of_nginx': 'Nginx',
+    'number_of_distributor': 'Distributors',
+    'number_of_ingester': 'Ingesters',
+    'tsdb_retention_period': 'TSDB Retention Period',
+    'tsdb_block_ranges_period': 'TSDB Block Ranges Period',
+    'tsdb_wal_compression': 'TSDB WAL compression',
+    'prometheus_wal_compression': 'Prometheus WAL compression',
+    'cpu': 'CPU (%)',
+    'memory': 'Memory (MiB)',
+    'network': 'Network (kilobit/s)'
+}
+
+# Values of the sweep, between the min and max of the regression tab inputs
+def capacity_feature_values(application_metric_count, application_labels):
+    options = refresher.current.options
+    values = {
+        'application_metric_count': [application_metric_count],
+        'application_labels': [application_labels]
+    }
+
+    for feature in ['prometheus_wal_compression', 'number_of_nginx', 'number_of_distributor', 'number_of_ingester', 'tsdb_wal_compression']:
+        component = layout[feature_inputs[feature]]
+        values[feature] = list(range(int(component.min), int(component.max) + 1))
+
+    for feature, column in [('tsdb_block_ranges_period', 'cortex_blocks_storage_tsdb_block_ranges_period_value'), ('tsdb_retention_period', 'cortex_blocks_storage_tsdb_retention_period_value')]:
+        component = layout[feature_inputs[feature]]
+        values[feature] = capacity.continuous_values(component.min, component.max, options[column], settings.capacity_continuous_steps)
+
+    return values
+
+@app.callback(
+    Output(component_id='capacity_sweep-output', component_property='children'),
+    [Input(component_id='capacity_sweep-button', component_property='n_clicks')],
+    [
+        State(component_id='application_metric_count_value-input', component_property='value'),
+        State(component_id='application_labels_value-input', component_property='value'),
+        State(component_id='cpu_budget-input', component_property='value'),
+        State(component_id='memory_budget-input', component_property='value'),
+        State(component_id='network_budget-input', component_property='value')
+    ]
+)
+@instrumentation.timed_callback
+def capacity_sweep(n_clicks, application_metric_count, application_labels, cpu_budget, memory_budget, network_budget):
+
+    if n_clicks == 0:
+        raise PreventUpdate
+
+    if application_metric_count == None or application_labels == None:
+        return "Waiting for user input"
+
+    if refresher.current is None:
+        return "Waiting for the dataset"
+
+    rows, grid_size = capacity.sweep(prediction_engine.engine(), capacity_feature_values(application_metric_count, application_labels),
+                                     {'cpu': cpu_budget, 'memory': memory_budget, 'network': network_budget},
+                                     workers=settings.capacity_workers, chunk_size=settings.capacity_chunk_size,
+                                     inprocess_max=settings.capacity_inprocess_max)
+
+    if len(rows) == 0:
+        return 'None of the {} configurations fits the budgets'.format(grid_size)
+
+    return html.Div(children=[
+        html.Div(children='{} Pareto-optimal of {} configurations'.format(len(rows), grid_size)),
+        html.Table(
+            [html.Tr([html.Th(label) for label in capacity_columns.values()])] +
+            [html.Tr([html.Td(round(row[column])) for column in capacity_columns]) for row in rows[:settings.capacity_max_results]],
+            style={'margin': 'auto'})
+    ])
+
+# Batch scoring: {"configurations": [{feature: value, ...} or [values in feature order], ...]}
+@app.server.route('/api/predict', methods=['POST'])
+def predict_batch():
+    request_data = flask.request.get_json(silent=True) or {}
+
+    try:
+        names, predictions = prediction_engine.predict(request_data['configurations'], as_dictionaries=True)
+    except (KeyError, TypeError, ValueError) as error:
+        return flask.jsonify({'error': 'Invalid configurations: {}'.format(error), 'features': FEATURES}), 400
+
+    return flask.jsonify({'targets': names, 'predictions': predictions.tolist()})
+
+# Arguments of filtering() taken by the export route, as repeated query parameters
+export_filter_arguments = ['application_labels', 'metric_count_series', 'application_case_series', 'nginx', 'distributor', 'ingester',
+                           'tsdb_compactor_blocks_ranges', 'tsdb_retention_period', 'tsdb_wal_compression', 'tsdb_block_ranges_period']
+
+# Exports streaming at the same time, the callbacks keep the other threads of the server
+export_slots = threading.BoundedSemaphore(settings.export_concurrency)
+
+# Link of the export of the current filter state
+@app.callback(
+    Output(component_id='export-link', component_property='href'),
+    [
+        Input(component_id='export_kind-radio', component_property='value'),
+        Input(component_id='export_format-radio', component_property='value'),
+        Input(component_id='x_axis-checklist', component_property='value'),
+        Input(component_id='statistic-radio', component_property='value')
+    ] +
+    filter_inputs
+)
+@instrumentation.timed_callback
+def refresh_export_link(kind, format, x_axis, statistic, application_labels, metric_count_series, application_case_series, tsdb_retention_period, nginx, distributor, ingester, tsdb_compactor_blocks_ranges, tsdb_wal_compression, tsdb_block_ranges_period):
+    filters = dict(application_labels=application_labels, metric_count_series=metric_count_series, application_case_series=application_case_series, nginx=nginx, distributor=distributor, ingester=ingester,
+                   tsdb_compactor_blocks_ranges=tsdb_compactor_blocks_ranges, tsdb_retention_period=tsdb_retention_period, tsdb_wal_compression=tsdb_wal_compression, tsdb_block_ranges_period=tsdb_block_ranges_period)
+
+    arguments = [('kind', kind), ('format', format), ('x_axis', x_axis), ('statistic', statistic)]
+    arguments += [(argument, value) for argument in export_filter_arguments for value in filters[argument] or []]
+
+    return '/api/export?' + urlencode(arguments)
+
+# Selected values of the export arguments, as the values of the dataset, None for an unknown value
+def export_selections(dataset, x_axis, arguments):
+    selections = filter_selections(x_axis, **{argument: arguments.getlist(argument) for argument in export_filter_arguments})
+
+    for column, strings in selections.items():
+        values = export.filter_values(dataset.data[column], strings)
+        if values is None or any(value not in dataset.index.bitmaps[column] for value in values):
+            return None
+        selections[column] = values
+
+    return selections
+
+# Filtered configurations, their aggregates or the raw measurements, streamed in chunks
+@app.server.route('/api/export')
+def export_data():
+    arguments = flask.request.args
+    kind = arguments.get('kind', 'configurations')
+    format = arguments.get('format', 'csv')
+    x_axis = arguments.get('x_axis')
+    statistic = arguments.get('statistic', 'mean')
+
+    if kind not in export.KINDS or format not in export.FORMATS:
+        return flask.jsonify({'error': 'Unknown kind or format', 'kinds': export.KINDS, 'formats': list(export.FORMATS)}), 400
+    if kind == 'aggregates' and (x_axis not in filter_input_columns or statistic not in STATISTICS):
+        return flask.jsonify({'error': 'Aggregates need a parameter column as x_axis and a statistic', 'statistics': STATISTICS}), 400
+
+    dataset = refresher.current
+    if dataset is None:
+        return flask.jsonify({'error': 'The data is loading'}), 503
+
+    # The filter of the X axis column is not applied to the aggregates, like on the bar plots
+    selections = export_selections(dataset, x_axis if kind == 'aggregates' else None, arguments)
+    if selections is None:
+        return flask.jsonify({'error': 'Unknown filter value'}), 400
+
+    if kind == 'aggregates' and statistic != 'mean' and (sketches is None or sketches.current is None):
+        return flask.jsonify({'error': 'Percentiles are not available'}), 400
+
+    if not export_slots.acquire(blocking=False):
+        export.EXPORTS.inc(kind=kind, format=format, outcome='rejected')
+        return flask.jsonify({'error': 'Too many exports running, retry later'}), 429, {'Retry-After': str(settings.export_retry_after)}
+
+    try:
+        if kind == 'configurations':
+            frame = dataset.index.take(dataset.data, selections)
+            frames, schema = export.frame_chunks(frame, settings.export_chunk_size), export.frame_schema(dataset.data)
+        elif kind == 'aggregates':
+            frame = aggregated_plot_data(dataset, x_axis, selections, statistic, 'export_data')
+            frames, schema = export.frame_chunks(frame, settings.export_chunk_size), export.frame_schema(frame)
+        else:
+            # Server-side cursor, one chunk of rows at a time
+            conditions, params = filter_conditions(selections)
+            frames = iter_query_frames(export.raw_query(conditions), params, dtypes=export.RAW_DTYPES, chunk_size=settings.export_chunk_size)
+            schema = export.raw_schema(dataset.data)
+
+        mimetype, extension = export.FORMATS[format]
+        response = flask.Response(export.encode(frames, format, schema), mimetype=mimetype,
+                                  headers={'Content-Disposition': 'attachment; filename=dashboard_{}_{}.{}'.format(kind, dataset.version, extension)})
+    except Exception:
+        export_slots.release()
+        raise
+
+    # The WSGI server closes the response when the export ends or the client goes away
+    response.call_on_close(export_slots.release)
+    export.EXPORTS.inc(kind=kind, format=format, outcome='streamed')
+
+    return response
+
+# Metrics of the dashboard for Prometheus
+instrumentation.watch_cache('figure', figure_cache)
+instrumentation.watch_cache('plot_data', plot_data_cache)
+instrumentation.watch_cache('timeseries', timeseries.cache)
+instrumentation.watch_cache('breakdown', breakdowns.cache)
+if pushdown is not None:
+    instrumentation.watch_cache('pushdown', pushdown.cache)
+
+instrumentation.Gauge('dashboard_dataset_memory_bytes', 'Memory of the published dataset frame.', function=lambda: refresher.current.memory_bytes if refresher.current else None)
+instrumentation.Gauge('dashboard_dataset_rows', 'Rows of the published dataset.', function=lambda: len(refresher.current.data) if refresher.current else None)
+instrumentation.Gauge('dashboard_dataset_version', 'Version of the published dataset.', function=lambda: refresher.current.version if refresher.current else None)
+instrumentation.Gauge('dashboard_dataset_age_seconds', 'Seconds since the published dataset was loaded.', function=lambda: time.time() - refresher.current.loaded_at if refresher.current else None)
+
+@app.server.route('/metrics')
+def metrics():
+    return flask.Response(instrumentation.render(), mimetype=None, content_type=instrumentation.CONTENT_TYPE)
+
+# Versions and load/predict timings of the models
+@app.server.route('/api/models')
+def model_status():
+    return flask.jsonify({'versions': model_registry.versions(), 'load': model_registry.load_stats, 'predict': prediction_engine.predict_stats})
+
 if __name__ == '__main__':
     app.run_server(host='0.0.0.0', debug=False)                                                                            
\ No newline at end of file
@@ -0,0 +1,204 @@
+# Metrics of the dashboard itself in the Prometheus text format, served on /metrics
+#
+# Counters, gauges and histograms are kept in memory by the process, labelled series are created
+# on first use. Gauges can be read from a function at scrape time (e.g. cache hit ratios or the
+# memory of the current dataset), so nothing has to be updated on the hot paths for them.
+import abc
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from dash.exceptions import PreventUpdate
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow database queries
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+
+    pairs = ('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in zip(names, values))
+    return '{' + ','.join(pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric(abc.ABC):
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    # (sample name, label names, label values, value) of every sample
+    @abc.abstractmethod
+    def samples(self):
+        pass
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} {}'.format(self.name, self.kind)]
+        lines += ['{}{} {}'.format(name, _label_text(names, values), _number(value)) for name, names, values, value in self.samples()]
+
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labels, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    # function() returns the value, or {label values: value} for a labelled gauge
+    def __init__(self, name, documentation, labels=(), function=None):
+        super().__init__(name, documentation, labels)
+        self.function = function
+        self._values = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+
+        if self.function is not None:
+            current = self.function()
+            if not isinstance(current, dict):
+                current = {(): current}
+            values.update(current)
+
+        return [(self.name, self.labels, key, value) for key, value in values.items() if value is not None]
+
+
+# Monotonic value read from a function at scrape time, e.g. the hits of a cache
+class FunctionCounter(Gauge):
+    kind = 'counter'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Counts per bucket (the last one is +Inf), sum and count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+
+        samples = []
+        names = self.labels + ('le',)
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((self.name + '_bucket', names, key + (_number(bound),), cumulative))
+            samples.append((self.name + '_sum', self.labels, key, total))
+            samples.append((self.name + '_count', self.labels, key, count))
+
+        return samples
+
+
+CALLBACK_SECONDS = Histogram('dashboard_callback_seconds', 'Latency of the Dash callbacks.', ['callback', 'outcome'])
+STAGE_SECONDS = Histogram('dashboard_stage_seconds', 'Latency of the stages of the callbacks.', ['callback', 'stage'])
+DB_QUERY_SECONDS = Histogram('dashboard_db_query_seconds', 'Latency of the database queries.')
+DB_QUERY_ROWS = Counter('dashboard_db_query_rows_total', 'Rows returned by the database queries.')
+
+_caches = {}
+CACHE_HITS = FunctionCounter('dashboard_cache_hits_total', 'Lookups found in the cache.', ['cache'], lambda: {(name,): cache.hits for name, cache in _caches.items()})
+CACHE_MISSES = FunctionCounter('dashboard_cache_misses_total', 'Lookups missing from the cache.', ['cache'], lambda: {(name,): cache.misses for name, cache in _caches.items()})
+CACHE_HIT_RATIO = Gauge('dashboard_cache_hit_ratio', 'Hits of all lookups of the cache.', ['cache'],
+                        lambda: {(name,): cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else None for name, cache in _caches.items()})
+CACHE_ENTRIES = Gauge('dashboard_cache_entries', 'Entries in the cache.', ['cache'], lambda: {(name,): len(cache) for name, cache in _caches.items()})
+
+
+# Reporting the hits, misses and size of an LRUCache
+def watch_cache(name, cache):
+    _caches[name] = cache
+
+
+# Callback latency by outcome: ok, prevented (PreventUpdate) or error
+def timed_callback(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            return function(*args, **kwargs)
+        except PreventUpdate:
+            outcome = 'prevented'
+            raise
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            CALLBACK_SECONDS.observe(time.perf_counter() - started, callback=function.__name__, outcome=outcome)
+
+    return wrapper
+
+
+def stage(callback, name):
+    return STAGE_SECONDS.time(callback=callback, stage=name)
+
+
+# Every metric in the text exposition format
+def render():
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+
+    return '\n'.join(lines) + '\n'
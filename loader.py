@@ -0,0 +1,47 @@
+# Loading of the dataset, the same for the dashboard and for the publisher of the shared dataset
+#
+# The quantile sketches are refreshed first, so the percentiles of the new rows are there when the
+# dataset with these rows is published, then the aggregates (sums and counts per configuration).
+import logging
+
+import settings
+from db import sql_queries
+from sketch import QuantileSketches
+from snapshot import AggregateLoader
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetLoader:
+
+    def __init__(self, load_aggregates, refresh_sketches=None):
+        # load_aggregates() returns the aggregates or None if nothing changed, a failing sketch refresh keeps the old sketches
+        self.load_aggregates = load_aggregates
+        self.refresh_sketches = refresh_sketches
+
+    def load(self):
+        if self.refresh_sketches is not None:
+            try:
+                self.refresh_sketches()
+            except Exception:
+                logger.exception('Refreshing the quantile sketches failed')
+
+        return self.load_aggregates()
+
+
+# Quantile sketches of the settings, None if they are disabled
+def create_sketches():
+    if not settings.sketches_enabled:
+        return None
+
+    return QuantileSketches(sql_queries, settings.sketch_path, settings.sketch_accuracy)
+
+
+# Loader of the sketches and the aggregates from the database, with the snapshot and the fan-out of the settings
+def create_loader(sketches):
+    from async_db import fanout_aggregates
+
+    aggregates = AggregateLoader(sql_queries, settings.snapshot_path if settings.snapshot_enabled else None,
+                                 fetch=fanout_aggregates if settings.async_fanout else None)
+
+    return DatasetLoader(aggregates.refresh, sketches.refresh if sketches is not None else None)
@@ -0,0 +1,58 @@
+# Thread-safe LRU cache bounded by entries and optionally by bytes, with an optional expiry time
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+
+    def __init__(self, max_entries, ttl=None, max_bytes=None, sizeof=len):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.size_bytes = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or (self.ttl and time.monotonic() - entry[0] > self.ttl):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.max_bytes else 0
+
+        # Values larger than the whole cache are not kept
+        if self.max_bytes and size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous[2]
+
+            self._entries[key] = (time.monotonic(), value, size)
+            self.size_bytes += size
+
+            # Evicting the least recently used entries
+            while len(self._entries) > self.max_entries or (self.max_bytes and self.size_bytes > self.max_bytes):
+                self.size_bytes -= self._entries.popitem(last=False)[1][2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
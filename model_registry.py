@@ -0,0 +1,142 @@
+# Lazy, versioned registry of the pickled regression models
+#
+# Models are keyed by (metric, component) and unpickled on first use only. Every loaded model
+# carries the SHA-256 of its file as version. A watcher thread polls the files of the loaded
+# models: a changed file is loaded next to the old model, which keeps serving until the new
+# one replaces it in a single assignment, so requests are never dropped during a reload.
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelEntry:
+
+    def __init__(self, model, version, path, modified, load_seconds):
+        self.model = model
+        self.version = version
+        self.path = path
+        self.modified = modified
+        self.load_seconds = load_seconds
+
+
+class ModelRegistry:
+
+    def __init__(self, directory, watch_interval):
+        self.directory = directory
+        self.watch_interval = watch_interval
+
+        self._entries = {}
+        # Whether the file of a not yet loaded model exists, checked again by the watcher
+        self._files = {}
+        self._load_lock = threading.Lock()
+        self._thread = None
+
+        # Load timings and counts by key
+        self.load_stats = {}
+
+    def path(self, metric, component):
+        return os.path.join(self.directory, 'linear_regression_{}_{}'.format(metric, component))
+
+    def _read(self, key):
+        path = self.path(*key)
+
+        started = time.perf_counter()
+        modified = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as model_file:
+            content = model_file.read()
+
+        version = hashlib.sha256(content).hexdigest()[:16]
+        current = self._entries.get(key)
+        if current is not None and current.version == version:
+            model = current.model
+        else:
+            model = pickle.loads(content)
+
+        load_seconds = time.perf_counter() - started
+        stats = self.load_stats.setdefault('{}_{}'.format(*key), {'loads': 0, 'load_seconds': 0.0})
+        stats['loads'] += 1
+        stats['load_seconds'] += load_seconds
+        stats['version'] = version
+
+        return ModelEntry(model, version, path, modified, load_seconds)
+
+    def entry(self, metric, component):
+        key = (metric, component)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            with self._load_lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._read(key)
+                    self._entries[key] = entry
+                    logger.info('Loaded model %s_%s version %s in %.3f s', metric, component, entry.version, entry.load_seconds)
+
+        return entry
+
+    def get(self, metric, component):
+        return self.entry(metric, component).model
+
+    def exists(self, metric, component):
+        key = (metric, component)
+        if key in self._entries:
+            return True
+
+        found = self._files.get(key)
+        if found is None:
+            found = self._files[key] = os.path.exists(self.path(metric, component))
+
+        return found
+
+    # Replacing a model in memory (e.g. a refitted one), it is not written to disk
+    def publish(self, metric, component, model, version):
+        self._entries[(metric, component)] = ModelEntry(model, version, None, None, 0.0)
+        logger.info('Published model %s_%s version %s', metric, component, version)
+
+    # Consistent {key: model} and (versions) of the required keys and of the existing optional ones
+    def snapshot(self, keys, optional_keys=()):
+        entries = {key: self.entry(*key) for key in keys}
+        entries.update({key: self.entry(*key) for key in optional_keys if self.exists(*key)})
+
+        return {key: entry.model for key, entry in entries.items()}, tuple(sorted((key, entry.version) for key, entry in entries.items()))
+
+    def versions(self):
+        return {'{}_{}'.format(*key): entry.version for key, entry in self._entries.items()}
+
+    # Reloading the loaded models whose file changed since they were read
+    def reload_changed(self):
+        # Missing files are looked for again by the next request, e.g. a disk model added later
+        self._files = {key: found for key, found in self._files.items() if found}
+
+        for key, entry in list(self._entries.items()):
+            # Published models have no file
+            if entry.path is None:
+                continue
+
+            try:
+                if os.stat(entry.path).st_mtime_ns == entry.modified:
+                    continue
+
+                new_entry = self._read(key)
+            except Exception:
+                logger.exception('Reloading model %s_%s failed, keeping version %s', key[0], key[1], entry.version)
+                continue
+
+            self._entries[key] = new_entry
+            if new_entry.version != entry.version:
+                logger.info('Reloaded model %s_%s: version %s -> %s', key[0], key[1], entry.version, new_entry.version)
+
+    def start_watching(self):
+        if self._thread is None and self.watch_interval:
+            self._thread = threading.Thread(target=self._watch, name='model-registry-watcher', daemon=True)
+            self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            self.reload_changed()
@@ -0,0 +1,142 @@
+# Vectorized prediction engine of the regression models
+#
+# The intercepts and coefficients of every linear model are stacked into one weight matrix
+# (one column per target), the disk formulas are extra columns of it. N configurations x all
+# targets are then scored with a single matrix product. Models without linear coefficients
+# (e.g. pipelines) are still supported, they are called through their own predict().
+import threading
+import time
+
+import numpy as np
+
+# Input features of the models, in the order they were trained with
+FEATURES = [
+    'prometheus_wal_compression',
+    'application_metric_count',
+    'application_labels',
+    'number_of_nginx',
+    'number_of_distributor',
+    'number_of_ingester',
+    'tsdb_block_ranges_period',
+    'tsdb_retention_period',
+    'tsdb_wal_compression'
+]
+
+# (metric, component) of the pickled linear_regression_<metric>_<component> models
+MODEL_TARGETS = [
+    ('nd_cg_cpu_visibletotal_value', 'cortex_distributor'),
+    ('nd_cg_cpu_visibletotal_value', 'cortex_ingester'),
+    ('nd_cg_cpu_visibletotal_value', 'prometheus_server'),
+    ('nd_cg_mem_usage_visibletotal_value', 'cortex_ingester'),
+    ('nd_cg_mem_usage_visibletotal_value', 'prometheus_server'),
+    ('nd_cg_net_eth0_visibletotal_value', 'cortex_distributor'),
+    ('nd_cg_net_eth0_visibletotal_value', 'cortex_ingester'),
+    ('nd_cg_net_eth0_visibletotal_value', 'prometheus_server')
+]
+
+# Disk usage (cumulative value, 8 hours): slope and intercept over the number of time series
+DISK_FORMULAS = {
+    ('du_disk_usage_value', 'cortex_ingester'): (0.0032, 385.74207),
+    ('du_disk_usage_value', 'minio'): (0.003528, 251.671882),
+    ('du_disk_usage_value', 'prometheus_server'): (0.00496, -220.372656)
+}
+
+TARGETS = MODEL_TARGETS + list(DISK_FORMULAS)
+
+
+def target_name(metric, component):
+    return metric + '_' + component
+
+
+class PredictionEngine:
+
+    def __init__(self, models):
+        # models: {(metric, component): fitted estimator}, missing disk models use the formulas
+        self.targets = TARGETS
+        self.names = [target_name(metric, component) for metric, component in TARGETS]
+
+        # Row 0 holds the intercepts, rows 1.. the coefficients of the features
+        self.weights = np.zeros((len(FEATURES) + 1, len(TARGETS)))
+        self.fallback = {}
+
+        for column, target in enumerate(TARGETS):
+            model = models.get(target)
+            coefficients = np.ravel(getattr(model, 'coef_', []))
+
+            if model is None and target in DISK_FORMULAS:
+                slope, intercept = DISK_FORMULAS[target]
+                self.weights[0, column] = intercept
+                self.weights[1 + FEATURES.index('application_metric_count'), column] = slope
+            elif model is None:
+                raise KeyError('No model for {}'.format(target_name(*target)))
+            elif len(coefficients) == len(FEATURES):
+                self.weights[0, column] = np.ravel(getattr(model, 'intercept_', 0.0))[0]
+                self.weights[1:, column] = coefficients
+            else:
+                self.fallback[column] = model
+
+    # Predictions of every target for an (N x features) array of configurations, shape (N x targets)
+    def predict(self, configurations):
+        X = np.asarray(configurations, dtype=np.float64)
+        if X.size == 0:
+            X = X.reshape(0, len(FEATURES))
+
+        if X.ndim != 2 or X.shape[1] != len(FEATURES):
+            raise ValueError('Expected configurations of {} features, got an array of shape {}'.format(len(FEATURES), X.shape))
+        if not np.isfinite(X).all():
+            raise ValueError('Configurations must not contain NaN or infinite values')
+
+        predictions = X @ self.weights[1:] + self.weights[0]
+        for column, model in self.fallback.items():
+            predictions[:, column] = np.ravel(model.predict(X))
+
+        return predictions
+
+    # Configurations as lists in FEATURES order or as {feature: value} dictionaries
+    def predict_configurations(self, configurations):
+        rows = [[configuration[feature] for feature in FEATURES] if isinstance(configuration, dict) else configuration
+                for configuration in configurations]
+
+        return self.predict(rows)
+
+
+# Prediction engine of the registry models, rebuilt whenever a model version changes
+class RegistryEngine:
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.predict_stats = {'calls': 0, 'configurations': 0, 'seconds': 0.0}
+
+        self._engine = None
+        self._versions = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def engine(self):
+        models, versions = self.registry.snapshot(MODEL_TARGETS, optional_keys=DISK_FORMULAS)
+
+        if versions != self._versions:
+            with self._lock:
+                if versions != self._versions:
+                    self._engine = PredictionEngine(models)
+                    self._versions = versions
+
+        return self._engine
+
+    # Timed predict of the current engine, returns (target names, predictions)
+    def predict(self, configurations, as_dictionaries=False):
+        engine = self.engine()
+
+        started = time.perf_counter()
+        if as_dictionaries:
+            predictions = engine.predict_configurations(configurations)
+        else:
+            predictions = engine.predict(configurations)
+
+        seconds = time.perf_counter() - started
+        with self._stats_lock:
+            self.predict_stats['calls'] += 1
+            self.predict_stats['configurations'] += len(predictions)
+            self.predict_stats['seconds'] += seconds
+
+        return engine.names, predictions
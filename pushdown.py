@@ -0,0 +1,64 @@
+# SQL pushdown of the filters and the aggregation behind the bar plots
+#
+# The filter state and the x axis are turned into one parameterized statement: the measurements
+# within the WHERE ... IN clauses are averaged per (group_name, x axis), the same exact means the
+# data cube computes from its sums and counts. Only the small aggregated result is transferred.
+from columns import METRIC_COLUMNS, PARAMETER_COLUMNS, BASE_CONDITION
+from lru_cache import LRUCache
+
+
+# Hashable, order independent form of (x axis, {column: selected values})
+def normalize_filter_state(x_axis, selections):
+    return (x_axis, tuple(sorted((column, tuple(sorted(set(values), key=repr))) for column, values in selections.items())))
+
+
+# WHERE conditions and their parameters of the dashboard rows within the filters
+def filter_conditions(selections):
+    conditions = [BASE_CONDITION]
+    params = {}
+    for position, (column, values) in enumerate(normalize_filter_state(None, selections)[1]):
+        if column not in PARAMETER_COLUMNS:
+            raise ValueError('Unknown filter column: {}'.format(column))
+
+        name = 'filter_{}'.format(position)
+        conditions.append('parameters.{} IN %({})s'.format(column, name))
+        params[name] = values
+
+    return conditions, params
+
+
+def pushdown_query(x_axis, selections):
+    if x_axis not in PARAMETER_COLUMNS:
+        raise ValueError('Unknown x axis column: {}'.format(x_axis))
+
+    conditions, params = filter_conditions(selections)
+    averages = ', '.join('AVG(metrics.{0}) AS {0}'.format(column) for column in METRIC_COLUMNS)
+
+    query = '''SELECT metrics.group_name, parameters.{x_axis}, {averages}
+FROM metrics INNER JOIN parameters ON metrics.timestamp=parameters.timestamp
+WHERE {conditions} AND parameters.{x_axis} IS NOT NULL
+GROUP BY metrics.group_name, parameters.{x_axis}
+'''.format(x_axis=x_axis, averages=averages, conditions=' AND '.join(conditions))
+
+    return query, params
+
+
+class PushdownAggregator:
+
+    def __init__(self, sql_queries, max_entries, ttl):
+        self.sql_queries = sql_queries
+
+        # Expiring entries, so new measurements show up eventually
+        self.cache = LRUCache(max_entries, ttl=ttl)
+
+    # Aggregated (group_name, x axis, metric averages) rows of a filter state
+    def aggregate(self, x_axis, selections):
+        key = normalize_filter_state(x_axis, selections)
+
+        result = self.cache.get(key)
+        if result is None:
+            query, params = pushdown_query(x_axis, selections)
+            result = self.sql_queries(query, params=params)
+            self.cache.put(key, result)
+
+        return result
@@ -0,0 +1,131 @@
+# Compact dtypes of the aggregated dataset
+#
+# Parameter dimensions become categoricals (small integer codes instead of boxed Python objects),
+# the WAL compression flag a nullable boolean and the metrics float32 where every value survives
+# the cast within float32_precision, an absolute error in the unit of the metric: float32 keeps
+# about 7 significant digits, so large values (e.g. a disk usage in MB over 16 GB) stay float64.
+# The key columns of the aggregates are typed chunk by chunk while the query result is read.
+# Columns already holding their target dtype are left untouched.
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import settings
+from columns import METRIC_COLUMNS, KEY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+COLUMN_DTYPES = {
+    'group_name': 'category',
+    'application_instances_value': 'category',
+    'application_case_value': 'category',
+    'application_metric_count_value': 'category',
+    'application_labels_value': 'category',
+    'cortex_number_of_nginx_value': 'category',
+    'cortex_number_of_distributor_value': 'category',
+    'cortex_number_of_ingester_value': 'category',
+    'cortex_blocks_storage_tsdb_block_ranges_period_value': 'category',
+    'cortex_blocks_storage_tsdb_retention_period_value': 'category',
+    'cortex_blocks_storage_tsdb_wal_compression_value': 'boolean',
+    'cortex_compactor_blocks_ranges_value': 'category'
+}
+
+# Metrics are stored as float32 when the precision allows it
+COLUMN_DTYPES.update({column: 'float32' for column in METRIC_COLUMNS})
+
+# Key columns of the aggregates (application and configuration), typed while reading
+KEY_DTYPES = {column: COLUMN_DTYPES[column] for column in KEY_COLUMNS}
+
+# Plain dtypes of the categorical columns by the kind of their values, nullable for the integers and flags
+PLAIN_DTYPES = {'i': 'Int64', 'u': 'Int64', 'b': 'boolean', 'f': 'float64'}
+
+
+def memory_usage(frame):
+    return int(frame.memory_usage(deep=True).sum())
+
+
+def _cast(series, dtype):
+    if str(series.dtype) == dtype:
+        return series
+
+    if dtype == 'float32':
+        values = series.astype(np.float64)
+        compact = values.astype(np.float32)
+
+        errors = (compact.astype(np.float64) - values).abs()
+        if errors.max() > settings.float32_precision:
+            logger.info('Keeping %s as float64, float32 would change values by up to %g', series.name, errors.max())
+            return values
+        return compact
+
+    if dtype == 'category' and series.name == 'application_labels_value' and series.notna().all():
+        # Number of labels is an integer, stored as float by the database
+        series = series.astype(int)
+
+    try:
+        return series.astype(dtype)
+    except (TypeError, ValueError):
+        logger.warning('Column %s can not be cast to %s, storing it as category', series.name, dtype)
+        return series.astype('category')
+
+
+# Casting every known column of the frame to its compact dtype, logging the memory saved
+def apply_schema(frame):
+    before = memory_usage(frame)
+
+    cast = {column: _cast(frame[column], dtype) for column, dtype in COLUMN_DTYPES.items() if column in frame.columns}
+
+    # A frame already in the compact dtypes (e.g. a memory-mapped one) is not copied
+    changed = {column: series for column, series in cast.items() if series.dtype != frame[column].dtype}
+    if changed:
+        frame = frame.assign(**changed)
+
+    after = memory_usage(frame)
+    logger.info('Dataset memory: %.1f kB before, %.1f kB after the compact dtypes', before / 1024, after / 1024)
+
+    return frame, before, after
+
+
+# One chunk of a query result in the given compact dtypes, the other columns with the types of their values
+def cast_frame(frame, dtypes):
+    frame = frame.infer_objects()
+    cast = {column: _cast(frame[column], dtype) for column, dtype in dtypes.items() if column in frame.columns}
+
+    return frame.assign(**cast) if cast else frame
+
+
+# Concatenating typed chunks, the categorical columns keep their dtype with the union of the categories
+def concat_frames(frames):
+    if len(frames) == 1:
+        return frames[0]
+    if len(frames) == 0:
+        return pd.DataFrame()
+
+    columns = {}
+    for column in frames[0].columns:
+        pieces = [frame[column] for frame in frames]
+
+        if all(isinstance(piece.dtype, pd.CategoricalDtype) for piece in pieces):
+            try:
+                columns[column] = pd.Series(union_categoricals(pieces, ignore_order=True), name=column)
+            except TypeError:
+                # Categories of different types (e.g. integers and floats with NaN)
+                columns[column] = pd.concat([piece.astype(object) for piece in pieces], ignore_index=True).astype('category')
+        else:
+            columns[column] = pd.concat(pieces, ignore_index=True)
+
+    return pd.DataFrame(columns)
+
+
+# Frame without categorical columns, e.g. for engines and file formats that compare or store plain values
+def plain_frame(frame):
+    columns = {}
+    for column in frame.columns:
+        series = frame[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(PLAIN_DTYPES.get(series.cat.categories.dtype.kind, object))
+        columns[column] = series
+
+    return pd.DataFrame(columns)
@@ -0,0 +1,221 @@
+# Compact serialization of the figures and compressed responses
+#
+# Numeric arrays of the figures are sent as base64 typed arrays ({'dtype', 'bdata'}), which
+# plotly.js decodes since 2.28, instead of JSON lists of numbers. Figures share one cached,
+# trimmed template (simple_white with the dashboard styling) that is built and converted once.
+# The JSON engine of plotly (used by Dash for the callback responses) is orjson when installed,
+# and responses are gzip-compressed for clients accepting it.
+import base64
+import functools
+import gzip
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+import settings
+
+# dtypes plotly.js decodes from typed arrays, by numpy name
+TYPED_ARRAY_DTYPES = {
+    'int8': 'i1', 'uint8': 'u1', 'int16': 'i2', 'uint16': 'u2',
+    'int32': 'i4', 'uint32': 'u4', 'float32': 'f4', 'float64': 'f8'
+}
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'text/csv', 'application/javascript'}
+
+
+def _orjson():
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+
+# JSON engine of plotly and Dash: orjson when it is installed, unless configured otherwise
+def configure():
+    import plotly.io as pio
+
+    engine = settings.json_engine
+    if engine == 'orjson' and _orjson() is None:
+        engine = 'json'
+    pio.json.config.default_engine = engine
+
+    return engine
+
+
+# (major, minor) of the plotly.js that dcc.Graph renders with, None when it is not found. Dash
+# registers plotly.py's bundle among the dcc scripts when the app is created (the version is in its
+# CDN url), older Dash versions ship their own plotly.min.js inside dcc (the version is in its header).
+def dcc_plotlyjs_version():
+    from dash import dcc
+
+    dash_path = os.path.dirname(os.path.dirname(os.path.abspath(dcc.__file__)))
+    for resource in dcc._js_dist:
+        path = resource.get('relative_package_path', '')
+        if not os.path.basename(path).startswith('plotly') or not path.endswith('.js'):
+            continue
+
+        match = re.search(r'plotly-(\d+)\.(\d+)\.', resource.get('external_url', ''))
+        if match is None and os.path.isfile(os.path.join(dash_path, path)):
+            with open(os.path.join(dash_path, path), encoding='utf-8', errors='replace') as bundle:
+                match = re.search(r'plotly\.js v(\d+)\.(\d+)\.', bundle.read(1024))
+        if match is not None:
+            return int(match.group(1)), int(match.group(2))
+
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def typed_arrays_supported():
+    version = dcc_plotlyjs_version()
+    return settings.typed_arrays and version is not None and version >= (2, 28)
+
+
+def _typed_array(array):
+    # 64-bit integers are not typed array types of plotly.js
+    if array.dtype.kind in 'iu' and array.dtype.name not in TYPED_ARRAY_DTYPES:
+        fits = len(array) == 0 or (array.min() >= np.iinfo(np.int32).min and array.max() <= np.iinfo(np.int32).max)
+        array = array.astype(np.int32 if fits else np.float64)
+
+    array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+    typed = {'dtype': TYPED_ARRAY_DTYPES[array.dtype.name], 'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+    if array.ndim > 1:
+        typed['shape'] = ','.join(str(size) for size in array.shape)
+
+    return typed
+
+
+def _decoded(typed):
+    array = np.frombuffer(base64.b64decode(typed['bdata']), dtype='<' + typed['dtype'])
+    if 'shape' in typed:
+        array = array.reshape([int(size) for size in typed['shape'].split(',')])
+
+    return array
+
+
+# JSON-ready copy of a plotly JSON structure, numeric arrays as typed arrays or as lists
+def compact(value, typed_arrays=True):
+    if isinstance(value, dict):
+        if 'bdata' in value and 'dtype' in value:
+            return value if typed_arrays else _decoded(value).tolist()
+        return {key: compact(item, typed_arrays) for key, item in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return [compact(item, typed_arrays) for item in value]
+
+    if isinstance(value, np.ndarray):
+        if typed_arrays and value.dtype.kind in 'iuf' and value.size != 0:
+            return _typed_array(value)
+        return compact(value.tolist(), typed_arrays)
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return value
+
+
+# Template shared by the bar plots: simple_white trimmed to the layout and the bar traces, with the dashboard styling
+@functools.lru_cache(maxsize=None)
+def bar_template():
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    base = pio.templates['simple_white']
+    template = go.layout.Template(layout=base.layout, data={'bar': base.data.bar})
+    template.layout.update(font_size=14, legend_font_size=14)
+    template.layout.xaxis.update(linewidth=2, linecolor='black', title_font_size=16)
+    template.layout.yaxis.update(linewidth=2, linecolor='black', title_font_size=16, showgrid=True)
+
+    return template
+
+
+# Converted shared templates, by id of the cached template object
+_template_dicts = {}
+
+
+def _template_dict(template):
+    converted = _template_dicts.get(id(template))
+    if converted is None:
+        converted = _template_dicts[id(template)] = compact(template.to_plotly_json())
+
+    return converted
+
+
+# Figure as the dictionary sent to the browser, a figure built with the shared template
+# (template=bar_template()) gets its converted copy instead of converting it again
+def figure_dict(figure, template=None):
+    if template is None:
+        return compact(figure.to_plotly_json(), typed_arrays_supported())
+
+    result = figure.to_plotly_json()
+    result['layout'].pop('template', None)
+    result = compact(result, typed_arrays_supported())
+    result['layout']['template'] = _template_dict(template)
+
+    return result
+
+
+def dumps(value):
+    orjson = _orjson()
+    if orjson is not None and settings.json_engine == 'orjson':
+        return orjson.dumps(value)
+
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+# Bytes and serialization time of the figures: JSON lists with the full simple_white template
+# and the standard json module (before) against typed arrays, the shared template and the
+# configured engine (after), both also gzip-compressed
+def report(figures, repeat=20):
+    import plotly.io as pio
+
+    full_template = compact(pio.templates['simple_white'].to_plotly_json())
+
+    def before():
+        payloads = []
+        for figure in figures:
+            plain = compact(figure.to_plotly_json(), typed_arrays=False)
+            plain['layout']['template'] = full_template
+            payloads.append(plain)
+        return json.dumps(payloads).encode()
+
+    def after():
+        return dumps([figure_dict(figure, template=bar_template()) for figure in figures])
+
+    result = {}
+    for name, serialize in (('before', before), ('after', after)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            payload = serialize()
+        seconds = (time.perf_counter() - started) / repeat
+
+        result[name] = {'bytes': len(payload), 'gzip_bytes': len(gzip.compress(payload, compresslevel=settings.gzip_level)), 'serialize_ms': seconds * 1000}
+
+    result['typed_arrays'] = typed_arrays_supported()
+    result['json_engine'] = settings.json_engine if _orjson() is not None else 'json'
+
+    return result
+
+
+# Flask after_request hook: gzip of the larger text responses when the client accepts it
+def compress_response(response):
+    import flask
+
+    if (not settings.gzip_responses or response.direct_passthrough or response.is_streamed
+            or not 200 <= response.status_code < 300 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'gzip' not in flask.request.headers.get('Accept-Encoding', '').lower()):
+        return response
+
+    data = response.get_data()
+    if len(data) < settings.gzip_min_size:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=settings.gzip_level))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+
+    return response
@@ -0,0 +1,140 @@
+# Optional settings of the dashboard
+# Every value can be set in my_config.py or overridden with a DASHBOARD_<NAME> environment variable
+import os
+import tempfile
+
+try:
+    import my_config
+except ImportError:
+    my_config = None
+
+
+def _setting(name, default):
+    value = os.environ.get('DASHBOARD_' + name.upper())
+
+    if value is None:
+        return getattr(my_config, name, default)
+
+    # Environment values are strings, cast them to the type of the default
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+
+    return value
+
+# Database connection, my_config.py keeps its original names
+host_name = _setting('host_name', 'localhost')
+port = _setting('port', 5432)
+database_name = _setting('database_name', 'postgres')
+username = _setting('username', 'postgres')
+pw = _setting('pw', '')
+
+# Columnar snapshot of the aggregated dataset
+snapshot_enabled = _setting('snapshot_enabled', True)
+snapshot_path = _setting('snapshot_path', 'snapshot/aggregated.parquet')
+
+# Background refresh of the dataset, in seconds (0 - only on demand, POST /refresh)
+refresh_interval = _setting('refresh_interval', 300)
+# How often the browser checks for a newly published dataset, in seconds
+options_poll_interval = _setting('options_poll_interval', 30)
+
+# Database connection pool
+db_pool_min_size = _setting('db_pool_min_size', 1)
+db_pool_max_size = _setting('db_pool_max_size', 8)
+# Pooled connections idle for longer than this (seconds) are checked with SELECT 1 before use
+db_health_check_interval = _setting('db_health_check_interval', 30.0)
+# Rows fetched per round-trip by server-side cursors
+db_stream_chunk_size = _setting('db_stream_chunk_size', 50000)
+
+# Filtering and aggregation of the bar plots in the database instead of pandas
+pushdown_enabled = _setting('pushdown_enabled', False)
+pushdown_cache_size = _setting('pushdown_cache_size', 256)
+# Seconds after a cached pushdown result is queried again
+pushdown_cache_ttl = _setting('pushdown_cache_ttl', 300.0)
+
+# Memoized bar plot figures, bounded by entries and by the size of their JSON
+figure_cache_size = _setting('figure_cache_size', 512)
+figure_cache_max_bytes = _setting('figure_cache_max_bytes', 64 * 1024 * 1024)
+# Averaged plot data of the last filter states, shared by the bar plot callbacks
+plot_data_cache_size = _setting('plot_data_cache_size', 32)
+
+# Largest change of a metric value accepted for storing the metric as float32, in the unit of the
+# metric (MB, %, MiB, kbit/s), the metrics with larger values stay float64
+float32_precision = _setting('float32_precision', 0.001)
+
+# Capacity planning sweep: worker processes, configurations per chunk, values of the continuous inputs, table rows
+capacity_workers = _setting('capacity_workers', 4)
+capacity_chunk_size = _setting('capacity_chunk_size', 20000)
+capacity_continuous_steps = _setting('capacity_continuous_steps', 6)
+capacity_max_results = _setting('capacity_max_results', 50)
+# Largest grid of the capacity sweep evaluated in the web server process, larger ones go to the workers
+capacity_inprocess_max = _setting('capacity_inprocess_max', 100000)
+
+# Directory of the pickled linear_regression_<metric>_<component> models
+model_dir = _setting('model_dir', '.')
+# Seconds between checks of the loaded model files for changes (0 - no reload)
+model_watch_interval = _setting('model_watch_interval', 10.0)
+
+# Fast start: the server comes up before the first dataset is loaded, the page fills in after the warm-up
+fast_start = _setting('fast_start', False)
+# How often the browser checks for the first dataset during the warm-up, in seconds
+warmup_poll_interval = _setting('warmup_poll_interval', 1)
+
+# Shared dataset: workers attach to the dataset published by `python shared_dataset.py` instead of querying it
+shared_dataset = _setting('shared_dataset', False)
+shared_dataset_dir = _setting('shared_dataset_dir', '/dev/shm/dashboard_dataset' if os.path.isdir('/dev/shm') else os.path.join(tempfile.gettempdir(), 'dashboard_dataset'))
+# How often the workers check for a new generation, in seconds
+shared_dataset_poll_interval = _setting('shared_dataset_poll_interval', 5)
+# Generations kept by the publisher, workers may still be attached to the previous ones
+shared_dataset_keep = _setting('shared_dataset_keep', 2)
+
+# Time series drill-down: buckets fetched per visible window and points plotted after downsampling
+timeseries_buckets = _setting('timeseries_buckets', 10000)
+timeseries_points = _setting('timeseries_points', 2000)
+timeseries_cache_size = _setting('timeseries_cache_size', 64)
+# The drill-down queries PostgreSQL directly, workers of a shared dataset have no database by default
+timeseries_enabled = _setting('timeseries_enabled', not shared_dataset)
+
+# Async fan-out of the aggregate query: one query per application group (and time slice) over asyncpg
+async_fanout = _setting('async_fanout', False)
+# Partial queries running at once, also the size of the asyncpg pool
+async_concurrency = _setting('async_concurrency', 6)
+# Time ranges the metrics of every group are split into
+async_time_slices = _setting('async_time_slices', 1)
+
+# Loading the dataset and starting the refresher on import, embedding code (e.g. the benchmarks) publishes its own
+autostart = _setting('autostart', True)
+
+# Client-side mode: the data cube is sent to the browser once per dataset, which filters and plots by itself
+clientside_plots = _setting('clientside_plots', False)
+
+# Serialization of the responses: JSON engine of plotly/Dash, typed arrays (when plotly.js supports them) and gzip
+json_engine = _setting('json_engine', 'orjson')
+typed_arrays = _setting('typed_arrays', True)
+gzip_responses = _setting('gzip_responses', True)
+gzip_min_size = _setting('gzip_min_size', 1024)
+gzip_level = _setting('gzip_level', 6)
+
+# Coalescing of the bar plot requests of a browser tab: seconds a request waits for newer ones before computing
+coalesce_window = _setting('coalesce_window', 0.05)
+
+# Breakdowns by two dimensions: threads of the embedded DuckDB engine (0 - one per core) and cached results
+breakdown_threads = _setting('breakdown_threads', 0)
+breakdown_cache_size = _setting('breakdown_cache_size', 64)
+
+# Refitting the regression models from every published dataset, with polynomial terms up to the degree
+retrain_models = _setting('retrain_models', False)
+retrain_degree = _setting('retrain_degree', 1)
+
+# Quantile sketches for the percentile statistics of the bar plots: relative accuracy and persisted file
+sketches_enabled = _setting('sketches_enabled', False)
+sketch_accuracy = _setting('sketch_accuracy', 0.01)
+sketch_path = _setting('sketch_path', 'snapshot/sketches.parquet')
+
+# Exports: rows per streamed chunk, exports running at once and the Retry-After of the rejected ones
+export_chunk_size = _setting('export_chunk_size', 50000)
+export_concurrency = _setting('export_concurrency', 2)
+export_retry_after = _setting('export_retry_after', 5)
@@ -0,0 +1,141 @@
+# Aggregated dataset shared by the worker processes of a multi-process server
+#
+# One publisher process (`python shared_dataset.py`) loads the aggregates (sums and counts of the
+# metrics per configuration) with the loader of the dashboard and writes every changed load as a
+# new Arrow IPC generation into shared memory (/dev/shm), then points the `current` file at it
+# with an atomic rename. Workers memory-map the current generation read-only: the sum and count
+# columns are used zero-copy, the page cache holds a single copy for all workers. A worker
+# switches to a new generation by mapping it, old generations stay valid until unmapped.
+#
+# Only the aggregates are shared. Every worker derives its own means, bitmap index, data cube
+# and DuckDB copy (breakdown tab) from them, these are rebuilt per worker for every generation.
+# The quantile sketches are refreshed by the publisher before the generation with the same rows,
+# workers reload them from settings.sketch_path, which has to be on a file system they share.
+import logging
+import os
+import re
+import tempfile
+import time
+
+import settings
+from loader import create_loader, create_sketches
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = 'current'
+GENERATION_PATTERN = re.compile(r'^generation-(\d+)\.arrow$')
+
+
+def generation_file(generation):
+    return 'generation-{:08d}.arrow'.format(generation)
+
+
+# Name of the current generation file, None before the first publish
+def current_generation(directory):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as current_file:
+            return current_file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _generations(directory):
+    return sorted(int(match.group(1)) for match in map(GENERATION_PATTERN.match, os.listdir(directory)) if match)
+
+
+def _to_table(frame):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+
+    # Float columns keep NaN as a value instead of a null, so they map back without a copy
+    for position, column in enumerate(frame.columns):
+        if frame[column].dtype.kind == 'f':
+            table = table.set_column(position, table.field(position), pa.array(frame[column].to_numpy(), from_pandas=False))
+
+    return table
+
+
+# Writing the frame as the next generation and making it current, returns its file name
+def publish(frame, directory, keep=2):
+    import pyarrow as pa
+
+    os.makedirs(directory, exist_ok=True)
+
+    generations = _generations(directory)
+    name = generation_file(generations[-1] + 1 if generations else 1)
+
+    table = _to_table(frame)
+    temporary = os.path.join(directory, name + '.tmp')
+    with pa.OSFile(temporary, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporary, os.path.join(directory, name))
+
+    # Atomic switch of the pointer, readers see either the old or the new generation
+    fd, pointer = tempfile.mkstemp(dir=directory, prefix=CURRENT_FILE + '.')
+    with os.fdopen(fd, 'w') as pointer_file:
+        pointer_file.write(name)
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+    # Mapped generations stay readable after the unlink, new readers only open the current one
+    for generation in _generations(directory)[:-keep]:
+        os.remove(os.path.join(directory, generation_file(generation)))
+
+    logger.info('Published shared dataset %s (%d rows, %.1f kB)', name, len(frame), os.path.getsize(os.path.join(directory, name)) / 1024)
+
+    return name
+
+
+# Read-only frame over the memory-mapped generation file
+def attach(directory, name):
+    import pyarrow as pa
+
+    source = pa.memory_map(os.path.join(directory, name), 'r')
+    table = pa.ipc.open_file(source).read_all()
+
+    # Without consolidating the columns into blocks, the float columns point into the mapping
+    return table.to_pandas(split_blocks=True)
+
+
+# Aggregates of the current generation for the DatasetLoader of a worker, None while there is no new one
+class SharedDatasetReader:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.generation = None
+
+    def load(self):
+        name = current_generation(self.directory)
+        if name is None or name == self.generation:
+            return None
+
+        frame = attach(self.directory, name)
+        self.generation = name
+        logger.info('Attached shared dataset %s', name)
+
+        return frame
+
+
+# Publisher loop, every refresh_interval seconds (once if it is 0)
+def run_publisher(directory, interval):
+    loader = create_loader(create_sketches())
+
+    while True:
+        started = time.perf_counter()
+        try:
+            # None if no rows changed, the current generation stays
+            aggregates = loader.load()
+            if aggregates is not None:
+                publish(aggregates, directory, keep=settings.shared_dataset_keep)
+        except Exception:
+            logger.exception('Publishing the shared dataset failed')
+
+        if not interval:
+            return
+        time.sleep(max(interval - (time.perf_counter() - started), 0))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_publisher(settings.shared_dataset_dir, settings.refresh_interval)
@@ -0,0 +1,231 @@
+# Mergeable quantile sketches of the metrics per (group_name, configuration)
+#
+# A sketch is a DDSketch-style histogram over logarithmic buckets: a value x > 0 falls into bucket
+# ceil(log_gamma(x)) with gamma = (1 + a) / (1 - a), whose representative value is within the
+# relative accuracy a of every value in it. The bucket counts (and the exact maximum per bucket)
+# are computed by the database with one GROUP BY, so two sketches merge by adding their counts:
+# new rows are fetched incrementally above a high-water mark, like the aggregate snapshot, and a
+# filter state rolls the sketches of its configurations up to (group_name, X axis) in numpy.
+# Values at or below MIN_VALUE (e.g. an idle CPU) share one zero bucket.
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from bitmap_index import BitmapIndex
+from columns import METRIC_COLUMNS, PARAMETER_COLUMNS, FILTER_COLUMNS, KEY_COLUMNS, BASE_CONDITION
+from schema import apply_schema
+from snapshot import read_snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Statistics of the bar plots, the mean comes from the data cube
+QUANTILES = {'p50': 0.5, 'p95': 0.95, 'p99': 0.99}
+STATISTICS = ['mean'] + list(QUANTILES) + ['max']
+
+MIN_VALUE = 1e-9
+ZERO_BUCKET = -2 ** 31
+
+
+def gamma(accuracy):
+    return (1 + accuracy) / (1 - accuracy)
+
+
+# Bucket counts of every metric per configuration, optionally only for rows newer than %(since)s
+def sketch_query(accuracy, incremental=False):
+    parameters = ', '.join('parameters.' + column for column in PARAMETER_COLUMNS)
+    where = BASE_CONDITION + (' AND metrics.timestamp > %(since)s' if incremental else '')
+
+    selects = []
+    for metric in METRIC_COLUMNS:
+        bucket = 'CASE WHEN metrics.{0} > {1!r} THEN CAST(CEIL(LN(metrics.{0}) / {2!r}) AS INTEGER) ELSE {3} END'.format(metric, MIN_VALUE, math.log(gamma(accuracy)), ZERO_BUCKET)
+        selects.append('''SELECT metrics.group_name, {parameters}, '{metric}' AS metric, {bucket} AS bucket, COUNT(*) AS count, MAX(metrics.{metric}) AS max, MAX(metrics.timestamp) AS max_timestamp
+FROM metrics INNER JOIN parameters ON metrics.timestamp=parameters.timestamp
+WHERE {where} AND metrics.{metric} IS NOT NULL
+GROUP BY metrics.group_name, {parameters}, {bucket}
+'''.format(parameters=parameters, metric=metric, bucket=bucket, where=where))
+
+    return 'UNION ALL\n'.join(selects)
+
+
+def fetch_sketches(sql_queries, accuracy, since=None):
+    if since is None:
+        return sql_queries(sketch_query(accuracy))
+
+    return sql_queries(sketch_query(accuracy, incremental=True), params={'since': since})
+
+
+# Merging sketches: counts of the same bucket are added, the maxima and the newest timestamp kept
+def merge_sketches(frames):
+    frames = [frame for frame in frames if frame is not None and len(frame) != 0]
+    if len(frames) == 0:
+        return None
+    if len(frames) == 1:
+        return frames[0]
+
+    grouped = pd.concat(frames, ignore_index=True).groupby(KEY_COLUMNS + ['metric', 'bucket'], dropna=False, sort=False)
+
+    return grouped.agg({'count': 'sum', 'max': 'max', 'max_timestamp': 'max'}).reset_index()
+
+
+# Representative value of the buckets, within the relative accuracy of their values
+def bucket_values(buckets, accuracy):
+    base = gamma(accuracy)
+    values = 2 * np.power(base, buckets.astype(np.float64)) / (base + 1)
+
+    return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+
+# Published sketches of one load, never modified afterwards
+class SketchSet:
+
+    def __init__(self, frame, accuracy, mark, version):
+        self.frame = frame
+        self.accuracy = accuracy
+        self.mark = mark
+        self.version = version
+
+        # Rows and filter index of every metric
+        self.metrics = {}
+        for metric, rows in frame.groupby('metric', sort=False):
+            # Compact dtypes of the dataset, the filter values match them
+            rows = apply_schema(rows.reset_index(drop=True))[0]
+            self.metrics[metric] = (rows, BitmapIndex(rows, FILTER_COLUMNS))
+
+    # Sketch rows of every metric of the configurations matching the selections
+    def slice(self, selections):
+        return {metric: index.take(rows, selections) for metric, (rows, index) in self.metrics.items()}
+
+    # Statistic of every metric per (group_name, x_axis) of the configurations matching the selections
+    def rollup(self, selections, x_axis, statistic):
+        return self.rollup_slice(self.slice(selections), x_axis, statistic)
+
+    def rollup_slice(self, sliced, x_axis, statistic):
+        rolled = None
+
+        for metric in METRIC_COLUMNS:
+            if metric not in sliced:
+                continue
+
+            values = self._metric_rollup(sliced[metric], x_axis, statistic)
+            values = values.rename(columns={'value': metric})
+            rolled = values if rolled is None else rolled.merge(values, on=['group_name', x_axis], how='outer')
+
+        if rolled is None:
+            return pd.DataFrame(columns=['group_name', x_axis] + METRIC_COLUMNS)
+
+        return rolled
+
+    def _metric_rollup(self, rows, x_axis, statistic):
+        group_codes, groups = pd.factorize(rows['group_name'], sort=True)
+        x_codes, x_values = pd.factorize(rows[x_axis], sort=True)
+
+        # Rows with a missing group or X value are not plotted
+        valid = (group_codes >= 0) & (x_codes >= 0)
+        keys = group_codes[valid] * len(x_values) + x_codes[valid]
+        buckets = rows['bucket'].to_numpy(dtype=np.int64)[valid]
+        counts = rows['count'].to_numpy(dtype=np.int64)[valid]
+        maxima = rows['max'].to_numpy(dtype=np.float64)[valid]
+
+        if len(keys) == 0:
+            return pd.DataFrame({'group_name': [], x_axis: [], 'value': []})
+
+        # Buckets in ascending order within every (group_name, x_axis) cell
+        order = np.lexsort((buckets, keys))
+        keys, buckets, counts, maxima = keys[order], buckets[order], counts[order], maxima[order]
+
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        cell_keys = keys[starts]
+        cell_max = np.maximum.reduceat(maxima, starts)
+
+        if statistic == 'max':
+            value = cell_max
+        else:
+            # Bucket holding the value of rank q * (n - 1) of the cell, capped at the exact maximum
+            cumulative = np.cumsum(counts)
+            before = cumulative[starts] - counts[starts]
+            totals = np.add.reduceat(counts, starts)
+            positions = np.searchsorted(cumulative, before + QUANTILES[statistic] * (totals - 1), side='right')
+            value = np.minimum(bucket_values(buckets[positions], self.accuracy), cell_max)
+
+        return pd.DataFrame({
+            'group_name': np.asarray(groups)[cell_keys // len(x_values)],
+            x_axis: np.asarray(x_values)[cell_keys % len(x_values)],
+            'value': value
+        })
+
+
+class QuantileSketches:
+
+    def __init__(self, sql_queries, path, accuracy):
+        self.sql_queries = sql_queries
+        self.path = path
+        self.accuracy = accuracy
+        self.current = None
+
+        self._lock = threading.Lock()
+        # Modification time of the persisted sketches last reloaded
+        self._modified = None
+
+    def _write(self, frame, mark):
+        try:
+            write_snapshot(self.path, frame, mark, extra={'accuracy': self.accuracy})
+        except ImportError:
+            logger.warning('pyarrow is not installed, the sketches are not persisted')
+
+    # First load from the persisted sketches (or the database), then only the rows above the mark
+    def refresh(self):
+        with self._lock:
+            current = self.current
+
+            if current is None:
+                try:
+                    frame, mark = read_snapshot(self.path, expected={'accuracy': self.accuracy})
+                except ImportError:
+                    frame, mark = None, None
+            else:
+                frame, mark = current.frame, current.mark
+
+            if frame is None:
+                delta = fetch_sketches(self.sql_queries, self.accuracy)
+                frame = delta
+            else:
+                delta = fetch_sketches(self.sql_queries, self.accuracy, since=mark)
+                frame = merge_sketches([frame, delta])
+
+            if len(delta) != 0:
+                mark = frame['max_timestamp'].max()
+                self._write(frame, mark)
+            elif current is not None:
+                return False
+
+            self.current = SketchSet(frame, self.accuracy, mark, 1 if current is None else current.version + 1)
+            logger.info('Sketches version %d published (%d buckets, %d new)', self.current.version, len(frame), len(delta))
+
+        return True
+
+    # Taking over the sketches persisted by another process (the publisher of the shared dataset),
+    # without querying the database, returns False if they did not change
+    def reload(self):
+        with self._lock:
+            current = self.current
+
+            try:
+                modified = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                return False
+            if modified == self._modified:
+                return False
+
+            frame, mark = read_snapshot(self.path, expected={'accuracy': self.accuracy})
+            self._modified = modified
+            if frame is None or (current is not None and mark == current.mark):
+                return False
+
+            self.current = SketchSet(frame, self.accuracy, mark, 1 if current is None else current.version + 1)
+            logger.info('Sketches version %d reloaded (%d buckets)', self.current.version, len(frame))
+
+        return True
@@ -0,0 +1,236 @@
+# Persistent columnar snapshot of the aggregated dataset
+#
+# The snapshot keeps SUM and COUNT of every metric per (group_name, configuration) together with
+# the newest metrics.timestamp already included (high-water mark). On startup only the rows newer
+# than the mark are aggregated and merged in, the averages are then computed from sums and counts,
+# so they are exactly the same as the AVG of a full query.
+import json
+import logging
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from columns import METRIC_COLUMNS, PARAMETER_COLUMNS, KEY_COLUMNS, BASE_CONDITION
+from schema import KEY_DTYPES, concat_frames
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the layout of the snapshot file changes, older snapshots are rebuilt
+SNAPSHOT_VERSION = 1
+
+SUM_COLUMNS = [column + '_sum' for column in METRIC_COLUMNS]
+COUNT_COLUMNS = [column + '_count' for column in METRIC_COLUMNS]
+
+# Columns of the aggregate query, in order
+AGGREGATE_COLUMNS = ['group_name'] + [name for column in METRIC_COLUMNS for name in (column + '_sum', column + '_count')] + PARAMETER_COLUMNS + ['max_timestamp']
+
+
+# Query of sums and counts per configuration, optionally only for rows newer than %(since)s
+# and within extra WHERE conditions (e.g. one application or time range of a partial query)
+def aggregate_query(incremental=False, conditions=()):
+    select = ['metrics.group_name']
+    for column in METRIC_COLUMNS:
+        select.append('SUM(metrics.{0}) AS {0}_sum'.format(column))
+        select.append('COUNT(metrics.{0}) AS {0}_count'.format(column))
+    select += ['parameters.' + column for column in PARAMETER_COLUMNS]
+    select.append('MAX(metrics.timestamp) AS max_timestamp')
+
+    where = BASE_CONDITION
+    if incremental:
+        where += ' AND metrics.timestamp > %(since)s'
+    for condition in conditions:
+        where += ' AND ' + condition
+
+    group_by = ['metrics.group_name'] + ['parameters.' + column for column in PARAMETER_COLUMNS]
+
+    return 'SELECT {}\nFROM metrics INNER JOIN parameters ON metrics.timestamp=parameters.timestamp\nWHERE {}\nGROUP BY {}\n'.format(
+        ', '.join(select), where, ', '.join(group_by))
+
+
+# Newest timestamps as naive UTC, whether the column or the driver gives them with a time zone or not,
+# so the aggregates of both database paths and older snapshots merge and compare
+def naive_marks(aggregates):
+    if len(aggregates) != 0 and 'max_timestamp' in aggregates:
+        aggregates['max_timestamp'] = pd.to_datetime(aggregates['max_timestamp'], utc=True).dt.tz_localize(None)
+    return aggregates
+
+
+def naive_mark(mark):
+    if isinstance(mark, datetime) and mark.tzinfo is not None:
+        return pd.Timestamp(mark).tz_convert(None)
+    return mark
+
+
+# Merging partial aggregates, sums and counts are added, the newest timestamp is kept
+def merge_aggregates(frames):
+    frames = [frame for frame in frames if frame is not None and len(frame) != 0]
+    if len(frames) == 0:
+        return None
+    if len(frames) == 1:
+        return frames[0]
+
+    combined = concat_frames(frames)
+    grouped = combined.groupby(KEY_COLUMNS, dropna=False, observed=True, sort=False)
+
+    merged = grouped[SUM_COLUMNS + COUNT_COLUMNS].sum(min_count=1)
+    merged['max_timestamp'] = grouped['max_timestamp'].max()
+
+    return merged.reset_index()
+
+
+# Averages from sums and counts, same columns as the original AVG query
+def aggregate_means(aggregates):
+    means = pd.DataFrame({'group_name': aggregates['group_name']})
+
+    for column in METRIC_COLUMNS:
+        counts = aggregates[column + '_count']
+        means[column] = (aggregates[column + '_sum'] / counts.where(counts > 0)).astype(float)
+
+    for column in PARAMETER_COLUMNS:
+        means[column] = aggregates[column]
+
+    return means.reset_index(drop=True)
+
+
+# High-water mark (de)serialization for the file metadata
+def _encode_mark(mark):
+    if isinstance(mark, datetime):
+        return {'type': 'datetime', 'value': mark.isoformat()}
+    return {'type': 'number', 'value': mark.item() if hasattr(mark, 'item') else mark}
+
+
+def _decode_mark(encoded):
+    if encoded['type'] == 'datetime':
+        return pd.Timestamp(encoded['value'])
+    return encoded['value']
+
+
+# expected: extra metadata the snapshot has to be written with (e.g. the accuracy of the sketches)
+def read_snapshot(path, expected=None):
+    import pyarrow.parquet as pq
+
+    if not os.path.exists(path):
+        return None, None
+
+    table = pq.read_table(path)
+    metadata = json.loads((table.schema.metadata or {}).get(b'dashboard', b'{}'))
+
+    if (metadata.get('version') != SNAPSHOT_VERSION or metadata.get('high_water_mark') is None
+            or any(metadata.get(key) != value for key, value in (expected or {}).items())):
+        logger.warning('Snapshot %s has an outdated layout, rebuilding it', path)
+        return None, None
+
+    return table.to_pandas(), _decode_mark(metadata['high_water_mark'])
+
+
+# Writing to a temporary file and renaming it, so the data and the mark are replaced together
+def write_snapshot(path, aggregates, mark, extra=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    table = pa.Table.from_pandas(aggregates, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'dashboard'] = json.dumps(dict(extra or {}, version=SNAPSHOT_VERSION, high_water_mark=_encode_mark(mark))).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    temporary_path = path + '.tmp'
+    pq.write_table(table, temporary_path)
+    os.replace(temporary_path, path)
+
+
+# Aggregates of all rows, or of the rows newer than since, in one query
+# The key columns are typed while the result is read
+def fetch_aggregates(sql_queries, since=None):
+    if since is None:
+        aggregates = sql_queries(aggregate_query(), dtypes=KEY_DTYPES)
+    else:
+        aggregates = sql_queries(aggregate_query(incremental=True), params={'since': since}, dtypes=KEY_DTYPES)
+
+    # A chunked read of no rows has no columns
+    if len(aggregates) == 0:
+        return pd.DataFrame(columns=AGGREGATE_COLUMNS)
+
+    return naive_marks(aggregates)
+
+
+# Order-independent digest of the aggregates, equal for the same rows in any order
+def content_digest(aggregates):
+    return int(pd.util.hash_pandas_object(aggregates, index=False).sum())
+
+
+# Aggregates kept between refreshes: the first refresh reads the snapshot (or the whole database),
+# later ones only fetch the rows newer than the high-water mark. refresh() returns None when nothing
+# changed, so an unchanged database does not publish a new dataset version.
+class AggregateLoader:
+
+    def __init__(self, sql_queries, path=None, fetch=None):
+        # path None - no snapshot: every refresh fetches all the aggregates and compares their digest
+        # fetch(since) returns the aggregates of the database (fetch_aggregates by default)
+        self.sql_queries = sql_queries
+        self.path = path
+        self.fetch = fetch or (lambda since=None: fetch_aggregates(sql_queries, since))
+
+        self.aggregates = None
+        self.mark = None
+        self._digest = None
+
+    def refresh(self):
+        if self.path is None:
+            return self._refresh_all()
+
+        loaded = self.aggregates is not None
+        aggregates, mark = self.aggregates, self.mark
+
+        if not loaded:
+            try:
+                aggregates, mark = read_snapshot(self.path)
+            except ImportError:
+                logger.warning('pyarrow is not installed, the snapshot is disabled')
+                self.path = None
+                return self._refresh_all()
+
+            if aggregates is not None:
+                aggregates, mark = naive_marks(aggregates), naive_mark(mark)
+
+        if mark is None:
+            delta = self.fetch()
+            aggregates = delta
+        else:
+            delta = self.fetch(mark)
+            aggregates = merge_aggregates([aggregates, delta])
+
+        logger.info('Snapshot: %d new aggregated rows, high-water mark %s', len(delta), mark)
+
+        if len(delta) != 0:
+            mark = delta['max_timestamp'].max() if mark is None else max(mark, delta['max_timestamp'].max())
+            write_snapshot(self.path, aggregates, mark)
+        elif loaded:
+            return None
+
+        self.aggregates, self.mark = aggregates, mark
+        return aggregates
+
+    def _refresh_all(self):
+        aggregates = self.fetch()
+
+        digest = content_digest(aggregates)
+        if digest == self._digest:
+            return None
+
+        self.aggregates, self._digest = aggregates, digest
+        return aggregates
+
+
+# Loading the aggregates once: snapshot + rows newer than its high-water mark
+def load_aggregates(sql_queries, path, fetch=None):
+    return AggregateLoader(sql_queries, path, fetch).refresh()
+
+
+# Averaged dataset, same shape as the result of the original query
+def load_aggregated_data(sql_queries, path, fetch=None):
+    return aggregate_means(load_aggregates(sql_queries, path, fetch=fetch))
@@ -0,0 +1,33 @@
+# Startup phase timings: seconds from the import of this module to the first occurrence of each phase
+#
+# Imported first by index.py, so the reference point is the start of the dashboard import.
+# Phases: imports, app_created, layout_ready, first_response (time to first byte),
+# data_ready and first_figure. The imports phase still includes pandas and numpy, which the data
+# modules (db, snapshot, dataset, cube, ...) import at module level; plotly, psycopg2 and sklearn
+# are imported on first use.
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STARTED = time.perf_counter()
+
+_phases = {}
+_lock = threading.Lock()
+
+
+# Recording a phase once, later calls keep the first timing
+def mark(phase):
+    with _lock:
+        if phase in _phases:
+            return False
+        _phases[phase] = time.perf_counter() - STARTED
+
+    logger.info('Startup phase %s after %.3f s', phase, _phases[phase])
+    return True
+
+
+def report():
+    with _lock:
+        return dict(sorted(_phases.items(), key=lambda item: item[1]))
@@ -0,0 +1,108 @@
+# Shared fixtures of the tests: small synthetic frames shaped like the dashboard's data
+#
+#   python -m pytest tests
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The dashboard modules are top-level modules of the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columns import GROUP_NAMES, KEY_COLUMNS, METRIC_COLUMNS, PARAMETER_COLUMNS  # noqa: E402
+from sketch import MIN_VALUE, ZERO_BUCKET, gamma  # noqa: E402
+
+# Parameter values the configurations are drawn from, as in benchmarks/generate.py
+PARAMETER_VALUES = {
+    'application_instances_value': [1, 2, 4],
+    'application_case_value': ['quasi_real', 'random'],
+    'application_metric_count_value': [10000, 30000, 100000, 300000, 1000000],
+    'application_labels_value': [10.0, 20.0, 40.0],
+    'cortex_number_of_nginx_value': [1, 2],
+    'cortex_number_of_distributor_value': [1, 2, 3],
+    'cortex_number_of_ingester_value': [1, 2, 3, 4],
+    'cortex_blocks_storage_tsdb_block_ranges_period_value': [3600, 7200],
+    'cortex_blocks_storage_tsdb_retention_period_value': [21600, 43200, 86400],
+    'cortex_blocks_storage_tsdb_wal_compression_value': [0, 1],
+    'cortex_compactor_blocks_ranges_value': [7200, 14400]
+}
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+# Measurements of random configurations: one row per (timestamp, group_name), lognormal metrics
+# with a few missing values and a few missing parameters
+@pytest.fixture
+def measurements(rng):
+    rows = 3000
+    frame = pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=rows, freq='s'),
+        'group_name': rng.choice(GROUP_NAMES, rows)
+    })
+
+    for column in PARAMETER_COLUMNS:
+        frame[column] = rng.choice(PARAMETER_VALUES[column], rows)
+
+    frame['cortex_compactor_blocks_ranges_value'] = frame['cortex_compactor_blocks_ranges_value'].where(rng.random(rows) >= 0.02)
+
+    for column in METRIC_COLUMNS:
+        values = rng.lognormal(3, 1, rows)
+        values[rng.random(rows) < 0.05] = np.nan
+        frame[column] = values
+
+    return frame
+
+
+# Sums, counts and newest timestamp per configuration of the measurements, like aggregate_query
+def aggregate(frame):
+    grouped = frame.groupby(KEY_COLUMNS, dropna=False, sort=False)
+
+    aggregates = grouped[METRIC_COLUMNS].sum(min_count=1).add_suffix('_sum')
+    aggregates = aggregates.join(grouped[METRIC_COLUMNS].count().add_suffix('_count'))
+    aggregates['max_timestamp'] = grouped['timestamp'].max()
+
+    return aggregates.reset_index()
+
+
+# Sketch rows of the measurements, computed like the GROUP BY of sketch_query
+def sketch_rows(frame, accuracy):
+    parts = []
+    for metric in METRIC_COLUMNS:
+        rows = frame[frame[metric].notna()]
+        values = rows[metric].to_numpy()
+        positive = values > MIN_VALUE
+        buckets = np.full(len(values), ZERO_BUCKET, dtype=np.int64)
+        buckets[positive] = np.ceil(np.log(values[positive]) / np.log(gamma(accuracy)))
+
+        rows = rows[KEY_COLUMNS + ['timestamp']].assign(metric=metric, bucket=buckets, value=values)
+        grouped = rows.groupby(KEY_COLUMNS + ['metric', 'bucket'], dropna=False)
+        parts.append(grouped.agg(count=('value', 'size'), max=('value', 'max'), max_timestamp=('timestamp', 'max')).reset_index())
+
+    return pd.concat(parts, ignore_index=True)
+
+
+# Database of the measurements for the loaders: fetch(since) answers the aggregate query, only
+# over the rows newer than since when it is given, and records every since it was called with
+class Database:
+
+    def __init__(self, measurements):
+        self.measurements = measurements
+        self.calls = []
+
+    def fetch(self, since=None):
+        self.calls.append(since)
+        rows = self.measurements if since is None else self.measurements[self.measurements['timestamp'] > since]
+        return aggregate(rows)
+
+    def append(self, rows):
+        self.measurements = pd.concat([self.measurements, rows], ignore_index=True)
+
+
+@pytest.fixture
+def database(measurements):
+    return Database(measurements)
@@ -0,0 +1,92 @@
+# Fan-out of the aggregate query: placeholders, partial queries and the merged result, run on SQLite
+import asyncio
+import re
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from async_db import _fanout, numbered_query, partial_query
+from columns import GROUP_NAMES, KEY_COLUMNS, METRIC_COLUMNS, PARAMETER_COLUMNS
+from conftest import aggregate
+from snapshot import COUNT_COLUMNS, SUM_COLUMNS, merge_aggregates
+
+
+# The asyncpg pool methods used by the fan-out over an SQLite connection, $n become ?n
+class SQLitePool:
+
+    def __init__(self, connect):
+        self.connect = connect
+        self.connect.row_factory = sqlite3.Row
+        self.queries = []
+
+    def _execute(self, query, args):
+        self.queries.append(query)
+        # Timestamps are stored as text by to_sql
+        args = [str(pd.Timestamp(arg)) if hasattr(arg, 'tzinfo') else arg for arg in args]
+        return self.connect.execute(re.sub(r'\$(\d+)', r'?\1', query), args).fetchall()
+
+    async def fetch(self, query, *args):
+        return self._execute(query, args)
+
+    async def fetchrow(self, query, *args):
+        row = self._execute(query, args)[0]
+        return {key: None if row[key] is None else pd.Timestamp(row[key]).to_pydatetime() for key in row.keys()}
+
+    async def fetchval(self, query, *args):
+        return False
+
+
+@pytest.fixture
+def pool(measurements):
+    connect = sqlite3.connect(':memory:')
+    timestamps = measurements['timestamp'].astype(str)
+    measurements[['group_name'] + METRIC_COLUMNS].assign(timestamp=timestamps).to_sql('metrics', connect, index=False)
+    measurements[PARAMETER_COLUMNS].assign(timestamp=timestamps, prometheus_remote_write_max_samples_per_send_value=None).to_sql('parameters', connect, index=False)
+
+    yield SQLitePool(connect)
+    connect.close()
+
+
+def assert_same_aggregates(merged, expected):
+    merged = merged.astype({column: object for column in KEY_COLUMNS}).astype({'cortex_blocks_storage_tsdb_wal_compression_value': np.int64})
+    merged = merged.sort_values(KEY_COLUMNS).reset_index(drop=True)
+    expected = expected.sort_values(KEY_COLUMNS).reset_index(drop=True)
+
+    assert len(merged) == len(expected)
+    pd.testing.assert_frame_equal(merged[KEY_COLUMNS], expected[KEY_COLUMNS], check_dtype=False)
+    np.testing.assert_allclose(merged[SUM_COLUMNS].to_numpy(dtype=np.float64), expected[SUM_COLUMNS].to_numpy(dtype=np.float64), rtol=1e-12)
+    np.testing.assert_array_equal(merged[COUNT_COLUMNS].to_numpy(), expected[COUNT_COLUMNS].to_numpy())
+    np.testing.assert_array_equal(merged['max_timestamp'].to_numpy(), expected['max_timestamp'].to_numpy())
+
+
+def test_placeholders_are_numbered_by_first_use():
+    query, args = numbered_query('a = %(x)s AND b > %(y)s OR c = %(x)s', {'y': 2, 'x': 1, 'unused': 3})
+
+    assert query == 'a = $1 AND b > $2 OR c = $1'
+    assert args == [1, 2]
+
+
+def test_partial_queries_cover_their_slice():
+    query, args = partial_query(GROUP_NAMES[0], None, ('start', 'end', False))
+    last_query, _ = partial_query(GROUP_NAMES[0], 'since', ('start', 'end', True))
+
+    assert 'metrics.timestamp < $3' in query and args == [GROUP_NAMES[0], 'start', 'end']
+    assert 'metrics.timestamp <= ' in last_query and 'metrics.timestamp > $1' in last_query
+
+
+@pytest.mark.parametrize('slices', [1, 3])
+def test_merged_partial_results_equal_the_aggregates(pool, measurements, slices):
+    frames, pieces = asyncio.run(_fanout(pool, None, 4, slices))
+
+    assert pieces == len(GROUP_NAMES) * slices
+    assert_same_aggregates(merge_aggregates(frames), aggregate(measurements))
+
+
+def test_incremental_fanout_has_only_newer_rows(pool, measurements):
+    since = measurements['timestamp'].iloc[2000]
+
+    frames, pieces = asyncio.run(_fanout(pool, since, 2, 2))
+
+    assert_same_aggregates(merge_aggregates(frames), aggregate(measurements[measurements['timestamp'] > since]))
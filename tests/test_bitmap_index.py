@@ -0,0 +1,53 @@
+# Bitmap index against the isin filters it replaces
+import numpy as np
+import pandas as pd
+import pytest
+
+from bitmap_index import BitmapIndex
+from columns import FILTER_COLUMNS
+from schema import apply_schema
+
+SELECTIONS = [
+    {'cortex_number_of_ingester_value': [2, 3]},
+    {'application_case_value': ['random'], 'cortex_number_of_distributor_value': [1, 3], 'application_labels_value': [20.0]},
+    {'cortex_compactor_blocks_ranges_value': [7200], 'cortex_blocks_storage_tsdb_wal_compression_value': [1]},
+    # Values missing from the data match nothing
+    {'cortex_number_of_ingester_value': [99]},
+    {'cortex_number_of_ingester_value': []}
+]
+
+
+def filtered(frame, selections):
+    for column, values in selections.items():
+        frame = frame[frame[column].isin(values)]
+    return frame
+
+
+@pytest.fixture(params=['plain', 'compact'])
+def frame(request, measurements):
+    # The dataset is indexed after apply_schema, with categorical columns
+    return measurements if request.param == 'plain' else apply_schema(measurements)[0]
+
+
+@pytest.mark.parametrize('selections', SELECTIONS)
+def test_matches_isin(frame, selections):
+    index = BitmapIndex(frame, FILTER_COLUMNS)
+    expected = filtered(frame, selections)
+
+    np.testing.assert_array_equal(index.positions(selections), np.flatnonzero(frame.index.isin(expected.index)))
+    pd.testing.assert_frame_equal(index.take(frame, selections), expected)
+
+
+def test_nothing_selected_takes_every_row(frame):
+    index = BitmapIndex(frame, FILTER_COLUMNS)
+
+    assert index.positions({}) is None
+    assert index.take(frame, {}) is frame
+
+
+def test_missing_values_are_never_matched(measurements):
+    index = BitmapIndex(measurements, FILTER_COLUMNS)
+    positions = index.positions({'cortex_compactor_blocks_ranges_value': [7200, 14400, np.nan]})
+
+    assert measurements['cortex_compactor_blocks_ranges_value'].iloc[positions].notna().all()
+    assert len(positions) == measurements['cortex_compactor_blocks_ranges_value'].notna().sum()
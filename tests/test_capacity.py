@@ -0,0 +1,83 @@
+# Capacity sweep: the Pareto front, the budgets and the worker pool against the serial sweep
+import numpy as np
+import pytest
+
+import capacity
+from prediction import FEATURES, MODEL_TARGETS, PredictionEngine
+
+
+class LinearModel:
+
+    def __init__(self, coefficients, intercept):
+        self.coef_ = coefficients
+        self.intercept_ = intercept
+
+
+@pytest.fixture
+def engine(rng):
+    return PredictionEngine({target: LinearModel(rng.uniform(0, 1, len(FEATURES)), rng.uniform(0, 10)) for target in MODEL_TARGETS})
+
+
+@pytest.fixture
+def feature_values():
+    values = {feature: [0, 1] for feature in FEATURES}
+    values.update(application_metric_count=[10000, 100000], number_of_nginx=[1, 2, 3], number_of_ingester=[1, 2, 3, 4])
+    return values
+
+
+def dominated(objectives, row):
+    return np.any(np.all(objectives <= objectives[row], axis=1) & np.any(objectives < objectives[row], axis=1))
+
+
+def test_pareto_front_is_every_non_dominated_row(rng):
+    # Few distinct values, so there are ties and duplicates
+    objectives = rng.integers(0, 5, size=(300, 3)).astype(np.float64)
+
+    front = capacity.pareto_front(objectives)
+
+    assert not any(dominated(objectives, row) for row in front)
+    rest = np.setdiff1d(np.arange(len(objectives)), front)
+    assert all(dominated(objectives, row) or any((objectives[row] == objectives[front]).all(axis=1)) for row in rest)
+
+
+def test_grid_has_every_combination_in_feature_order(feature_values):
+    grid = capacity.configuration_grid(feature_values)
+
+    assert grid.shape == (np.prod([len(values) for values in feature_values.values()]), len(FEATURES))
+    assert len(np.unique(grid, axis=0)) == len(grid)
+    assert set(grid[:, FEATURES.index('number_of_ingester')]) == {1, 2, 3, 4}
+
+
+def test_continuous_values_keep_the_measured_ones_within_the_bounds():
+    assert capacity.continuous_values(10, 1000, [5, 20, 2000], 3) == [10, 20, 100, 1000]
+
+
+def test_results_fit_the_budgets(engine, feature_values):
+    unbounded, grid_size = capacity.sweep(engine, feature_values, {})
+    cpu = np.median([row['cpu'] for row in unbounded])
+
+    rows, _ = capacity.sweep(engine, feature_values, {'cpu': cpu, 'memory': None})
+
+    assert grid_size == len(capacity.configuration_grid(feature_values))
+    assert rows and all(row['cpu'] <= cpu for row in rows)
+    assert all(row['instances'] == row['number_of_nginx'] + row['number_of_distributor'] + row['number_of_ingester'] for row in rows)
+
+
+def test_small_grids_are_evaluated_in_process(engine, feature_values, monkeypatch):
+    monkeypatch.setattr(capacity, 'get_pool', lambda workers: pytest.fail('A pool was started'))
+
+    capacity.sweep(engine, feature_values, {}, workers=2, chunk_size=50, inprocess_max=10 ** 6)
+
+
+def test_pool_finds_the_serial_front(engine, feature_values):
+    serial = capacity.sweep(engine, feature_values, {}, chunk_size=50)
+
+    try:
+        parallel = capacity.sweep(engine, feature_values, {}, workers=2, chunk_size=50)
+        # The workers run the entry module, not the main module of the test run
+        main = capacity.get_pool(2).submit(eval, "__import__('sys').modules['__main__'].__file__").result()
+    finally:
+        capacity.shutdown_pool()
+
+    assert parallel == serial
+    assert main.endswith('capacity_worker.py')
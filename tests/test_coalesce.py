@@ -0,0 +1,107 @@
+# Coalescing of request bursts per session and sharing of identical concurrent computations
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from dash.exceptions import PreventUpdate
+
+from coalesce import Coalescer, SingleFlight
+
+
+def test_newer_request_of_a_session_supersedes():
+    coalescer = Coalescer(0)
+    first = coalescer.begin('tab', 'bar_plots')
+    other_callback = coalescer.begin('tab', 'regression')
+    other_session = coalescer.begin('other tab', 'bar_plots')
+
+    second = coalescer.begin('tab', 'bar_plots')
+
+    assert coalescer.superseded(first)
+    with pytest.raises(PreventUpdate):
+        coalescer.settle(first)
+    for ticket in (second, other_callback, other_session):
+        coalescer.check(ticket)
+
+
+def test_requests_without_a_session_are_never_superseded():
+    coalescer = Coalescer(0)
+
+    assert coalescer.begin(None, 'bar_plots') is None
+    coalescer.check(None)
+
+
+def test_oldest_sessions_are_forgotten():
+    coalescer = Coalescer(0, max_sessions=2)
+    forgotten = coalescer.begin('a', 'bar_plots')
+    coalescer.begin('b', 'bar_plots')
+    coalescer.begin('c', 'bar_plots')
+
+    # Without a record the request runs
+    assert not coalescer.superseded(forgotten)
+    assert len(coalescer._latest) == 2
+
+
+def test_burst_keeps_only_the_last_request():
+    coalescer = Coalescer(0.05)
+    tickets = [coalescer.begin('tab', 'bar_plots') for _ in range(5)]
+
+    def run(ticket):
+        try:
+            coalescer.settle(ticket)
+            return True
+        except PreventUpdate:
+            return False
+
+    with ThreadPoolExecutor(5) as pool:
+        assert list(pool.map(run, tickets)) == [False] * 4 + [True]
+
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'figure'
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(flight.do, 'key', compute)
+        started.wait(5)
+        followers = [pool.submit(flight.do, 'key', compute) for _ in range(3)]
+        # Time for the followers to find the running call
+        time.sleep(0.2)
+        release.set()
+
+        assert leader.result() == ('figure', False)
+        results = [future.result() for future in followers]
+
+    assert len(calls) == 1
+    assert results == [('figure', True)] * 3
+
+    # Finished calls are not kept, the next one computes again
+    assert flight.do('key', lambda: 'new') == ('new', False)
+
+
+def test_error_is_raised_for_every_caller():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError('query failed')
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, 'key', fail)
+        started.wait(5)
+        follower = pool.submit(flight.do, 'key', fail)
+        time.sleep(0.2)
+        release.set()
+
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
@@ -0,0 +1,75 @@
+# Data cube against the filtered pandas frame it replaces
+import numpy as np
+import pandas as pd
+import pytest
+
+from columns import FILTER_COLUMNS, METRIC_COLUMNS, PARAMETER_COLUMNS
+from conftest import aggregate
+from cube import DataCube
+from dataset import build_dataset
+
+SELECTIONS = [
+    {},
+    {'cortex_number_of_ingester_value': [2, 3]},
+    {'application_case_value': ['random'], 'cortex_number_of_distributor_value': [1, 3], 'application_labels_value': [20.0]},
+    {'cortex_compactor_blocks_ranges_value': [7200], 'cortex_blocks_storage_tsdb_wal_compression_value': [1]},
+    # Values missing from the data match nothing
+    {'cortex_number_of_ingester_value': [99]}
+]
+
+X_AXES = ['cortex_number_of_ingester_value', 'application_case_value', 'cortex_compactor_blocks_ranges_value']
+
+
+def filtered(frame, selections):
+    for column, values in selections.items():
+        frame = frame[frame[column].isin(values)]
+    return frame
+
+
+# AVG of the filtered measurements per (group_name, X axis), not an average of configuration averages
+def expected_means(measurements, selections, x_axis):
+    return filtered(measurements, selections).groupby(['group_name', x_axis])[METRIC_COLUMNS].mean().sort_index()
+
+
+def assert_means(rolled, expected, x_axis):
+    rolled = rolled.set_index(['group_name', x_axis]).sort_index()
+
+    assert list(rolled.index) == list(expected.index)
+    np.testing.assert_allclose(rolled[METRIC_COLUMNS].to_numpy(dtype=np.float64), expected.to_numpy(), rtol=1e-12)
+
+
+@pytest.mark.parametrize('x_axis', X_AXES)
+@pytest.mark.parametrize('selections', SELECTIONS)
+def test_rollup_of_aggregates_matches_avg_of_the_measurements(measurements, selections, x_axis):
+    cube = DataCube(aggregate(measurements), PARAMETER_COLUMNS, METRIC_COLUMNS)
+
+    assert_means(cube.rollup(selections, x_axis), expected_means(measurements, selections, x_axis), x_axis)
+
+
+@pytest.mark.parametrize('x_axis', X_AXES)
+@pytest.mark.parametrize('selections', SELECTIONS)
+def test_rollup_of_rows_matches_groupby_mean(measurements, selections, x_axis):
+    cube = DataCube(measurements, FILTER_COLUMNS, METRIC_COLUMNS)
+
+    assert_means(cube.rollup(selections, x_axis), expected_means(measurements, selections, x_axis), x_axis)
+
+
+@pytest.mark.parametrize('selections', SELECTIONS[1:3])
+def test_dataset_cube_is_exact(measurements, selections):
+    # Typed like the published dataset, the selections are the dropdown values
+    dataset = build_dataset(aggregate(measurements), 1)
+    x_axis = 'cortex_number_of_nginx_value'
+
+    assert_means(dataset.cube.rollup(selections, x_axis), expected_means(measurements, selections, x_axis), x_axis)
+
+    # The configurations differ in their number of measurements, so averaging their means would not match
+    configuration_means = filtered(dataset.data, selections).groupby(['group_name', x_axis], observed=True)[METRIC_COLUMNS].mean()
+    assert not np.allclose(configuration_means.sort_index().to_numpy(dtype=np.float64), expected_means(measurements, selections, x_axis).to_numpy())
+
+
+def test_rollup_of_a_slice_matches_rollup(measurements):
+    cube = DataCube(aggregate(measurements), PARAMETER_COLUMNS, METRIC_COLUMNS)
+    selections = SELECTIONS[2]
+
+    pd.testing.assert_frame_equal(cube.rollup_slice(cube.slice(selections), 'application_labels_value'),
+                                  cube.rollup(selections, 'application_labels_value'))
@@ -0,0 +1,54 @@
+# Background refresh of the dataset: new versions only when the database changed
+import numpy as np
+import pandas as pd
+import pytest
+
+from columns import METRIC_COLUMNS
+from dataset import DatasetRefresher
+from snapshot import AggregateLoader
+
+pytest.importorskip('pyarrow')
+
+
+def later_rows(measurements, rows=50):
+    later = measurements.sample(rows, random_state=2).reset_index(drop=True)
+    later['timestamp'] = measurements['timestamp'].max() + pd.to_timedelta(np.arange(1, rows + 1), unit='s')
+    later[METRIC_COLUMNS] = later[METRIC_COLUMNS] * 2
+    return later
+
+
+@pytest.fixture(params=['snapshot', 'no snapshot'])
+def refresher(request, database, tmp_path):
+    loader = AggregateLoader(None, str(tmp_path / 'aggregated.parquet') if request.param == 'snapshot' else None, fetch=database.fetch)
+
+    refresher = DatasetRefresher(loader.refresh, 0)
+    refresher.published = []
+    refresher.listeners.append(refresher.published.append)
+    return refresher
+
+
+def test_refresh_without_new_rows_keeps_the_version(refresher, database, measurements):
+    assert refresher.refresh()
+    first = refresher.current
+
+    assert not refresher.refresh()
+    assert not refresher.refresh()
+    assert refresher.current is first
+    assert first.version == 1
+
+    database.append(later_rows(measurements))
+    assert refresher.refresh()
+    assert refresher.current.version == 2
+    assert not refresher.refresh()
+
+    assert [dataset.version for dataset in refresher.published] == [1, 2]
+
+
+def test_first_load_from_an_unchanged_snapshot_is_published(database, tmp_path):
+    path = str(tmp_path / 'aggregated.parquet')
+    AggregateLoader(None, path, fetch=database.fetch).refresh()
+
+    # A restarted dashboard gets the snapshot although no rows are new
+    loader = AggregateLoader(None, path, fetch=database.fetch)
+    assert len(loader.refresh()) != 0
+    assert loader.refresh() is None
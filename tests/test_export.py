@@ -0,0 +1,96 @@
+# Exports: the encoded formats, the parsing of the filter values and the export endpoint
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import settings
+from conftest import aggregate
+from dataset import build_dataset
+from export import encode, filter_values, frame_chunks, frame_schema
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+@pytest.fixture
+def dataset(measurements):
+    return build_dataset(aggregate(measurements), 1)
+
+
+def decoded(chunks, format):
+    data = b''.join(chunks)
+    if format == 'csv':
+        return pd.read_csv(io.BytesIO(data))
+    if format == 'parquet':
+        return pq.read_table(io.BytesIO(data)).to_pandas()
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+
+@pytest.mark.parametrize('format', ['csv', 'parquet', 'arrow'])
+def test_chunks_decode_to_the_frame(dataset, format):
+    frame = dataset.data.iloc[:500]
+
+    result = decoded(encode(frame_chunks(frame, 128), format, frame_schema(dataset.data)), format)
+
+    assert len(result) == len(frame)
+    assert list(result.columns) == list(frame.columns)
+    np.testing.assert_allclose(result['du_disk_usage_value'].to_numpy(dtype=np.float64), frame['du_disk_usage_value'].to_numpy(dtype=np.float64), rtol=1e-6)
+    pd.testing.assert_series_equal(result['cortex_compactor_blocks_ranges_value'].astype(np.float64),
+                                   frame['cortex_compactor_blocks_ranges_value'].astype(np.float64).reset_index(drop=True))
+
+
+@pytest.mark.parametrize('format', ['csv', 'parquet', 'arrow'])
+def test_export_without_rows_has_the_columns(dataset, format):
+    result = decoded(encode(frame_chunks(dataset.data.iloc[:0], 128), format, frame_schema(dataset.data)), format)
+
+    assert len(result) == 0
+    assert list(result.columns) == list(dataset.data.columns)
+
+
+def test_filter_values_take_the_dtype_of_the_column(dataset):
+    data = dataset.data
+
+    # A nullable column has float categories
+    assert filter_values(data['cortex_compactor_blocks_ranges_value'], ['7200', '14400']) == [7200.0, 14400.0]
+    assert filter_values(data['cortex_number_of_ingester_value'], ['2']) == [2]
+    assert filter_values(data['application_case_value'], ['random']) == ['random']
+    assert filter_values(data['cortex_blocks_storage_tsdb_wal_compression_value'], ['True', '0']) == [True, False]
+
+    assert filter_values(data['cortex_number_of_ingester_value'], ['2.5']) is None
+    assert filter_values(data['cortex_compactor_blocks_ranges_value'], ['x']) is None
+    assert filter_values(data['cortex_blocks_storage_tsdb_wal_compression_value'], ['yes']) is None
+
+
+@pytest.fixture(scope='module')
+def index():
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(settings, 'autostart', False)
+        patch.setattr(settings, 'model_watch_interval', 0)
+        import index
+
+    return index
+
+
+@pytest.fixture
+def client(index, dataset, monkeypatch):
+    monkeypatch.setattr(index.refresher, 'current', dataset)
+    return index.app.server.test_client()
+
+
+def test_export_filtered_on_a_nullable_column(client, dataset):
+    response = client.get('/api/export?kind=configurations&format=csv&tsdb_compactor_blocks_ranges=7200&tsdb_wal_compression=True')
+
+    assert response.status_code == 200
+    result = pd.read_csv(io.BytesIO(response.data))
+    expected = dataset.data[dataset.data['cortex_compactor_blocks_ranges_value'].eq(7200) & dataset.data['cortex_blocks_storage_tsdb_wal_compression_value']]
+    assert len(result) == len(expected) != 0
+    assert set(result['cortex_compactor_blocks_ranges_value']) == {7200}
+
+
+@pytest.mark.parametrize('value', ['7201', 'x'])
+def test_export_with_an_unknown_filter_value(client, value):
+    response = client.get('/api/export?kind=configurations&format=csv&tsdb_compactor_blocks_ranges=' + value)
+
+    assert response.status_code == 400
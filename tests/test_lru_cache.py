@@ -0,0 +1,48 @@
+# LRU cache of the figures and plot data: eviction by entries, bytes and age
+import lru_cache
+from lru_cache import LRUCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_size_is_bounded_by_bytes():
+    cache = LRUCache(10, max_bytes=10)
+    cache.put('a', 'x' * 4)
+    cache.put('b', 'x' * 4)
+    cache.put('c', 'x' * 4)
+
+    assert cache.get('a') is None
+    assert cache.size_bytes == 8
+
+    # A value larger than the whole cache is not kept and evicts nothing
+    cache.put('d', 'x' * 11)
+    assert cache.get('d') is None
+    assert len(cache) == 2
+
+    # Replacing an entry counts only its new size
+    cache.put('b', 'x')
+    assert cache.size_bytes == 5
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(lru_cache.time, 'monotonic', lambda: now[0])
+    cache = LRUCache(2, ttl=5)
+    cache.put('a', 1)
+
+    now[0] += 5
+    assert cache.get('a') == 1
+    now[0] += 1
+    assert cache.get('a') is None
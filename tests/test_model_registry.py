@@ -0,0 +1,106 @@
+# Model registry: lazy loading, versions, reloading changed files and the engine rebuilt on new versions
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from model_registry import ModelRegistry
+from prediction import DISK_FORMULAS, FEATURES, MODEL_TARGETS, RegistryEngine
+
+
+class LinearModel:
+
+    def __init__(self, intercept):
+        self.coef_ = np.ones(len(FEATURES))
+        self.intercept_ = intercept
+
+
+def write_model(registry, key, model, modified=None):
+    path = registry.path(*key)
+    with open(path, 'wb') as model_file:
+        pickle.dump(model, model_file)
+
+    # A distinct modification time, file systems may keep coarse ones
+    if modified is not None:
+        os.utime(path, ns=(modified, modified))
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = ModelRegistry(str(tmp_path), 0)
+    for key in MODEL_TARGETS:
+        write_model(registry, key, LinearModel(1.0), 10 ** 18)
+    return registry
+
+
+def test_models_are_loaded_on_first_use(registry):
+    assert registry.versions() == {}
+
+    model = registry.get(*MODEL_TARGETS[0])
+
+    assert model.intercept_ == 1.0
+    assert registry.get(*MODEL_TARGETS[0]) is model
+    assert list(registry.versions()) == ['{}_{}'.format(*MODEL_TARGETS[0])]
+    assert registry.load_stats['{}_{}'.format(*MODEL_TARGETS[0])]['loads'] == 1
+
+
+def test_changed_files_are_reloaded(registry):
+    key = MODEL_TARGETS[0]
+    old = registry.entry(*key)
+
+    # Touched with the same content: same version, same model
+    write_model(registry, key, LinearModel(1.0), 2 * 10 ** 18)
+    registry.reload_changed()
+    assert registry.entry(*key).version == old.version
+    assert registry.get(*key) is old.model
+
+    write_model(registry, key, LinearModel(2.0), 3 * 10 ** 18)
+    registry.reload_changed()
+    assert registry.entry(*key).version != old.version
+    assert registry.get(*key).intercept_ == 2.0
+
+
+def test_broken_file_keeps_the_old_model(registry):
+    key = MODEL_TARGETS[0]
+    model = registry.get(*key)
+
+    with open(registry.path(*key), 'wb') as model_file:
+        model_file.write(b'not a pickle')
+    os.utime(registry.path(*key), ns=(2 * 10 ** 18, 2 * 10 ** 18))
+    registry.reload_changed()
+
+    assert registry.get(*key) is model
+
+
+def test_optional_models_are_found_when_added_later(registry):
+    models, versions = registry.snapshot(MODEL_TARGETS, optional_keys=DISK_FORMULAS)
+    assert set(models) == set(MODEL_TARGETS)
+
+    disk_key = next(iter(DISK_FORMULAS))
+    write_model(registry, disk_key, LinearModel(5.0))
+    assert set(registry.snapshot(MODEL_TARGETS, optional_keys=DISK_FORMULAS)[0]) == set(MODEL_TARGETS)
+
+    # The watcher looks for the missing files again
+    registry.reload_changed()
+    models, later_versions = registry.snapshot(MODEL_TARGETS, optional_keys=DISK_FORMULAS)
+    assert set(models) == set(MODEL_TARGETS) | {disk_key}
+    assert later_versions != versions
+
+
+def test_engine_is_rebuilt_only_for_new_versions(registry):
+    engine = RegistryEngine(registry)
+    configurations = np.ones((3, len(FEATURES)))
+
+    names, first = engine.predict(configurations)
+    built = engine.engine()
+    assert engine.engine() is built
+
+    registry.publish(*MODEL_TARGETS[0], LinearModel(11.0), 'refitted')
+    names, second = engine.predict([dict(zip(FEATURES, row)) for row in configurations], as_dictionaries=True)
+
+    assert engine.engine() is not built
+    np.testing.assert_allclose(second[:, 0] - first[:, 0], 10.0)
+    np.testing.assert_array_equal(second[:, 1:], first[:, 1:])
+    assert engine.predict_stats['calls'] == 2
+    assert engine.predict_stats['configurations'] == 6
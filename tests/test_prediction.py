@@ -0,0 +1,76 @@
+# Vectorized prediction engine against the predict() of every model
+import numpy as np
+import pytest
+
+from prediction import DISK_FORMULAS, FEATURES, MODEL_TARGETS, TARGETS, PredictionEngine
+
+linear_model = pytest.importorskip('sklearn.linear_model')
+pipeline = pytest.importorskip('sklearn.pipeline')
+preprocessing = pytest.importorskip('sklearn.preprocessing')
+
+
+@pytest.fixture
+def configurations(rng):
+    return rng.integers(1, 100, size=(40, len(FEATURES))).astype(np.float64)
+
+
+def fitted(model, configurations, rng):
+    return model.fit(configurations, configurations @ rng.normal(size=len(FEATURES)) + rng.normal())
+
+
+@pytest.fixture
+def models(configurations, rng):
+    return {target: fitted(linear_model.LinearRegression(), configurations, rng) for target in MODEL_TARGETS}
+
+
+def test_matrix_product_matches_every_model(models, configurations):
+    engine = PredictionEngine(models)
+
+    predictions = engine.predict(configurations)
+
+    assert predictions.shape == (len(configurations), len(TARGETS))
+    assert not engine.fallback
+    for column, target in enumerate(MODEL_TARGETS):
+        np.testing.assert_allclose(predictions[:, column], models[target].predict(configurations), rtol=1e-9)
+
+    # Missing disk models use the formulas over the number of time series
+    metric_count = configurations[:, FEATURES.index('application_metric_count')]
+    for column, (slope, intercept) in enumerate(DISK_FORMULAS.values(), len(MODEL_TARGETS)):
+        np.testing.assert_allclose(predictions[:, column], slope * metric_count + intercept)
+
+
+def test_models_without_linear_coefficients_are_called(models, configurations, rng):
+    target = MODEL_TARGETS[2]
+    models[target] = fitted(pipeline.make_pipeline(preprocessing.StandardScaler(), linear_model.Ridge()), configurations, rng)
+    engine = PredictionEngine(models)
+
+    predictions = engine.predict(configurations)
+
+    assert list(engine.fallback) == [2]
+    np.testing.assert_allclose(predictions[:, 2], models[target].predict(configurations))
+
+
+def test_configurations_as_dictionaries(models, configurations):
+    engine = PredictionEngine(models)
+    dictionaries = [dict(zip(FEATURES, row)) for row in configurations[:3]]
+
+    np.testing.assert_array_equal(engine.predict_configurations(dictionaries), engine.predict(configurations[:3]))
+    assert engine.predict([]).shape == (0, len(TARGETS))
+
+
+@pytest.mark.parametrize('malformed', [
+    np.ones(len(FEATURES)),
+    np.ones((2, len(FEATURES) - 1)),
+    [[np.nan] * len(FEATURES)],
+    [[np.inf] + [1] * (len(FEATURES) - 1)]
+])
+def test_malformed_configurations_are_rejected(models, malformed):
+    with pytest.raises(ValueError):
+        PredictionEngine(models).predict(malformed)
+
+
+def test_missing_model_is_an_error(models):
+    del models[MODEL_TARGETS[0]]
+
+    with pytest.raises(KeyError):
+        PredictionEngine(models)
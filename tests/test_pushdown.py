@@ -0,0 +1,80 @@
+# SQL pushdown against the pandas aggregation of the same filter state, run on SQLite
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from columns import METRIC_COLUMNS, PARAMETER_COLUMNS
+from pushdown import PushdownAggregator, filter_conditions, normalize_filter_state, pushdown_query
+
+SELECTIONS = [
+    {},
+    {'cortex_number_of_ingester_value': [2, 3]},
+    {'application_case_value': ['random'], 'cortex_number_of_distributor_value': [1, 3], 'application_labels_value': [20.0]}
+]
+
+
+@pytest.fixture
+def connection(measurements):
+    connect = sqlite3.connect(':memory:')
+    timestamps = measurements['timestamp'].astype(str)
+
+    metrics = measurements[['group_name'] + METRIC_COLUMNS].assign(timestamp=timestamps)
+    metrics.to_sql('metrics', connect, index=False)
+
+    parameters = measurements[PARAMETER_COLUMNS].assign(timestamp=timestamps, prometheus_remote_write_max_samples_per_send_value=None)
+    parameters.to_sql('parameters', connect, index=False)
+
+    yield connect
+    connect.close()
+
+
+# SQLite has no psycopg2 parameters, the IN lists are written into the statement
+def sqlite_queries(connect):
+    def queries(query, params=None):
+        for name, values in (params or {}).items():
+            query = query.replace('%({})s'.format(name), '({})'.format(', '.join(repr(value) for value in values)))
+        return pd.read_sql_query(query, connect)
+    return queries
+
+
+def filtered(frame, selections):
+    for column, values in selections.items():
+        frame = frame[frame[column].isin(values)]
+    return frame
+
+
+@pytest.mark.parametrize('selections', SELECTIONS)
+def test_pushdown_matches_pandas(connection, measurements, selections):
+    x_axis = 'cortex_number_of_nginx_value'
+    query, params = pushdown_query(x_axis, selections)
+    result = sqlite_queries(connection)(query, params).set_index(['group_name', x_axis]).sort_index()
+
+    expected = filtered(measurements, selections).groupby(['group_name', x_axis])[METRIC_COLUMNS].mean().sort_index()
+
+    assert list(result.index) == list(expected.index)
+    np.testing.assert_allclose(result[METRIC_COLUMNS].to_numpy(dtype=np.float64), expected.to_numpy(), rtol=1e-9)
+
+
+def test_filter_state_is_order_independent():
+    assert normalize_filter_state('x', {'b': [2, 1, 1], 'a': ['y', 'x']}) == normalize_filter_state('x', {'a': ['x', 'y'], 'b': [1, 2]})
+
+
+def test_unknown_columns_are_rejected():
+    with pytest.raises(ValueError):
+        filter_conditions({'parameters.timestamp; DROP TABLE metrics': [1]})
+    with pytest.raises(ValueError):
+        pushdown_query('group_name', {})
+
+
+def test_results_are_cached_per_filter_state(connection):
+    queries = sqlite_queries(connection)
+    calls = []
+    aggregator = PushdownAggregator(lambda query, params=None: calls.append(query) or queries(query, params), 4, None)
+
+    first = aggregator.aggregate('cortex_number_of_nginx_value', {'cortex_number_of_ingester_value': [3, 2]})
+    second = aggregator.aggregate('cortex_number_of_nginx_value', {'cortex_number_of_ingester_value': [2, 3]})
+
+    assert second is first
+    assert len(calls) == 1
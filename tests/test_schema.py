@@ -0,0 +1,89 @@
+# Compact dtypes of the dataset: the schema, the float32 precision guard and the typed chunked read
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import settings
+from columns import FILTER_COLUMNS, KEY_COLUMNS, METRIC_COLUMNS, PARAMETER_COLUMNS
+from conftest import aggregate
+from db import sql_queries
+from schema import KEY_DTYPES, apply_schema, cast_frame, concat_frames
+from snapshot import COUNT_COLUMNS, SUM_COLUMNS, merge_aggregates
+
+
+def plain(frame):
+    return frame.astype({column: object for column in frame.columns if isinstance(frame[column].dtype, pd.CategoricalDtype)})
+
+
+def test_every_column_gets_a_compact_dtype(measurements):
+    frame, before, after = apply_schema(measurements)
+
+    for column in ['group_name'] + [column for column in PARAMETER_COLUMNS if column != 'cortex_blocks_storage_tsdb_wal_compression_value']:
+        assert isinstance(frame[column].dtype, pd.CategoricalDtype), column
+    assert frame['cortex_blocks_storage_tsdb_wal_compression_value'].dtype == 'boolean'
+    assert all(frame[column].dtype == np.float32 for column in METRIC_COLUMNS)
+    assert after < before
+
+    # Same values, the metrics within the precision
+    for column in FILTER_COLUMNS:
+        typed, original = frame[column].astype(object), measurements[column].astype(object)
+        assert ((typed == original) | (typed.isna() & original.isna())).all(), column
+    assert np.nanmax(np.abs(frame[METRIC_COLUMNS].to_numpy(dtype=np.float64) - measurements[METRIC_COLUMNS].to_numpy())) <= settings.float32_precision
+
+
+def test_metrics_float32_would_change_stay_float64(measurements):
+    frame = measurements.copy()
+    # About 60 units of float32 spacing at 1e9, the other metrics are below 1000
+    frame['du_disk_usage_value'] = 1e9 + frame['du_disk_usage_value']
+
+    typed = apply_schema(frame)[0]
+
+    assert typed['du_disk_usage_value'].dtype == np.float64
+    assert typed['nd_cg_cpu_visibletotal_value'].dtype == np.float32
+    np.testing.assert_array_equal(typed['du_disk_usage_value'].to_numpy(), frame['du_disk_usage_value'].to_numpy())
+
+
+def test_already_compact_frame_is_not_copied(measurements):
+    frame = apply_schema(measurements)[0]
+
+    again = apply_schema(frame)[0]
+
+    assert again is frame
+
+
+def test_typed_chunks_equal_the_typed_frame(measurements):
+    # Chunks with different category sets (the NaN of a column only in some of them)
+    chunks = [cast_frame(measurements.iloc[start:start + 700], KEY_DTYPES) for start in range(0, len(measurements), 700)]
+    combined = concat_frames(chunks)
+
+    for column in KEY_COLUMNS:
+        assert isinstance(combined[column].dtype, pd.CategoricalDtype) or combined[column].dtype == 'boolean', column
+    pd.testing.assert_frame_equal(plain(combined), plain(apply_schema(measurements)[0]).astype({column: np.float64 for column in METRIC_COLUMNS}), check_categorical=False)
+
+
+def test_typed_read_of_a_query_in_chunks(measurements, monkeypatch):
+    monkeypatch.setattr(settings, 'db_stream_chunk_size', 500)
+    connect = sqlite3.connect(':memory:')
+    measurements.assign(timestamp=measurements['timestamp'].astype(str)).to_sql('metrics', connect, index=False)
+
+    typed = sql_queries('SELECT * FROM metrics', con=connect, dtypes=KEY_DTYPES)
+    untyped = sql_queries('SELECT * FROM metrics', con=connect)
+
+    assert isinstance(typed['application_case_value'].dtype, pd.CategoricalDtype)
+    assert typed['cortex_blocks_storage_tsdb_wal_compression_value'].dtype == 'boolean'
+    pd.testing.assert_frame_equal(plain(typed), plain(apply_schema(untyped)[0]).astype({column: np.float64 for column in METRIC_COLUMNS}), check_categorical=False)
+
+
+def test_typed_aggregates_merge_like_plain_ones(measurements):
+    split = measurements['timestamp'].iloc[len(measurements) // 2]
+    halves = [aggregate(measurements[measurements['timestamp'] <= split]), aggregate(measurements[measurements['timestamp'] > split])]
+
+    typed = merge_aggregates([cast_frame(half, KEY_DTYPES) for half in halves])
+    untyped = merge_aggregates(halves)
+
+    assert len(typed) == len(untyped)
+    typed = plain(typed).astype({'cortex_blocks_storage_tsdb_wal_compression_value': np.int64}).sort_values(KEY_COLUMNS).reset_index(drop=True)
+    untyped = untyped.sort_values(KEY_COLUMNS).reset_index(drop=True)
+    np.testing.assert_allclose(typed[SUM_COLUMNS].to_numpy(dtype=np.float64), untyped[SUM_COLUMNS].to_numpy(dtype=np.float64))
+    np.testing.assert_array_equal(typed[COUNT_COLUMNS].to_numpy(), untyped[COUNT_COLUMNS].to_numpy())
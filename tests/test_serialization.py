@@ -0,0 +1,84 @@
+# Figure serialization: typed arrays, the shared template and the gzip of the responses
+import gzip
+import json
+
+import numpy as np
+import pytest
+
+import serialization
+import settings
+from serialization import _decoded, _typed_array, bar_template, compact, compress_response, figure_dict
+
+go = pytest.importorskip('plotly.graph_objects')
+flask = pytest.importorskip('flask')
+
+
+@pytest.mark.parametrize('array', [
+    np.array([1.5, -2.25, np.nan], dtype=np.float64),
+    np.array([1.5, 2.5], dtype=np.float32),
+    np.array([-3, 7], dtype=np.int16),
+    np.arange(6, dtype=np.uint8).reshape(2, 3)
+])
+def test_typed_arrays_decode_to_the_same_values(array):
+    typed = _typed_array(array)
+
+    np.testing.assert_array_equal(_decoded(typed), array)
+    assert _decoded(typed).dtype == array.dtype
+
+
+def test_64_bit_integers_are_narrowed():
+    assert _typed_array(np.array([1, 2], dtype=np.int64))['dtype'] == 'i4'
+
+    wide = np.array([2 ** 40, 1], dtype=np.int64)
+    assert _typed_array(wide)['dtype'] == 'f8'
+    np.testing.assert_array_equal(_decoded(_typed_array(wide)), wide)
+
+
+def test_compact_is_json_ready():
+    value = {'x': np.array([1.0, 2.0]), 'y': (np.int64(3), np.array(['a', 'b'])), 'z': np.array([])}
+
+    typed = compact(value)
+    plain = compact(value, typed_arrays=False)
+
+    assert typed['x']['dtype'] == 'f8'
+    assert plain == {'x': [1.0, 2.0], 'y': [3, ['a', 'b']], 'z': []}
+    # Typed arrays decode back to the lists
+    assert compact(typed, typed_arrays=False) == plain
+    json.dumps(typed)
+
+
+@pytest.mark.parametrize('typed_arrays', [True, False])
+def test_figure_with_the_shared_template(monkeypatch, typed_arrays):
+    monkeypatch.setattr(serialization, 'typed_arrays_supported', lambda: typed_arrays)
+    figure = go.Figure(go.Bar(x=['a', 'b'], y=np.array([1.5, 2.5])), layout={'template': bar_template()})
+
+    result = figure_dict(figure, template=bar_template())
+
+    assert result['layout']['template'] is figure_dict(figure, template=bar_template())['layout']['template']
+    assert compact(result, typed_arrays=False) == compact(figure_dict(figure), typed_arrays=False)
+    assert isinstance(result['data'][0]['y'], dict) == typed_arrays
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(settings, 'gzip_responses', True)
+    monkeypatch.setattr(settings, 'gzip_min_size', 100)
+
+    app = flask.Flask(__name__)
+    app.after_request(compress_response)
+    app.add_url_rule('/large', 'large', lambda: flask.jsonify(values=list(range(200))))
+    app.add_url_rule('/small', 'small', lambda: flask.jsonify(values=[1]))
+    return app.test_client()
+
+
+def test_large_responses_are_gzipped(app):
+    response = app.get('/large', headers={'Accept-Encoding': 'gzip, deflate'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.data)) == {'values': list(range(200))}
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_small_or_unaccepted_responses_are_not_gzipped(app):
+    assert 'Content-Encoding' not in app.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in app.get('/large').headers
@@ -0,0 +1,64 @@
+# Shared dataset: the publisher and the workers load through the same loader, the workers get the exact cube
+import numpy as np
+import pytest
+
+import shared_dataset
+from columns import METRIC_COLUMNS
+from conftest import sketch_rows
+from dataset import DatasetRefresher
+from loader import DatasetLoader
+from shared_dataset import SharedDatasetReader, publish
+from sketch import QuantileSketches
+from snapshot import AggregateLoader, write_snapshot
+
+pytest.importorskip('pyarrow')
+
+ACCURACY = 0.01
+
+
+@pytest.fixture
+def publisher_loader(database, monkeypatch):
+    loader = DatasetLoader(AggregateLoader(None, None, fetch=database.fetch).refresh)
+    monkeypatch.setattr(shared_dataset, 'create_sketches', lambda: None)
+    monkeypatch.setattr(shared_dataset, 'create_loader', lambda sketches: loader)
+    return loader
+
+
+def test_worker_cube_is_exact(publisher_loader, measurements, tmp_path):
+    shared_dataset.run_publisher(str(tmp_path), 0)
+
+    refresher = DatasetRefresher(DatasetLoader(SharedDatasetReader(str(tmp_path)).load).load, 0)
+    assert refresher.refresh()
+    assert not refresher.refresh()
+
+    x_axis = 'cortex_number_of_ingester_value'
+    selections = {'application_case_value': ['random'], 'cortex_number_of_distributor_value': [1, 3]}
+    rolled = refresher.current.cube.rollup(selections, x_axis).set_index(['group_name', x_axis]).sort_index()
+
+    rows = measurements[measurements['application_case_value'].eq('random') & measurements['cortex_number_of_distributor_value'].isin([1, 3])]
+    expected = rows.groupby(['group_name', x_axis])[METRIC_COLUMNS].mean().sort_index()
+    assert list(rolled.index) == list(expected.index)
+    np.testing.assert_allclose(rolled[METRIC_COLUMNS].to_numpy(dtype=np.float64), expected.to_numpy(), rtol=1e-12)
+
+
+def test_unchanged_load_is_not_published(publisher_loader, tmp_path):
+    publisher_loader.load()
+
+    shared_dataset.run_publisher(str(tmp_path), 0)
+
+    assert shared_dataset.current_generation(str(tmp_path)) is None
+
+
+def test_workers_reload_the_published_sketches(database, measurements, tmp_path):
+    path = str(tmp_path / 'sketches.parquet')
+    worker = QuantileSketches(lambda *args, **kwargs: pytest.fail('A worker queried the database'), path, ACCURACY)
+    refresher = DatasetRefresher(DatasetLoader(SharedDatasetReader(str(tmp_path)).load, worker.reload).load, 0)
+
+    # Sketches first, then the generation with the same rows
+    write_snapshot(path, sketch_rows(measurements, ACCURACY), measurements['timestamp'].max(), extra={'accuracy': ACCURACY})
+    publish(database.fetch(), str(tmp_path))
+    assert refresher.refresh()
+    assert worker.current.version == 1
+
+    assert not worker.reload()
+    assert worker.current.version == 1
@@ -0,0 +1,113 @@
+# Quantile sketches against the exact percentiles of the measurements
+import numpy as np
+import pandas as pd
+import pytest
+
+from columns import KEY_COLUMNS, METRIC_COLUMNS
+from conftest import sketch_rows
+from sketch import QUANTILES, QuantileSketches, SketchSet, merge_sketches
+
+ACCURACY = 0.01
+
+SELECTIONS = [
+    {},
+    {'cortex_number_of_ingester_value': [2, 3]},
+    {'application_case_value': ['random'], 'cortex_number_of_distributor_value': [1, 3]},
+    {'cortex_blocks_storage_tsdb_wal_compression_value': [1]}
+]
+
+
+def sketches(frame):
+    return sketch_rows(frame, ACCURACY)
+
+
+def filtered(frame, selections):
+    for column, values in selections.items():
+        frame = frame[frame[column].isin(values)]
+    return frame
+
+
+@pytest.fixture
+def with_zeros(measurements, rng):
+    # Idle values fall into the zero bucket
+    frame = measurements.copy()
+    frame.loc[rng.random(len(frame)) < 0.05, 'nd_cg_cpu_visibletotal_value'] = 0.0
+    return frame
+
+
+@pytest.mark.parametrize('statistic', list(QUANTILES) + ['max'])
+@pytest.mark.parametrize('selections', SELECTIONS)
+def test_rollup_within_accuracy_of_exact_percentiles(with_zeros, selections, statistic):
+    x_axis = 'cortex_number_of_ingester_value'
+    rolled = SketchSet(sketches(with_zeros), ACCURACY, None, 1).rollup(selections, x_axis, statistic)
+    rolled = rolled.set_index(['group_name', x_axis]).sort_index()
+
+    grouped = filtered(with_zeros, selections).groupby(['group_name', x_axis])[METRIC_COLUMNS]
+    if statistic == 'max':
+        expected = grouped.max().sort_index()
+    else:
+        # The sketches answer the value of rank q * (n - 1), rounded down
+        expected = grouped.quantile(QUANTILES[statistic], interpolation='lower').sort_index()
+
+    assert list(rolled.index) == list(expected.index)
+    for metric in METRIC_COLUMNS:
+        values, exact = rolled[metric].to_numpy(dtype=np.float64), expected[metric].to_numpy()
+        if statistic == 'max':
+            np.testing.assert_array_equal(values, exact)
+        else:
+            assert np.all(np.abs(values - exact) <= ACCURACY * exact + 1e-12), metric
+
+
+def test_merged_sketches_equal_sketches_of_all_rows(measurements):
+    split = measurements['timestamp'].iloc[len(measurements) // 3]
+    merged = merge_sketches([sketches(measurements[measurements['timestamp'] <= split]),
+                             sketches(measurements[measurements['timestamp'] > split])])
+    full = sketches(measurements)
+
+    columns = KEY_COLUMNS + ['metric', 'bucket']
+    merged = merged.sort_values(columns).reset_index(drop=True)
+    full = full.sort_values(columns).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(merged[columns], full[columns])
+    np.testing.assert_array_equal(merged['count'].to_numpy(), full['count'].to_numpy())
+    np.testing.assert_array_equal(merged['max'].to_numpy(), full['max'].to_numpy())
+    np.testing.assert_array_equal(merged['max_timestamp'].to_numpy(), full['max_timestamp'].to_numpy())
+
+    for statistic in QUANTILES:
+        pd.testing.assert_frame_equal(SketchSet(merged, ACCURACY, None, 2).rollup(SELECTIONS[2], 'application_case_value', statistic),
+                                      SketchSet(full, ACCURACY, None, 1).rollup(SELECTIONS[2], 'application_case_value', statistic))
+
+
+def test_merging_nothing(measurements):
+    frame = sketches(measurements)
+
+    assert merge_sketches([None, frame.iloc[:0]]) is None
+    assert merge_sketches([frame, None]) is frame
+
+
+def test_refresh_fetches_only_newer_rows(measurements, tmp_path):
+    pytest.importorskip('pyarrow')
+    database = {'rows': measurements.iloc[:2000]}
+    calls = []
+
+    def sql_queries(query, params=None):
+        calls.append(params)
+        rows = database['rows']
+        return sketches(rows if params is None else rows[rows['timestamp'] > params['since']])
+
+    path = str(tmp_path / 'sketches.parquet')
+    loader = QuantileSketches(sql_queries, path, ACCURACY)
+    assert loader.refresh()
+    assert not loader.refresh()
+
+    database['rows'] = measurements
+    assert loader.refresh()
+    assert [params if params is None else params['since'] for params in calls] == [None, measurements['timestamp'].iloc[1999], measurements['timestamp'].iloc[1999]]
+    assert loader.current.version == 2
+    pd.testing.assert_frame_equal(loader.current.rollup({}, 'application_case_value', 'p95'),
+                                  SketchSet(sketches(measurements), ACCURACY, None, 1).rollup({}, 'application_case_value', 'p95'))
+
+    # A restart takes the persisted sketches and their mark
+    restarted = QuantileSketches(sql_queries, path, ACCURACY)
+    assert restarted.refresh()
+    assert calls[-1]['since'] == measurements['timestamp'].iloc[-1]
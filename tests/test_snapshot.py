@@ -0,0 +1,72 @@
+# Snapshot of the aggregates: merging and incremental loading against the AVG of all the rows
+import numpy as np
+import pandas as pd
+import pytest
+
+from columns import KEY_COLUMNS, METRIC_COLUMNS
+from conftest import aggregate
+from snapshot import COUNT_COLUMNS, SUM_COLUMNS, aggregate_means, load_aggregates, merge_aggregates, read_snapshot, write_snapshot
+
+pytest.importorskip('pyarrow')
+
+
+def by_key(frame):
+    return frame.sort_values(KEY_COLUMNS).reset_index(drop=True)
+
+
+def later_rows(measurements, rng, rows=200):
+    later = measurements.sample(rows, random_state=1).reset_index(drop=True)
+    later['timestamp'] = measurements['timestamp'].max() + pd.to_timedelta(np.arange(1, rows + 1), unit='s')
+    later[METRIC_COLUMNS] = rng.lognormal(3, 1, (rows, len(METRIC_COLUMNS)))
+    return later
+
+
+def test_merged_aggregates_equal_aggregates_of_all_rows(measurements):
+    split = measurements['timestamp'].iloc[len(measurements) // 2]
+    merged = merge_aggregates([aggregate(measurements[measurements['timestamp'] <= split]), None,
+                               aggregate(measurements[measurements['timestamp'] > split])])
+    full = aggregate(measurements)
+
+    merged, full = by_key(merged), by_key(full)
+    pd.testing.assert_frame_equal(merged[KEY_COLUMNS], full[KEY_COLUMNS])
+    np.testing.assert_allclose(merged[SUM_COLUMNS].to_numpy(dtype=np.float64), full[SUM_COLUMNS].to_numpy(dtype=np.float64), rtol=1e-12)
+    np.testing.assert_array_equal(merged[COUNT_COLUMNS].to_numpy(), full[COUNT_COLUMNS].to_numpy())
+    np.testing.assert_array_equal(merged['max_timestamp'].to_numpy(), full['max_timestamp'].to_numpy())
+
+
+def test_means_equal_avg_of_all_rows(measurements):
+    means = by_key(aggregate_means(aggregate(measurements)))
+    expected = by_key(measurements.groupby(KEY_COLUMNS, dropna=False)[METRIC_COLUMNS].mean().reset_index())
+
+    np.testing.assert_allclose(means[METRIC_COLUMNS].to_numpy(dtype=np.float64), expected[METRIC_COLUMNS].to_numpy(), rtol=1e-12)
+
+
+def test_incremental_load_fetches_only_rows_above_the_mark(measurements, database, rng, tmp_path):
+    path = str(tmp_path / 'aggregated.parquet')
+
+    first = load_aggregates(None, path, fetch=database.fetch)
+    assert database.calls == [None]
+
+    database.append(later_rows(measurements, rng))
+    second = load_aggregates(None, path, fetch=database.fetch)
+
+    assert database.calls[1] == measurements['timestamp'].max()
+    assert len(second) >= len(first)
+
+    full = by_key(aggregate(database.measurements))
+    second = by_key(second)
+    np.testing.assert_allclose(second[SUM_COLUMNS].to_numpy(dtype=np.float64), full[SUM_COLUMNS].to_numpy(dtype=np.float64), rtol=1e-12)
+    np.testing.assert_array_equal(second[COUNT_COLUMNS].to_numpy(), full[COUNT_COLUMNS].to_numpy())
+
+    # The snapshot on disk holds the merged aggregates and the new mark
+    stored, mark = read_snapshot(path)
+    assert mark == database.measurements['timestamp'].max()
+    assert len(stored) == len(second)
+
+
+def test_snapshot_of_another_layout_is_rebuilt(measurements, tmp_path):
+    path = str(tmp_path / 'aggregated.parquet')
+    write_snapshot(path, aggregate(measurements), measurements['timestamp'].max(), extra={'accuracy': 0.01})
+
+    assert read_snapshot(path, expected={'accuracy': 0.02}) == (None, None)
+    assert read_snapshot(path, expected={'accuracy': 0.01})[1] == measurements['timestamp'].max()
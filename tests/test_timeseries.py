@@ -0,0 +1,112 @@
+# Time series drill-down: LTTB downsampling, bucket widths and the cache of the loader
+import numpy as np
+import pandas as pd
+import pytest
+
+from columns import GROUP_NAMES
+from timeseries import TimeSeriesLoader, bucket_query, bucket_width, lttb
+
+METRIC = 'nd_cg_cpu_visibletotal_value'
+
+
+# Straightforward LTTB over the same buckets, one point at a time
+def reference_lttb(x, y, threshold):
+    edges = np.linspace(1, len(x) - 1, threshold - 1).astype(np.int64)
+    selected = [0]
+    for bucket in range(threshold - 2):
+        if bucket + 2 < len(edges):
+            following = range(edges[bucket + 1], edges[bucket + 2])
+            next_x, next_y = np.mean([x[i] for i in following]), np.mean([y[i] for i in following])
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        a = selected[-1]
+        areas = [abs((x[a] - next_x) * (y[i] - y[a]) - (x[a] - x[i]) * (next_y - y[a])) for i in range(edges[bucket], edges[bucket + 1])]
+        selected.append(edges[bucket] + int(np.argmax(areas)))
+
+    return selected + [len(x) - 1]
+
+
+@pytest.mark.parametrize('size, threshold', [(1000, 100), (1000, 3), (101, 50), (57, 56)])
+def test_lttb_matches_the_reference(rng, size, threshold):
+    x = np.cumsum(rng.uniform(1, 2, size))
+    y = rng.normal(size=size).cumsum()
+
+    kept = lttb(x, y, threshold)
+
+    assert len(kept) == threshold
+    assert kept[0] == 0 and kept[-1] == size - 1
+    assert np.all(np.diff(kept) > 0)
+    assert kept.tolist() == reference_lttb(x, y, threshold)
+
+
+def test_lttb_keeps_peaks_and_dips():
+    x = np.arange(10000, dtype=np.float64)
+    y = np.zeros(10000)
+    y[1234], y[8765] = 100.0, -100.0
+
+    kept = lttb(x, y, 50)
+
+    assert 1234 in kept and 8765 in kept
+
+
+def test_short_series_are_not_downsampled():
+    assert lttb(np.arange(5.0), np.arange(5.0), 10).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(np.arange(5.0), np.arange(5.0), 2).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_bucket_width():
+    assert bucket_width(0, 1000, 100) == 10
+    assert bucket_width(0, 1001, 100) == 11
+    assert bucket_width(0, 10, 100) == 1
+
+
+def test_unknown_metric_or_application_is_rejected():
+    with pytest.raises(ValueError):
+        bucket_query(GROUP_NAMES[0], 'timestamp; DROP TABLE metrics', {}, 0, 1, 1)
+    with pytest.raises(ValueError):
+        bucket_query('unknown', METRIC, {}, 0, 1, 1)
+
+
+class FakeDatabase:
+
+    def __init__(self, first, last):
+        self.first, self.last = first, last
+        self.queries = []
+
+    def read_columns(self, query, params, dtypes=None):
+        self.queries.append(params)
+        if 'first' in query:
+            return pd.DataFrame({'first': [self.first], 'last': [self.last]})
+
+        buckets = np.arange(params['start'], params['end'] + 1, params['bucket'], dtype=np.float64)
+        return pd.DataFrame({'bucket': buckets, 'value': np.sin(buckets)})
+
+
+def test_series_are_downsampled_and_cached():
+    database = FakeDatabase(0.0, 100000.0)
+    loader = TimeSeriesLoader(database.read_columns, 1000, 200, 16)
+
+    x, y = loader.series(GROUP_NAMES[0], METRIC, {})
+    again = loader.series(GROUP_NAMES[0], METRIC, {})
+
+    assert len(x) == 200 and (x[0], x[-1]) == (0.0, 100000.0)
+    assert database.queries[1]['bucket'] == 100
+    assert again is loader.series(GROUP_NAMES[0], METRIC, {})
+    assert len(database.queries) == 2
+
+    # Windows with the same whole-second bounds share the entry
+    loader.series(GROUP_NAMES[0], METRIC, {}, 10.2, 500.7)
+    loader.series(GROUP_NAMES[0], METRIC, {}, 10.9, 500.1)
+    assert len(database.queries) == 3
+
+
+def test_filters_without_rows_are_cached():
+    database = FakeDatabase(np.nan, np.nan)
+    loader = TimeSeriesLoader(database.read_columns, 1000, 200, 16)
+
+    for _ in range(2):
+        x, y = loader.series(GROUP_NAMES[0], METRIC, {'cortex_number_of_ingester_value': [99]})
+        assert len(x) == 0
+
+    assert len(database.queries) == 1
@@ -0,0 +1,119 @@
+# Incremental XᵀX training against a least squares fit of all the rows
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from columns import GROUP_NAMES, METRIC_COLUMNS, PARAMETER_COLUMNS
+from training import FEATURE_COLUMNS, METRIC_COLUMNS as MODEL_METRIC_COLUMNS, TARGET_FEATURES, ModelTrainer
+
+CPU = ('nd_cg_cpu_visibletotal_value', 'cortex_ingester')
+MEMORY = ('nd_cg_mem_usage_visibletotal_value', 'prometheus_server')
+DISK = ('du_disk_usage_value', 'minio')
+
+
+class Registry:
+
+    def __init__(self):
+        self.models = {}
+
+    def publish(self, metric, component, model, version):
+        self.models[(metric, component)] = model
+
+
+# Aggregated dataset of distinct configurations: one row per (configuration, group_name), the
+# metrics a noisy linear function of the parameters
+def aggregated(rng, configurations):
+    parameters = pd.DataFrame({column: rng.integers(1, 1000, configurations).astype(np.float64) for column in PARAMETER_COLUMNS})
+    parameters['application_case_value'] = 'random'
+    parameters['application_instances_value'] = np.arange(configurations)
+
+    frames = []
+    for group_name in GROUP_NAMES:
+        frame = parameters.copy()
+        frame['group_name'] = group_name
+        for column in METRIC_COLUMNS:
+            weights = rng.normal(size=len(FEATURE_COLUMNS))
+            features = np.column_stack([frame[FEATURE_COLUMNS[feature]] if FEATURE_COLUMNS[feature] else np.zeros(configurations) for feature in FEATURE_COLUMNS])
+            frame[column] = features @ weights + 50 + rng.normal(size=configurations)
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def dataset(data, version):
+    return types.SimpleNamespace(data=data, version=version)
+
+
+# (coefficients in FEATURES order, intercept) of a least squares fit of the target over the rows
+def lstsq(data, target):
+    metric, component = target
+    rows = data[data['group_name'] == component.replace('_', ' ')]
+    used = TARGET_FEATURES.get(target, list(FEATURE_COLUMNS))
+    features = [feature for feature in FEATURE_COLUMNS if feature in used and FEATURE_COLUMNS[feature] is not None]
+
+    A = np.column_stack([np.ones(len(rows))] + [rows[FEATURE_COLUMNS[feature]].to_numpy() for feature in features])
+    weights = np.linalg.lstsq(A, rows[MODEL_METRIC_COLUMNS.get(metric, metric)].to_numpy(), rcond=None)[0]
+
+    coefficients = np.zeros(len(FEATURE_COLUMNS))
+    for position, feature in enumerate(features):
+        coefficients[list(FEATURE_COLUMNS).index(feature)] = weights[1 + position]
+    return coefficients, weights[0]
+
+
+def assert_fit(model, data, target):
+    coefficients, intercept = lstsq(data, target)
+
+    np.testing.assert_allclose(model.coef_, coefficients, rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(model.intercept_, intercept, rtol=1e-6)
+
+
+@pytest.mark.parametrize('target', [CPU, MEMORY, DISK])
+def test_first_fit_matches_lstsq(rng, target):
+    data = aggregated(rng, 60)
+    registry = Registry()
+    ModelTrainer(registry).update(dataset(data, 1))
+
+    assert_fit(registry.models[target], data, target)
+
+
+@pytest.mark.parametrize('target', [CPU, MEMORY, DISK])
+def test_incremental_update_matches_lstsq(rng, target):
+    data = aggregated(rng, 60)
+    registry = Registry()
+    trainer = ModelTrainer(registry)
+    trainer.update(dataset(data, 1))
+    statistics = trainer._statistics[target]
+
+    # New configurations, a removed one and new measurements of a few others
+    added = aggregated(rng, 70)
+    added = added[added['application_instances_value'] >= 60]
+    updated = pd.concat([data[data['application_instances_value'] != 3], added], ignore_index=True)
+    changed = updated['application_instances_value'].isin([5, 7])
+    for column in METRIC_COLUMNS:
+        updated.loc[changed, column] += 10.0
+    trainer.update(dataset(updated, 2))
+
+    assert trainer._statistics[target] is statistics
+    assert trainer.last_update['{}_{}'.format(*target)] == {'rows': 69, 'added': 10, 'changed': 2, 'removed': 1}
+    assert_fit(registry.models[target], updated, target)
+
+
+def test_older_dataset_is_ignored(rng):
+    data = aggregated(rng, 30)
+    registry = Registry()
+    trainer = ModelTrainer(registry)
+    trainer.update(dataset(data, 2))
+    model = registry.models[CPU]
+
+    trainer.update(dataset(aggregated(rng, 30), 1))
+
+    assert registry.models[CPU] is model
+
+
+def test_disk_models_need_two_configurations(rng):
+    registry = Registry()
+    ModelTrainer(registry).update(dataset(aggregated(rng, 2), 1))
+
+    assert set(registry.models) == {target for target in TARGET_FEATURES}
@@ -0,0 +1,148 @@
+# Time series drill-down of one metric of one application within the filters
+#
+# The raw metrics rows are averaged into time buckets by the database: the bucket width follows
+# the requested window, so every window comes back as at most ~`buckets` rows, whatever its
+# length. The buckets are streamed into typed arrays and downsampled to a fixed point budget with
+# LTTB (Largest-Triangle-Three-Buckets), which keeps the peaks and dips of the series.
+import math
+
+import numpy as np
+
+from columns import METRIC_COLUMNS, GROUP_NAMES
+from lru_cache import LRUCache
+from pushdown import filter_conditions, normalize_filter_state
+
+JOIN = 'FROM metrics INNER JOIN parameters ON metrics.timestamp=parameters.timestamp'
+
+# Cached extent of filters without any rows, the cache returns None for a missing entry
+NO_DATA = object()
+
+
+def _conditions(group_name, metric, selections):
+    if metric not in METRIC_COLUMNS:
+        raise ValueError('Unknown metric column: {}'.format(metric))
+    if group_name not in GROUP_NAMES:
+        raise ValueError('Unknown application: {}'.format(group_name))
+
+    conditions, params = filter_conditions(selections)
+    conditions.append('metrics.group_name = %(group_name)s')
+    params['group_name'] = group_name
+
+    return conditions, params
+
+
+# First and last timestamp (epoch seconds) of the rows
+def extent_query(group_name, metric, selections):
+    conditions, params = _conditions(group_name, metric, selections)
+
+    query = '''SELECT extract(epoch FROM MIN(metrics.timestamp)) AS first, extract(epoch FROM MAX(metrics.timestamp)) AS last
+{join}
+WHERE {conditions} AND metrics.{metric} IS NOT NULL
+'''.format(join=JOIN, conditions=' AND '.join(conditions), metric=metric)
+
+    return query, params
+
+
+# Averages of the metric in buckets of bucket_seconds within [start, end] (epoch seconds)
+def bucket_query(group_name, metric, selections, start, end, bucket_seconds):
+    conditions, params = _conditions(group_name, metric, selections)
+    conditions.append('metrics.timestamp BETWEEN to_timestamp(%(start)s) AND to_timestamp(%(end)s)')
+    params.update(start=start, end=end, bucket=bucket_seconds)
+
+    query = '''SELECT floor(extract(epoch FROM metrics.timestamp) / %(bucket)s) * %(bucket)s AS bucket, AVG(metrics.{metric}) AS value
+{join}
+WHERE {conditions} AND metrics.{metric} IS NOT NULL
+GROUP BY 1
+ORDER BY 1
+'''.format(join=JOIN, conditions=' AND '.join(conditions), metric=metric)
+
+    return query, params
+
+
+# Bucket width giving at most `buckets` buckets in the window, whole seconds
+def bucket_width(start, end, buckets):
+    return max(int(math.ceil((end - start) / max(buckets, 1))), 1)
+
+
+# Positions of the `threshold` points of (x, y) kept by Largest-Triangle-Three-Buckets
+def lttb(x, y, threshold):
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    # First and last points are always kept, the others are split into threshold - 2 buckets
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+
+        # Average point of the next bucket (the last point for the last bucket)
+        if bucket + 2 < len(edges):
+            next_x, next_y = x[end:edges[bucket + 2]].mean(), y[end:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        # Point of the bucket forming the largest triangle with the previous point and the average
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return selected
+
+
+class TimeSeriesLoader:
+
+    # Without read_columns (no database) the loader is disabled
+    def __init__(self, read_columns, buckets, points, max_entries):
+        self.read_columns = read_columns
+        self.buckets = buckets
+        self.points = points
+
+        # Downsampled windows and extents, keyed by the filter state and the window
+        self.cache = LRUCache(max_entries)
+
+    @property
+    def enabled(self):
+        return self.read_columns is not None
+
+    def extent(self, group_name, metric, selections):
+        key = ('extent', group_name, metric, normalize_filter_state(None, selections))
+
+        result = self.cache.get(key)
+        if result is None:
+            query, params = extent_query(group_name, metric, selections)
+            row = self.read_columns(query, params, dtypes={'first': np.float64, 'last': np.float64})
+            result = NO_DATA if len(row) == 0 or np.isnan(row['first'].iloc[0]) else (float(row['first'].iloc[0]), float(row['last'].iloc[0]))
+            self.cache.put(key, result)
+
+        return None if result is NO_DATA else result
+
+    # (epoch seconds, values) of the window, the whole run without start and end
+    def series(self, group_name, metric, selections, start=None, end=None):
+        if start is None or end is None:
+            extent = self.extent(group_name, metric, selections)
+            if extent is None:
+                return np.empty(0), np.empty(0)
+            start, end = extent
+
+        # Whole-second bounds, so nearby windows of the same zoom share the cache entry
+        start, end = math.floor(start), math.ceil(end)
+        bucket_seconds = bucket_width(start, end, self.buckets)
+        key = ('series', group_name, metric, normalize_filter_state(None, selections), start, end, bucket_seconds)
+
+        result = self.cache.get(key)
+        if result is None:
+            query, params = bucket_query(group_name, metric, selections, start, end, bucket_seconds)
+            frame = self.read_columns(query, params, dtypes={'bucket': np.float64, 'value': np.float64})
+            x, y = frame['bucket'].to_numpy(dtype=np.float64), frame['value'].to_numpy(dtype=np.float64)
+
+            kept = lttb(x, y, self.points)
+            result = (x[kept], y[kept])
+            self.cache.put(key, result)
+
+        return result
@@ -0,0 +1,195 @@
+# Refitting the regression models from the loaded dataset
+#
+# Every (metric, component) model keeps the sufficient statistics of its least squares fit, XᵀX
+# and Xᵀy over the configurations of the component (X with a leading column of ones). A newly
+# published dataset is compared with the rows already included: added rows are added to the
+# statistics, removed ones subtracted and changed ones (their averages moved with new measurements)
+# replaced, in O(features²) per row. The coefficients are solved from the statistics alone. With
+# a degree above 1 the features are expanded by PolynomialFeatures. The refitted models are
+# published to the model registry, the prediction engine picks them up with the next request.
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from columns import PARAMETER_COLUMNS
+from prediction import FEATURES, TARGETS, DISK_FORMULAS
+
+logger = logging.getLogger(__name__)
+
+# Dataset column of every model feature, the Prometheus WAL compression is not in the parameters table
+FEATURE_COLUMNS = {
+    'prometheus_wal_compression': None,
+    'application_metric_count': 'application_metric_count_value',
+    'application_labels': 'application_labels_value',
+    'number_of_nginx': 'cortex_number_of_nginx_value',
+    'number_of_distributor': 'cortex_number_of_distributor_value',
+    'number_of_ingester': 'cortex_number_of_ingester_value',
+    'tsdb_block_ranges_period': 'cortex_blocks_storage_tsdb_block_ranges_period_value',
+    'tsdb_retention_period': 'cortex_blocks_storage_tsdb_retention_period_value',
+    'tsdb_wal_compression': 'cortex_blocks_storage_tsdb_wal_compression_value'
+}
+
+# Dataset column of the metrics named differently by the models
+METRIC_COLUMNS = {
+    'nd_cg_mem_usage_visibletotal_value': 'nd_cg_mem_visibletotal_value'
+}
+
+# The disk models depend on the number of time series only, like the formulas they replace
+TARGET_FEATURES = {target: ['application_metric_count'] for target in DISK_FORMULAS}
+
+# Beyond this share of changed rows the statistics are rebuilt instead of updated
+REBUILD_SHARE = 0.5
+
+
+# Features with polynomial terms (without the bias column, the statistics have their own)
+def expand(X, degree):
+    if degree == 1:
+        return X
+
+    from sklearn.preprocessing import PolynomialFeatures
+
+    return PolynomialFeatures(degree, include_bias=False).fit_transform(X)
+
+
+# Refitted model, coef_ and intercept_ are stacked by the prediction engine when the degree is 1
+class LinearModel:
+
+    def __init__(self, coef, intercept, degree=1):
+        self.coef_ = coef
+        self.intercept_ = intercept
+        self.degree = degree
+
+    def predict(self, X):
+        return expand(np.asarray(X, dtype=np.float64).reshape(-1, len(FEATURES)), self.degree) @ self.coef_ + self.intercept_
+
+
+class SufficientStatistics:
+
+    def __init__(self, size):
+        # Intercept column first
+        self.xtx = np.zeros((size + 1, size + 1))
+        self.xty = np.zeros(size + 1)
+        self.rows = 0
+
+    # Adding (sign 1) or removing (sign -1) the rows of X and y
+    def update(self, X, y, sign=1):
+        if len(y) == 0:
+            return
+
+        A = np.column_stack([np.ones(len(y)), X])
+        self.xtx += sign * (A.T @ A)
+        self.xty += sign * (A.T @ y)
+        self.rows += sign * len(y)
+
+    # (coefficients, intercept) of the least squares fit, minimum norm for features without variance
+    def solve(self):
+        # Columns scaled to unit norm, the number of time series is millions while the flags are 0 or 1
+        scale = np.sqrt(np.diag(self.xtx))
+        scale[scale == 0] = 1.0
+
+        weights = np.linalg.lstsq(self.xtx / np.outer(scale, scale), self.xty / scale, rcond=None)[0] / scale
+
+        return weights[1:], weights[0]
+
+
+class ModelTrainer:
+
+    def __init__(self, registry, degree=1):
+        self.registry = registry
+        self.degree = degree
+        self.version = None
+
+        # Rows (features and target by configuration hash) and statistics of every target
+        self._rows = {}
+        self._statistics = {}
+        self._lock = threading.Lock()
+
+        # Rows added, changed and removed by the last update of every target
+        self.last_update = {}
+
+    # Features (in FEATURES order) and target of the configurations of a component, by configuration hash
+    def training_rows(self, data, target):
+        metric, component = target
+        rows = data[data['group_name'] == component.replace('_', ' ')]
+        used = TARGET_FEATURES.get(target, FEATURES)
+
+        columns = {}
+        for feature in FEATURES:
+            column = FEATURE_COLUMNS[feature]
+            if column is None or feature not in used:
+                columns[feature] = np.zeros(len(rows))
+            else:
+                columns[feature] = rows[column].astype(np.float64).to_numpy()
+        columns['y'] = rows[METRIC_COLUMNS.get(metric, metric)].astype(np.float64).to_numpy()
+
+        frame = pd.DataFrame(columns, index=pd.util.hash_pandas_object(rows[PARAMETER_COLUMNS], index=False).to_numpy())
+        frame = frame.dropna()
+
+        return frame[~frame.index.duplicated(keep='last')]
+
+    # Coefficients of a fit of the target: the intercept and the terms of the features it uses
+    def coefficient_count(self, target):
+        used = [feature for feature in TARGET_FEATURES.get(target, FEATURES) if FEATURE_COLUMNS[feature] is not None]
+        if not used:
+            return 1
+
+        return len(expand(np.zeros((1, len(used))), self.degree)[0]) + 1
+
+    def _update_target(self, data, target):
+        current = self.training_rows(data, target)
+        previous = self._rows.get(target)
+        statistics = self._statistics.get(target)
+
+        if previous is None:
+            added, changed, removed = current.index, current.index[:0], current.index[:0]
+        else:
+            common = current.index.intersection(previous.index)
+            added = current.index.difference(previous.index)
+            removed = previous.index.difference(current.index)
+            changed = common[(current.loc[common].to_numpy() != previous.loc[common].to_numpy()).any(axis=1)]
+
+        if statistics is None or len(changed) + len(removed) > REBUILD_SHARE * max(len(current), 1):
+            # Also keeps the rounding errors of the removals from adding up
+            statistics = SufficientStatistics(len(expand(np.zeros((1, len(FEATURES))), self.degree)[0]))
+            statistics.update(expand(current[FEATURES].to_numpy(), self.degree), current['y'].to_numpy())
+        else:
+            outdated = previous.loc[changed.append(removed)]
+            statistics.update(expand(outdated[FEATURES].to_numpy(), self.degree), outdated['y'].to_numpy(), sign=-1)
+            updated = current.loc[added.append(changed)]
+            statistics.update(expand(updated[FEATURES].to_numpy(), self.degree), updated['y'].to_numpy())
+
+        self._rows[target] = current
+        self._statistics[target] = statistics
+        self.last_update['{}_{}'.format(*target)] = {'rows': statistics.rows, 'added': len(added), 'changed': len(changed), 'removed': len(removed)}
+
+        return len(added) + len(changed) + len(removed) != 0
+
+    # Refitting from a newly published dataset, a listener of the refresher
+    def update(self, dataset):
+        with self._lock:
+            # Datasets may arrive twice or out of order (e.g. the first one published before the listener was added)
+            if self.version is not None and dataset.version <= self.version:
+                return
+            self.version = dataset.version
+
+            started = time.perf_counter()
+            published = 0
+            for target in TARGETS:
+                if not self._update_target(dataset.data, target):
+                    continue
+
+                statistics = self._statistics[target]
+                # Fewer configurations than coefficients are not enough for a fit, the zero columns
+                # of the features a target does not use are not coefficients to fit
+                if statistics.rows < self.coefficient_count(target):
+                    logger.warning('Not retraining %s_%s: %d configurations', target[0], target[1], statistics.rows)
+                    continue
+
+                coef, intercept = statistics.solve()
+                self.registry.publish(target[0], target[1], LinearModel(coef, intercept, self.degree), 'trained-{}'.format(dataset.version))
+                published += 1
+
+        logger.info('Retrained %d models from dataset version %s in %.3f s', published, dataset.version, time.perf_counter() - started)